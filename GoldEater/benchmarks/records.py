@@ -0,0 +1,209 @@
+"""
+扫描记录内存占用基准
+
+合成一次扫描的 ScanJob / ScanResult 并全部留在内存中 (批处理结果、归档缓冲等场景),
+在各自的子进程里比较两种表示的峰值 RSS:
+- compact: shared/models.py 的 slots 记录 (intern、共享提示词与引用、raw_json_response 去重)
+- legacy:  改造前的 dataclass (每个实例一个 __dict__, 每个结果各存一份列表和完整推荐)
+
+回复文本经 extract_recommendations 解析, 与 eater 的构造路径一致;
+结束时抽样检查两种表示转换出的 raw 行相同。
+
+用法:
+    python -m benchmarks.records
+    python -m benchmarks.records --cells 2000 --results-per-job 8
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import subprocess
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from shared import PLATFORMS, PROMPT_TYPES, ScanJob, ScanResult, extract_recommendations, get_user_prompt
+from shared.storage import job_to_row, result_to_row
+
+TAGS = ['Casual', 'Trendy', 'Cozy', 'Romantic', 'Lively', 'Quiet', 'Upscale', 'Family-friendly']
+FLAGS = ['Busy on weekends', 'Pricey', 'Slow service', 'Limited seating']
+MODEL_VERSIONS = {platform: f'{platform}-bench' for platform in PLATFORMS}
+
+
+@dataclass
+class LegacyJob:
+    h3_index: str
+    grid_center_lat: float
+    grid_center_lng: float
+    district: str
+    prompt_type: str
+    system_prompt_version: str
+    platform: str
+    model_version: str
+    scan_run_id: str
+    tap_number: int
+    scanned_at: datetime = field(default_factory=datetime.utcnow)
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    user_prompt_template: Optional[str] = None
+    tokens_used: Optional[int] = None
+    tap_agreement: Optional[float] = None
+    stop_reason: Optional[str] = None
+    packed: bool = False
+    parse_strategy: Optional[str] = None
+
+
+@dataclass
+class LegacyResult:
+    job_id: str
+    raw_name: str
+    rank_position: int
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    normalized_name: Optional[str] = None
+    business_id: Optional[str] = None
+    business_lat: Optional[float] = None
+    business_lng: Optional[float] = None
+    business_address: Optional[str] = None
+    google_place_id: Optional[str] = None
+    cuisine_type: Optional[str] = None
+    price_level: Optional[int] = None
+    reasoning: Optional[str] = None
+    vibe_tags: List[str] = field(default_factory=list)
+    negative_flags: List[str] = field(default_factory=list)
+    sentiment_score: Optional[float] = None
+    citation_urls: List[str] = field(default_factory=list)
+    citation_count: Optional[int] = None
+    raw_json_response: Optional[dict] = None
+
+
+def synthetic_response(rng: random.Random, results_per_job: int, n_businesses: int) -> str:
+    return json.dumps({'recommendations': [
+        {
+            'name': f'Restaurant {rng.randrange(n_businesses)}',
+            'rank': rank,
+            'reasoning': f'Known for its {rng.choice(TAGS).lower()} atmosphere and seasonal menu; '
+                         f'locals rate it {rng.randint(70, 99)}/100 for value.',
+            'vibe_tags': rng.sample(TAGS, 2),
+            'negative_flags': rng.sample(FLAGS, rng.randint(0, 1))
+        }
+        for rank in range(1, results_per_job + 1)
+    ]})
+
+
+def build_run(variant: str, n_cells: int, taps: int, results_per_job: int, n_businesses: int, seed: int = 7):
+    """按 eater 的方式构造整次扫描的记录: 每个 (格子, 场景, 平台, tap) 一次回复"""
+    Job, Result = (ScanJob, ScanResult) if variant == 'compact' else (LegacyJob, LegacyResult)
+    rng = random.Random(seed)
+    records = []
+    for c in range(n_cells):
+        h3_index = f'8abe0e{c:09x}'[:15]
+        lat, lng = -33.885 + c * 1e-5, 151.215 + c * 1e-5
+        for prompt_type in PROMPT_TYPES:
+            for platform in PLATFORMS:
+                for tap in range(1, taps + 1):
+                    # 各 eater 各自渲染提示词, 内容相同但是不同的字符串对象
+                    user_prompt = get_user_prompt(prompt_type, lat, lng, 'sydney')
+                    recommendations, strategy = extract_recommendations(
+                        synthetic_response(rng, results_per_job, n_businesses)
+                    )
+                    citations = (
+                        json.loads(json.dumps([f'https://example.com/guide/{prompt_type}/{i}' for i in range(6)]))
+                        if platform == 'perplexity' else []
+                    )
+                    job = Job(
+                        h3_index=h3_index, grid_center_lat=lat, grid_center_lng=lng, district='sydney',
+                        prompt_type=prompt_type, system_prompt_version='v1.0.0', platform=platform,
+                        model_version=MODEL_VERSIONS[platform], scan_run_id='run-bench', tap_number=tap,
+                        user_prompt_template=user_prompt, tokens_used=rng.randint(500, 1500),
+                        parse_strategy=strategy
+                    )
+                    results = [
+                        Result(
+                            job_id=job.id,
+                            raw_name=rec.get('name', ''),
+                            rank_position=rec.get('rank', 0),
+                            reasoning=rec.get('reasoning', ''),
+                            vibe_tags=rec.get('vibe_tags', []),
+                            negative_flags=rec.get('negative_flags', []),
+                            citation_urls=citations,
+                            citation_count=len(citations) if citations else None,
+                            raw_json_response=rec
+                        )
+                        for rec in recommendations
+                    ]
+                    records.append((job, results))
+    return records
+
+
+def rows(variant: str, records, sample: int) -> list:
+    """前 sample 个 job 的 raw 行 (去掉随机的 id), 用于比较两种表示"""
+    out = []
+    for job, results in records[:sample]:
+        if variant == 'compact':
+            job_row, result_rows = job_to_row(job), [result_to_row(r) for r in results]
+        else:
+            job_row, result_rows = asdict(job), [asdict(r) for r in results]
+            job_row['scanned_at'] = job.scanned_at.isoformat()
+        for row in [job_row, *result_rows]:
+            for key in ('id', 'job_id', 'scanned_at'):
+                row.pop(key, None)
+        out.append((job_row, result_rows))
+    return out
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_variant(args) -> dict:
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    records = build_run(args.variant, args.cells, args.taps, args.results_per_job, args.businesses)
+    elapsed = time.perf_counter() - started
+    return {
+        'variant': args.variant,
+        'jobs': len(records),
+        'results': sum(len(results) for _, results in records),
+        'build_seconds': round(elapsed, 2),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'records_mb': round(peak_rss_mb() - baseline, 1),
+        'rows': rows(args.variant, records, args.sample)
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='In-memory scan record footprint benchmark')
+    parser.add_argument('--cells', type=int, default=1000)
+    parser.add_argument('--taps', type=int, default=2)
+    parser.add_argument('--results-per-job', type=int, default=8)
+    parser.add_argument('--businesses', type=int, default=3000)
+    parser.add_argument('--sample', type=int, default=50, help='Jobs whose rows are compared across variants')
+    parser.add_argument('--variant', choices=['compact', 'legacy'], help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args)))
+        sys.exit(0)
+
+    reports = {}
+    for variant in ('legacy', 'compact'):
+        # 每种表示一个干净的进程, 峰值 RSS 互不影响
+        out = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.records', '--variant', variant, *sys.argv[1:]],
+            check=True, capture_output=True, text=True
+        ).stdout
+        reports[variant] = json.loads(out.strip().splitlines()[-1])
+
+    legacy, compact = reports['legacy'], reports['compact']
+    print(f"{compact['jobs']} jobs / {compact['results']} results")
+    for report in (legacy, compact):
+        print(
+            f"  {report['variant']:>8}: peak RSS {report['peak_rss_mb']:.0f} MB "
+            f"(records {report['records_mb']:.0f} MB) | build {report['build_seconds']:.2f}s"
+        )
+    print(f"  records footprint: {legacy['records_mb'] / max(compact['records_mb'], 0.1):.1f}x smaller")
+    print(f"  rows identical for {args.sample} sampled jobs: {legacy['rows'] == compact['rows']}")
@@ -2,13 +2,16 @@
 ChatGPT GoldEater - OpenAI API 数据采集
 """
 import json
-from typing import List, Optional
+from pathlib import Path
+from typing import Iterator, List, Tuple, Union
 from datetime import datetime
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 from ..shared import (
-    ScanJob, ScanResult, APIConfig, 
-    SYSTEM_PROMPT, get_user_prompt
+    ScanJob, ScanResult, APIConfig, Completion, BatchFailed,
+    SYSTEM_PROMPT, get_user_prompt, get_packed_prompt, unpack_completion, extract_recommendations,
+    get_rate_limiter, get_response_cache,
+    create_http_client, create_async_http_client, http_timeout
 )
 
 class ChatGPTEater:
@@ -16,10 +19,41 @@ class ChatGPTEater:
     
     PLATFORM = 'chatgpt'
     MODEL_VERSION = 'gpt-4o-2024-08-06'
+    TEMPERATURE = 0.7
+    SUPPORTS_BATCH = True
+    MAX_BATCH_REQUESTS = 50000  # 单个输入文件的请求数上限
     
     def __init__(self, api_config: APIConfig = None):
         self.config = api_config or APIConfig()
-        self.client = OpenAI(api_key=self.config.openai_api_key)
+        # 429 重试由共享限流器负责, 关闭 SDK 内置重试
+        self.limiter = get_rate_limiter(self.PLATFORM)
+        self.cache = get_response_cache()
+        self.client = OpenAI(
+            api_key=self.config.openai_api_key,
+            base_url=self.config.openai_base_url or None,
+            max_retries=0,
+            timeout=http_timeout(),
+            http_client=create_http_client()
+        )
+        self._async_client = None
+    
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=self.config.openai_api_key,
+                base_url=self.config.openai_base_url or None,
+                max_retries=0,
+                timeout=http_timeout(),
+                http_client=create_async_http_client()
+            )
+        return self._async_client
+    
+    async def aclose(self):
+        """关闭异步客户端 (它绑定在创建它的事件循环上), 下一个事件循环里重新创建"""
+        client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.close()
     
     def scan(
         self,
@@ -39,27 +73,233 @@ class ChatGPTEater:
             (ScanJob, List[ScanResult])
         """
         user_prompt = get_user_prompt(prompt_type, lat, lng, district)
-        
-        # 调用 OpenAI API
-        response = self.client.chat.completions.create(
-            model=self.MODEL_VERSION,
-            messages=[
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = self.cache.fetch(
+            key, lambda: self.limiter.call(lambda: self._complete(user_prompt))
+        )
+        return self._build_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_type, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    async def scan_async(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_type: str,
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> tuple[ScanJob, List[ScanResult]]:
+        """执行单次扫描 (异步版本, 使用 AsyncOpenAI)"""
+        user_prompt = get_user_prompt(prompt_type, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = await self.cache.fetch_async(
+            key, lambda: self.limiter.call_async(lambda: self._complete_async(user_prompt))
+        )
+        return self._build_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_type, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    def scan_packed(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """一次调用回答多个场景, 按 prompt_type 拆分为多个 ScanJob"""
+        user_prompt = get_packed_prompt(prompt_types, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = self.cache.fetch(
+            key, lambda: self.limiter.call(lambda: self._complete(user_prompt))
+        )
+        return self._build_packed_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_types, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    async def scan_packed_async(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """scan_packed 的异步版本"""
+        user_prompt = get_packed_prompt(prompt_types, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = await self.cache.fetch_async(
+            key, lambda: self.limiter.call_async(lambda: self._complete_async(user_prompt))
+        )
+        return self._build_packed_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_types, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    def _build_packed_records(
+        self,
+        completion: Completion,
+        user_prompt: str,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """拆分打包回复, 每个场景沿用单场景的解析"""
+        records = []
+        parts, parse_strategy = unpack_completion(completion, prompt_types)
+        for prompt_type, part in parts.items():
+            job, results = self._build_records(
+                part, user_prompt, h3_index, lat, lng, district,
+                prompt_type, scan_run_id, tap_number, system_prompt_version
+            )
+            job.packed = True
+            job.parse_strategy = parse_strategy
+            records.append((job, results))
+        return records
+    
+    def _cache_key(self, user_prompt: str, system_prompt_version: str, tap_number: int) -> str:
+        return self.cache.make_key(
+            self.PLATFORM, self.MODEL_VERSION, system_prompt_version,
+            user_prompt, self.TEMPERATURE, tap_number
+        )
+    
+    def _request_params(self, user_prompt: str) -> dict:
+        """构造 Chat Completions 请求参数"""
+        return {
+            'model': self.MODEL_VERSION,
+            'messages': [
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt}
             ],
-            temperature=0.7,
-            response_format={"type": "json_object"}
+            'temperature': self.TEMPERATURE,
+            'response_format': {"type": "json_object"}
+        }
+    
+    def _complete(self, user_prompt: str) -> Completion:
+        """调用 OpenAI API"""
+        raw = self.client.chat.completions.with_raw_response.create(**self._request_params(user_prompt))
+        self.limiter.observe_headers(raw.headers)
+        response = raw.parse()
+        return Completion(
+            content=response.choices[0].message.content,
+            tokens_used=response.usage.total_tokens
         )
-        
-        # 解析响应
-        raw_content = response.choices[0].message.content
-        tokens_used = response.usage.total_tokens
-        
-        try:
-            parsed = json.loads(raw_content)
-            recommendations = parsed.get('recommendations', [])
-        except json.JSONDecodeError:
-            recommendations = []
+    
+    async def _complete_async(self, user_prompt: str) -> Completion:
+        """调用 OpenAI API (异步)"""
+        raw = await self.async_client.chat.completions.with_raw_response.create(**self._request_params(user_prompt))
+        self.limiter.observe_headers(raw.headers)
+        response = raw.parse()
+        return Completion(
+            content=response.choices[0].message.content,
+            tokens_used=response.usage.total_tokens
+        )
+    
+    def task_cache_key(self, task: dict, system_prompt_version: str = "v1.0.0") -> str:
+        """调度任务对应的响应缓存 key (与 scan 一致)"""
+        user_prompt = get_user_prompt(task['prompt_type'], task['lat'], task['lng'], task['district'])
+        return self._cache_key(user_prompt, system_prompt_version, task['tap_number'])
+    
+    def build_task_records(
+        self,
+        task: dict,
+        completion: Completion,
+        system_prompt_version: str = "v1.0.0"
+    ) -> tuple[ScanJob, List[ScanResult]]:
+        """用批处理输出为调度任务生成 ScanJob / ScanResult"""
+        user_prompt = get_user_prompt(task['prompt_type'], task['lat'], task['lng'], task['district'])
+        return self._build_records(
+            completion, user_prompt, task['h3_index'], task['lat'], task['lng'], task['district'],
+            task['prompt_type'], task['scan_run_id'], task['tap_number'], system_prompt_version
+        )
+    
+    # ------------------------------------------------------------
+    # Batch API (orchestrator --mode batch)
+    # ------------------------------------------------------------
+    
+    def batch_request(self, custom_id: str, task: dict) -> dict:
+        """Batch 输入文件中的一行"""
+        user_prompt = get_user_prompt(task['prompt_type'], task['lat'], task['lng'], task['district'])
+        return {
+            'custom_id': custom_id,
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': self._request_params(user_prompt)
+        }
+    
+    def submit_batch(self, path: Path) -> str:
+        """上传 JSONL 并创建批次"""
+        with open(path, 'rb') as f:
+            uploaded = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint='/v1/chat/completions',
+            completion_window='24h'
+        )
+        return batch.id
+    
+    def batch_status(self, batch_id: str) -> str:
+        status = self.client.batches.retrieve(batch_id).status
+        if status == 'failed':
+            return 'failed'
+        # 过期或取消的批次仍可收取已完成的部分
+        if status in ('completed', 'expired', 'cancelled'):
+            return 'ended'
+        return 'running'
+    
+    def batch_outputs(self, batch_id: str) -> Iterator[Tuple[str, Union[Completion, Exception]]]:
+        """下载输出文件和错误文件, 逐条返回 (custom_id, Completion 或异常)"""
+        batch = self.client.batches.retrieve(batch_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get('response') or {}
+                body = response.get('body') or {}
+                if item.get('error') or response.get('status_code') != 200:
+                    error = item.get('error') or body.get('error')
+                    yield item['custom_id'], BatchFailed(f"{response.get('status_code')}: {error}")
+                    continue
+                yield item['custom_id'], Completion(
+                    content=body['choices'][0]['message']['content'],
+                    tokens_used=body['usage']['total_tokens']
+                )
+    
+    def _build_records(
+        self,
+        completion: Completion,
+        user_prompt: str,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_type: str,
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str
+    ) -> tuple[ScanJob, List[ScanResult]]:
+        """解析响应并生成 ScanJob / ScanResult"""
+        recommendations, parse_strategy = extract_recommendations(completion.content)
         
         # 创建 ScanJob
         job = ScanJob(
@@ -74,7 +314,8 @@ class ChatGPTEater:
             scan_run_id=scan_run_id,
             tap_number=tap_number,
             user_prompt_template=user_prompt,
-            tokens_used=tokens_used,
+            tokens_used=completion.tokens_used,
+            parse_strategy=parse_strategy,
             scanned_at=datetime.utcnow()
         )
         
@@ -2,13 +2,16 @@
 Claude GoldEater - Anthropic API 数据采集
 """
 import json
-from typing import List
+from pathlib import Path
+from typing import Iterator, List, Tuple, Union
 from datetime import datetime
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 
 from ..shared import (
-    ScanJob, ScanResult, APIConfig,
-    SYSTEM_PROMPT, get_user_prompt
+    ScanJob, ScanResult, APIConfig, Completion, BatchFailed,
+    SYSTEM_PROMPT, get_user_prompt, get_packed_prompt, unpack_completion, extract_recommendations,
+    get_rate_limiter, get_response_cache,
+    create_http_client, create_async_http_client, http_timeout
 )
 
 class ClaudeEater:
@@ -16,10 +19,41 @@ class ClaudeEater:
     
     PLATFORM = 'claude'
     MODEL_VERSION = 'claude-3-opus-20240229'
+    TEMPERATURE = None  # 使用平台默认值
+    SUPPORTS_BATCH = True
+    MAX_BATCH_REQUESTS = 100000  # 单个批次的请求数上限
     
     def __init__(self, api_config: APIConfig = None):
         self.config = api_config or APIConfig()
-        self.client = Anthropic(api_key=self.config.anthropic_api_key)
+        # 429 重试由共享限流器负责, 关闭 SDK 内置重试
+        self.limiter = get_rate_limiter(self.PLATFORM)
+        self.cache = get_response_cache()
+        self.client = Anthropic(
+            api_key=self.config.anthropic_api_key,
+            base_url=self.config.anthropic_base_url or None,
+            max_retries=0,
+            timeout=http_timeout(),
+            http_client=create_http_client()
+        )
+        self._async_client = None
+    
+    @property
+    def async_client(self) -> AsyncAnthropic:
+        if self._async_client is None:
+            self._async_client = AsyncAnthropic(
+                api_key=self.config.anthropic_api_key,
+                base_url=self.config.anthropic_base_url or None,
+                max_retries=0,
+                timeout=http_timeout(),
+                http_client=create_async_http_client()
+            )
+        return self._async_client
+    
+    async def aclose(self):
+        """关闭异步客户端 (它绑定在创建它的事件循环上), 下一个事件循环里重新创建"""
+        client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.close()
     
     def scan(
         self,
@@ -33,27 +67,210 @@ class ClaudeEater:
         system_prompt_version: str = "v1.0.0"
     ) -> tuple[ScanJob, List[ScanResult]]:
         """执行单次扫描"""
-        
         user_prompt = get_user_prompt(prompt_type, lat, lng, district)
-        
-        # 调用 Claude API
-        response = self.client.messages.create(
-            model=self.MODEL_VERSION,
-            max_tokens=2048,
-            system=SYSTEM_PROMPT,
-            messages=[
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = self.cache.fetch(
+            key, lambda: self.limiter.call(lambda: self._complete(user_prompt))
+        )
+        return self._build_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_type, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    async def scan_async(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_type: str,
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> tuple[ScanJob, List[ScanResult]]:
+        """执行单次扫描 (异步版本, 使用 AsyncAnthropic)"""
+        user_prompt = get_user_prompt(prompt_type, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = await self.cache.fetch_async(
+            key, lambda: self.limiter.call_async(lambda: self._complete_async(user_prompt))
+        )
+        return self._build_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_type, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    def scan_packed(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """一次调用回答多个场景, 按 prompt_type 拆分为多个 ScanJob"""
+        user_prompt = get_packed_prompt(prompt_types, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = self.cache.fetch(
+            key, lambda: self.limiter.call(lambda: self._complete(user_prompt))
+        )
+        return self._build_packed_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_types, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    async def scan_packed_async(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """scan_packed 的异步版本"""
+        user_prompt = get_packed_prompt(prompt_types, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = await self.cache.fetch_async(
+            key, lambda: self.limiter.call_async(lambda: self._complete_async(user_prompt))
+        )
+        return self._build_packed_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_types, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    def _build_packed_records(
+        self,
+        completion: Completion,
+        user_prompt: str,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """拆分打包回复, 每个场景沿用单场景的解析"""
+        records = []
+        parts, parse_strategy = unpack_completion(completion, prompt_types)
+        for prompt_type, part in parts.items():
+            job, results = self._build_records(
+                part, user_prompt, h3_index, lat, lng, district,
+                prompt_type, scan_run_id, tap_number, system_prompt_version
+            )
+            job.packed = True
+            job.parse_strategy = parse_strategy
+            records.append((job, results))
+        return records
+    
+    def _cache_key(self, user_prompt: str, system_prompt_version: str, tap_number: int) -> str:
+        return self.cache.make_key(
+            self.PLATFORM, self.MODEL_VERSION, system_prompt_version,
+            user_prompt, self.TEMPERATURE, tap_number
+        )
+    
+    def _request_params(self, user_prompt: str) -> dict:
+        """构造 Messages API 请求参数"""
+        return {
+            'model': self.MODEL_VERSION,
+            'max_tokens': 4096,  # 打包请求一次返回多个场景
+            'system': SYSTEM_PROMPT,
+            'messages': [
                 {"role": "user", "content": user_prompt}
             ]
+        }
+    
+    def _complete(self, user_prompt: str) -> Completion:
+        """调用 Claude API"""
+        raw = self.client.messages.with_raw_response.create(**self._request_params(user_prompt))
+        self.limiter.observe_headers(raw.headers)
+        response = raw.parse()
+        return Completion(
+            content=response.content[0].text,
+            tokens_used=response.usage.input_tokens + response.usage.output_tokens
         )
-        
-        raw_content = response.content[0].text
-        tokens_used = response.usage.input_tokens + response.usage.output_tokens
-        
-        try:
-            parsed = json.loads(raw_content)
-            recommendations = parsed.get('recommendations', [])
-        except json.JSONDecodeError:
-            recommendations = []
+    
+    async def _complete_async(self, user_prompt: str) -> Completion:
+        """调用 Claude API (异步)"""
+        raw = await self.async_client.messages.with_raw_response.create(**self._request_params(user_prompt))
+        self.limiter.observe_headers(raw.headers)
+        response = raw.parse()
+        return Completion(
+            content=response.content[0].text,
+            tokens_used=response.usage.input_tokens + response.usage.output_tokens
+        )
+    
+    def task_cache_key(self, task: dict, system_prompt_version: str = "v1.0.0") -> str:
+        """调度任务对应的响应缓存 key (与 scan 一致)"""
+        user_prompt = get_user_prompt(task['prompt_type'], task['lat'], task['lng'], task['district'])
+        return self._cache_key(user_prompt, system_prompt_version, task['tap_number'])
+    
+    def build_task_records(
+        self,
+        task: dict,
+        completion: Completion,
+        system_prompt_version: str = "v1.0.0"
+    ) -> tuple[ScanJob, List[ScanResult]]:
+        """用批处理输出为调度任务生成 ScanJob / ScanResult"""
+        user_prompt = get_user_prompt(task['prompt_type'], task['lat'], task['lng'], task['district'])
+        return self._build_records(
+            completion, user_prompt, task['h3_index'], task['lat'], task['lng'], task['district'],
+            task['prompt_type'], task['scan_run_id'], task['tap_number'], system_prompt_version
+        )
+    
+    # ------------------------------------------------------------
+    # Message Batches API (orchestrator --mode batch)
+    # ------------------------------------------------------------
+    
+    def batch_request(self, custom_id: str, task: dict) -> dict:
+        """Message Batches 请求中的一项 (同时写入本地 JSONL)"""
+        user_prompt = get_user_prompt(task['prompt_type'], task['lat'], task['lng'], task['district'])
+        return {'custom_id': custom_id, 'params': self._request_params(user_prompt)}
+    
+    def submit_batch(self, path: Path) -> str:
+        """读取 JSONL 并创建批次"""
+        with open(path, encoding='utf-8') as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        return self.client.messages.batches.create(requests=requests).id
+    
+    def batch_status(self, batch_id: str) -> str:
+        batch = self.client.messages.batches.retrieve(batch_id)
+        return 'ended' if batch.processing_status == 'ended' else 'running'
+    
+    def batch_outputs(self, batch_id: str) -> Iterator[Tuple[str, Union[Completion, Exception]]]:
+        """逐条返回 (custom_id, Completion 或异常)"""
+        for entry in self.client.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type != 'succeeded':
+                yield entry.custom_id, BatchFailed(f"{result.type}: {getattr(result, 'error', '')}")
+                continue
+            message = result.message
+            yield entry.custom_id, Completion(
+                content=message.content[0].text,
+                tokens_used=message.usage.input_tokens + message.usage.output_tokens
+            )
+    
+    def _build_records(
+        self,
+        completion: Completion,
+        user_prompt: str,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_type: str,
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str
+    ) -> tuple[ScanJob, List[ScanResult]]:
+        """解析响应并生成 ScanJob / ScanResult"""
+        recommendations, parse_strategy = extract_recommendations(completion.content)
         
         # 创建 ScanJob
         job = ScanJob(
@@ -68,7 +285,8 @@ class ClaudeEater:
             scan_run_id=scan_run_id,
             tap_number=tap_number,
             user_prompt_template=user_prompt,
-            tokens_used=tokens_used,
+            tokens_used=completion.tokens_used,
+            parse_strategy=parse_strategy,
             scanned_at=datetime.utcnow()
         )
         
@@ -1,14 +1,15 @@
 """
 Gemini GoldEater - Google AI API 数据采集
 """
-import json
 from typing import List
 from datetime import datetime
 import google.generativeai as genai
 
 from ..shared import (
-    ScanJob, ScanResult, APIConfig,
-    SYSTEM_PROMPT, get_user_prompt
+    ScanJob, ScanResult, APIConfig, Completion,
+    SYSTEM_PROMPT, get_user_prompt, get_packed_prompt, unpack_completion, extract_recommendations,
+    get_rate_limiter, get_response_cache,
+    HTTP_READ_TIMEOUT
 )
 
 class GeminiEater:
@@ -16,9 +17,12 @@ class GeminiEater:
     
     PLATFORM = 'gemini'
     MODEL_VERSION = 'gemini-1.5-pro'
+    TEMPERATURE = 0.7
     
     def __init__(self, api_config: APIConfig = None):
         self.config = api_config or APIConfig()
+        self.limiter = get_rate_limiter(self.PLATFORM)
+        self.cache = get_response_cache()
         genai.configure(api_key=self.config.google_ai_api_key)
         self.model = genai.GenerativeModel(self.MODEL_VERSION)
     
@@ -34,26 +38,162 @@ class GeminiEater:
         system_prompt_version: str = "v1.0.0"
     ) -> tuple[ScanJob, List[ScanResult]]:
         """执行单次扫描"""
-        
         user_prompt = get_user_prompt(prompt_type, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = self.cache.fetch(
+            key, lambda: self.limiter.call(lambda: self._complete(user_prompt))
+        )
+        return self._build_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_type, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    async def scan_async(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_type: str,
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> tuple[ScanJob, List[ScanResult]]:
+        """执行单次扫描 (异步版本)"""
+        user_prompt = get_user_prompt(prompt_type, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = await self.cache.fetch_async(
+            key, lambda: self.limiter.call_async(lambda: self._complete_async(user_prompt))
+        )
+        return self._build_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_type, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    def scan_packed(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """一次调用回答多个场景, 按 prompt_type 拆分为多个 ScanJob"""
+        user_prompt = get_packed_prompt(prompt_types, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = self.cache.fetch(
+            key, lambda: self.limiter.call(lambda: self._complete(user_prompt))
+        )
+        return self._build_packed_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_types, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    async def scan_packed_async(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """scan_packed 的异步版本"""
+        user_prompt = get_packed_prompt(prompt_types, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = await self.cache.fetch_async(
+            key, lambda: self.limiter.call_async(lambda: self._complete_async(user_prompt))
+        )
+        return self._build_packed_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_types, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    def _build_packed_records(
+        self,
+        completion: Completion,
+        user_prompt: str,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """拆分打包回复, 每个场景沿用单场景的解析"""
+        records = []
+        parts, parse_strategy = unpack_completion(completion, prompt_types)
+        for prompt_type, part in parts.items():
+            job, results = self._build_records(
+                part, user_prompt, h3_index, lat, lng, district,
+                prompt_type, scan_run_id, tap_number, system_prompt_version
+            )
+            job.packed = True
+            job.parse_strategy = parse_strategy
+            records.append((job, results))
+        return records
+    
+    def _cache_key(self, user_prompt: str, system_prompt_version: str, tap_number: int) -> str:
+        return self.cache.make_key(
+            self.PLATFORM, self.MODEL_VERSION, system_prompt_version,
+            user_prompt, self.TEMPERATURE, tap_number
+        )
+    
+    def _generation_config(self) -> genai.types.GenerationConfig:
+        return genai.types.GenerationConfig(
+            temperature=self.TEMPERATURE,
+            response_mime_type="application/json"
+        )
+    
+    def _complete(self, user_prompt: str) -> Completion:
+        """调用 Gemini API"""
         full_prompt = f"{SYSTEM_PROMPT}\n\n{user_prompt}"
-        
-        # 调用 Gemini API
         response = self.model.generate_content(
             full_prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.7,
-                response_mime_type="application/json"
-            )
+            generation_config=self._generation_config(),
+            request_options={'timeout': HTTP_READ_TIMEOUT}
         )
-        
-        raw_content = response.text
-        
-        try:
-            parsed = json.loads(raw_content)
-            recommendations = parsed.get('recommendations', [])
-        except json.JSONDecodeError:
-            recommendations = []
+        return self._to_completion(response)
+    
+    async def _complete_async(self, user_prompt: str) -> Completion:
+        """调用 Gemini API (异步)"""
+        full_prompt = f"{SYSTEM_PROMPT}\n\n{user_prompt}"
+        response = await self.model.generate_content_async(
+            full_prompt,
+            generation_config=self._generation_config(),
+            request_options={'timeout': HTTP_READ_TIMEOUT}
+        )
+        return self._to_completion(response)
+    
+    def _to_completion(self, response) -> Completion:
+        usage = getattr(response, 'usage_metadata', None)
+        return Completion(
+            content=response.text,
+            tokens_used=usage.total_token_count if usage else None
+        )
+    
+    def _build_records(
+        self,
+        completion: Completion,
+        user_prompt: str,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_type: str,
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str
+    ) -> tuple[ScanJob, List[ScanResult]]:
+        """解析响应并生成 ScanJob / ScanResult"""
+        recommendations, parse_strategy = extract_recommendations(completion.content)
         
         # 创建 ScanJob
         job = ScanJob(
@@ -68,6 +208,8 @@ class GeminiEater:
             scan_run_id=scan_run_id,
             tap_number=tap_number,
             user_prompt_template=user_prompt,
+            tokens_used=completion.tokens_used,
+            parse_strategy=parse_strategy,
             scanned_at=datetime.utcnow()
         )
         
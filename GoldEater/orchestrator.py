@@ -1,15 +1,39 @@
 """
 GoldEater Orchestrator - 调度所有 GoldEater 执行扫描任务
 """
+import os
+import json
+import time
 import uuid
+import socket
+import threading
+import random
+import asyncio
 import h3
-from datetime import datetime
-from typing import List, Tuple
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime
+from itertools import islice
+from typing import Dict, List, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 
 from shared import (
-    PLATFORMS, PROMPT_TYPES, H3_RESOLUTION, TAP_COUNT,
-    DISTRICT_BOUNDS, DatabaseClient, ScanJob, ScanResult
+    PLATFORMS, PROMPT_TYPES, H3_RESOLUTION, TAP_COUNT, PLATFORM_CONCURRENCY, CACHE_MODES,
+    DatabaseClient, ScanJob, ScanResult, StreamingWriter, TaskJournal, ArchiveWriter, BatchRunner,
+    AdaptiveSampler, rank_biased_overlap,
+    CellStats, HierarchicalGrid, IncrementalAggregator, MerchantGrid, write_aggregates,
+    create_sink, district_grid, district_grid_arrays, list_districts, load_district, normalize_name,
+    parse_report, record_parse, read_archive, remove_run, task_key, task_id,
+    get_response_cache, throttle_report, transport_stats,
+    WorkQueue, create_queue, share_rate_limits,
+    BudgetScheduler, CellPriority, ScanBudget, parse_budget,
+    MetricsExporter, ProgressReporter, get_metrics
+)
+from shared.config import (
+    HIERARCHICAL_START_RESOLUTION, MERCHANT_GRID_RINGS, METRICS_SUMMARY_DIR,
+    WORK_HEARTBEAT_INTERVAL, WORK_MAX_ATTEMPTS,
+    WORKER_BATCH_SIZE, WORKER_IDLE_EXIT, WORKER_POLL_INTERVAL
 )
 from chatgpt import ChatGPTEater
 from perplexity import PerplexityEater
@@ -17,6 +41,51 @@ from gemini import GeminiEater
 from claude import ClaudeEater
 from places import PlacesEater
 
+@dataclass
+class ScanPlan:
+    """run_full_scan 的扫描参数 (登记在任务日志中, 续跑时读回) 及网格 / 采样设置"""
+    scan_run_id: str
+    district: str
+    platforms: List[str]
+    prompt_types: List[str]
+    sampling: str = 'fixed'
+    grid_mode: str = 'flat'
+    packed: bool = False
+    merchant: str = None
+    rings: int = MERCHANT_GRID_RINGS
+    grid: List[Tuple[str, float, float]] = None
+    hierarchy: HierarchicalGrid = None
+    merchant_grid: MerchantGrid = None
+    sampler: AdaptiveSampler = None
+    tap_count: int = TAP_COUNT
+
+    @classmethod
+    def from_journal(cls, scan_run_id: str, params: dict, rings: int = MERCHANT_GRID_RINGS) -> 'ScanPlan':
+        return cls(
+            scan_run_id=scan_run_id,
+            district=params['district'],
+            platforms=params['platforms'],
+            prompt_types=params['prompt_types'],
+            sampling=params.get('sampling', 'fixed'),
+            grid_mode=params.get('grid', 'flat'),
+            packed=params.get('packed', False),
+            merchant=params.get('merchant'),
+            rings=params.get('rings', rings)
+        )
+
+    def journal_params(self) -> dict:
+        return {
+            'district': self.district,
+            'platforms': self.platforms,
+            'prompt_types': self.prompt_types,
+            'sampling': self.sampling,
+            'grid': self.grid_mode,
+            'packed': self.packed,
+            'merchant': self.merchant,
+            'rings': self.rings
+        }
+
+
 class Orchestrator:
     """GoldEater 调度器"""
     
@@ -29,6 +98,8 @@ class Orchestrator:
         }
         self.places_eater = PlacesEater()
         self.db = DatabaseClient()
+        self.journal = TaskJournal()
+        self._loop = None
     
     def generate_h3_grid(self, district: str) -> List[Tuple[str, float, float]]:
         """
@@ -37,36 +108,27 @@ class Orchestrator:
         Returns:
             List of (h3_index, center_lat, center_lng)
         """
-        bounds = DISTRICT_BOUNDS.get(district)
-        if not bounds:
-            raise ValueError(f"Unknown district: {district}")
-        
-        # 创建多边形覆盖区域
-        polygon = [
-            (bounds['west'], bounds['south']),
-            (bounds['east'], bounds['south']),
-            (bounds['east'], bounds['north']),
-            (bounds['west'], bounds['north']),
-            (bounds['west'], bounds['south'])
-        ]
-        
-        # 生成 H3 格子
-        h3_indexes = h3.polygon_to_cells(polygon, H3_RESOLUTION)
-        
-        # 获取每个格子的中心点
-        grid = []
-        for idx in h3_indexes:
-            lat, lng = h3.cell_to_latlng(idx)
-            grid.append((idx, lat, lng))
-        
-        return grid
+        # 边界来自 districts/<district>.geojson, 网格按边界哈希缓存在 .state/grids
+        return district_grid(district, H3_RESOLUTION)
     
     def run_full_scan(
         self,
         district: str,
         platforms: List[str] = None,
         prompt_types: List[str] = None,
-        parallel: bool = True
+        parallel: bool = True,
+        engine: str = 'async',
+        resume: str = None,
+        mode: str = 'sync',
+        sampling: str = 'fixed',
+        grid_mode: str = 'flat',
+        packed: bool = False,
+        live_aggregate: bool = False,
+        archive: bool = False,
+        budget: ScanBudget = None,
+        prior_run: str = None,
+        merchant: str = None,
+        rings: int = MERCHANT_GRID_RINGS
     ):
         """
         执行完整扫描
@@ -76,29 +138,613 @@ class Orchestrator:
             platforms: 要扫描的平台列表 (默认全部)
             prompt_types: 要扫描的场景列表 (默认全部)
             parallel: 是否并行执行
+            engine: 并行引擎, 'async' (单事件循环, 按平台限流) 或 'thread' (线程池兜底)
+            resume: 继续一个中断的 scan_run_id (参数从任务日志读取, 只执行未完成的任务)
+            mode: 'sync' (实时接口) 或 'batch' (支持批处理接口的平台走离线批处理, 其余平台仍走实时接口)
+            sampling: 'fixed' (每个格子/平台/场景 TAP_COUNT 次) 或 'adaptive' (按排名一致性决定 tap 数)
+            grid_mode: 'flat' (H3_RESOLUTION 全覆盖) 或 'hierarchical' (粗扫后按需细分)
+            packed: 每次调用回答全部场景 (按 prompt_type 拆分为多个 ScanJob)
+            live_aggregate: 扫描中增量聚合, 每 AGGREGATE_SNAPSHOT_INTERVAL 秒发布热力图快照
+            archive: 同时写入本地 Parquet 归档 (ARCHIVE_DIR)
+            budget: 花费上限; 任务按格子价值排序派发, 预算不足时停止接纳 (未派发的任务留待 --resume)
+            prior_run: 预算调度参考的上次扫描 (tap 间排名波动、每次调用的 token 用量)
+            merchant: 商户 id 或 google_place_id; 只扫描商户周围 rings 圈采样点, 结束时计算 V_local
+            rings: 商户中心网格的圈数
+        """
+        if resume:
+            plan = ScanPlan.from_journal(resume, self.journal.load_run(resume), rings)
+        else:
+            plan = ScanPlan(
+                scan_run_id=self._new_run_id(),
+                district=district,
+                platforms=platforms or PLATFORMS,
+                prompt_types=prompt_types or PROMPT_TYPES,
+                sampling=sampling,
+                grid_mode=grid_mode,
+                packed=packed,
+                merchant=merchant,
+                rings=rings
+            )
+        scan_run_id = plan.scan_run_id
+        self._setup_sampling(plan, mode, budget)
+        self._setup_grid(plan)
+        if live_aggregate and plan.hierarchy and not resume:
+            # 增量快照按扫描时的粗格子 upsert, 最终快照经 coverage 展开为目标分辨率,
+            # 粗格子的行会残留在 mart 中
+            raise ValueError("Live aggregation publishes scanned cells as-is and cannot run on a hierarchical grid")
+        self._print_scan_plan(plan)
+        
+        priority = None
+        if budget:
+            limits = ', '.join(f"{platform} {limit}" for platform, limit in budget.limits.items())
+            print(f"Budget ({budget.unit}): {limits}")
+            priority = self._cell_priority(plan.district, prior_run, budget)
+        
+        tasks, completed, level = self._scan_tasks(plan, resume)
+        hierarchy, sampler = plan.hierarchy, plan.sampler
+        
+        def on_flushed(jobs: List[ScanJob]):
+            self.journal.mark_done(scan_run_id, (
+                (j.h3_index, j.platform, j.prompt_type, j.tap_number) for j in jobs
+            ))
+        
+        # 运行指标: 扫描中定期导出 Prometheus 文本, 结束时写 JSON 摘要; 逐任务输出改为限速的进度行
+        get_metrics().reset()
+        exporter = MetricsExporter()
+        exporter.start()
+        progress = ProgressReporter(total=0)
+        aggregator, archiver = self._setup_outputs(plan, live_aggregate and not resume, archive)
+        if live_aggregate and resume:
+            # 增量聚合只能看到本进程完成的任务, 续跑时结束后用 --aggregate 重算
+            print(f"Live aggregation is skipped on resume; run --aggregate {scan_run_id} afterwards")
+        
+        # 扫描结果流式写入数据库, 不在内存中累积
+        with StreamingWriter(create_sink(db=self.db), on_flushed=on_flushed) as writer, self._event_loop():
+            def record(task: dict, job: ScanJob, results: List[ScanResult]):
+                self._record_parse(job)
+                if budget:
+                    budget.settle(task, job)
+                if hierarchy:
+                    hierarchy.record(job, results)
+                if aggregator:
+                    aggregator.add(job, results)
+                if archiver:
+                    archiver.write([job], results)
+                progress.task_done(task)
+            
+            def on_done(task: dict, job: ScanJob, results: List[ScanResult]):
+                writer.put(job, results)
+                record(task, job, results)
+            
+            async def on_done_async(task: dict, job: ScanJob, results: List[ScanResult]):
+                await writer.put_async(job, results)
+                record(task, job, results)
+            
+            def on_error(task: dict, e: Exception):
+                if budget:
+                    budget.release(task)
+                scenario_tasks = self._scenario_tasks(task)
+                for scenario_task in scenario_tasks:
+                    self.journal.mark_failed(scan_run_id, scenario_task, e)
+                progress.task_failed(task, e, len(scenario_tasks))
+            
+            deferred = 0
+            
+            def run_round(round_tasks: List[dict]):
+                nonlocal deferred
+                progress.expect(len(round_tasks))
+                deferred += self._run_round(
+                    round_tasks, completed, sampler, plan.packed, mode, parallel, engine,
+                    on_done, on_done_async, on_error, budget, priority
+                )
+            
+            run_round(tasks)
+            
+            if hierarchy:
+                # 逐层细分; 续跑时只补完已登记的格子
+                if not resume:
+                    self._refine_hierarchy(plan, level, run_round)
+                try:
+                    writer.sink.write_coverage(hierarchy.coverage_rows(scan_run_id))
+                except Exception as e:
+                    print(f"✗ Could not save scan coverage: {e}")
+        progress.close()
+        self._close_outputs(aggregator, archiver, writer)
+        
+        # 补全位置信息
+        print("\nResolving business locations...")
+        # 商户模式只需要采样点附近的地名录
+        self._resolve_locations(
+            *self._run_names(scan_run_id), plan.district,
+            sweep_cells=[cell for cell, _, _ in plan.grid] if plan.merchant_grid else None
+        )
+        
+        # 增量聚合看到的是补全前的结果 (没有 business_id, 名称未规范到商户),
+        # 补全后按落库数据重新发布一次最终快照, 与 --aggregate 的结果一致
+        if aggregator:
+            print("\nRepublishing live aggregate with resolved locations...")
+            self.aggregate_run(scan_run_id, snapshot_date=aggregator.snapshot_date)
+        
+        if plan.merchant_grid:
+            self._print_local_visibility(plan.merchant_grid, scan_run_id)
+        
+        self._print_throttle_report()
+        exporter.close()
+        self._print_metrics_summary(scan_run_id)
+        
+        if budget:
+            self._print_budget_report(budget, deferred)
+        self._print_scan_report(plan)
+        
+        print(f"\n✅ Scan complete: {scan_run_id}")
+        return scan_run_id
+
+    def _new_run_id(self) -> str:
+        return f"run-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+    def _setup_sampling(self, plan: ScanPlan, mode: str, budget: ScanBudget):
+        """校验扫描模式组合, 设置 plan.sampler / plan.tap_count"""
+        if plan.packed and (mode == 'batch' or plan.sampling == 'adaptive'):
+            raise ValueError("Packed prompts run through the realtime engines with fixed sampling only")
+        
+        if budget and (mode == 'batch' or plan.sampling == 'adaptive'):
+            raise ValueError("Budgeted scans run through the realtime engines with fixed sampling only")
+        
+        if plan.sampling == 'adaptive':
+            if mode == 'batch':
+                raise ValueError("Adaptive sampling needs per-tap results and cannot run in batch mode")
+            plan.sampler = AdaptiveSampler()
+            plan.tap_count = plan.sampler.min_taps
+        elif plan.sampling == 'fixed':
+            plan.sampler = None
+            plan.tap_count = TAP_COUNT
+        else:
+            raise ValueError(f"Unknown sampling: {plan.sampling}")
+
+    def _setup_grid(self, plan: ScanPlan):
+        """设置采样点: 商户中心网格或区域全网格, 分层模式下再包装为 HierarchicalGrid"""
+        if plan.merchant:
+            if plan.grid_mode != 'flat':
+                raise ValueError("Merchant scans sample a fixed grid around the business and cannot be hierarchical")
+            plan.merchant_grid = self._merchant_grid(plan.merchant, plan.rings)
+            plan.district = plan.merchant_grid.business['district']
+            plan.grid = plan.merchant_grid.points()
+        else:
+            plan.grid = self.generate_h3_grid(plan.district)
+        if plan.grid_mode == 'hierarchical':
+            plan.hierarchy = HierarchicalGrid(h3_index for h3_index, _, _ in plan.grid)
+        elif plan.grid_mode != 'flat':
+            raise ValueError(f"Unknown grid mode: {plan.grid_mode}")
+
+    def _print_scan_plan(self, plan: ScanPlan):
+        print(f"Starting scan run: {plan.scan_run_id}")
+        print(f"District: {plan.district}")
+        if plan.merchant_grid:
+            merchant_grid = plan.merchant_grid
+            print(
+                f"Merchant: {merchant_grid.business.get('official_name')} | {plan.rings} rings around "
+                f"{merchant_grid.center} (max {merchant_grid.distance_m.max():.0f} m)"
+            )
+        print(f"Grid cells: {len(plan.grid)}")
+        print(f"Platforms: {plan.platforms}")
+        print(f"Prompt types: {plan.prompt_types}")
+        if plan.sampler:
+            print(f"Sampling: adaptive, {plan.sampler.min_taps}-{plan.sampler.max_taps} taps per series")
+        if plan.hierarchy:
+            print(
+                f"Grid: hierarchical, res {plan.hierarchy.start_resolution} → {plan.hierarchy.target_resolution}, "
+                f"budget {plan.hierarchy.cell_budget} cells"
+            )
+        else:
+            calls_per_cell = len(plan.platforms) * (1 if plan.packed else len(plan.prompt_types)) * plan.tap_count
+            print(f"Total API calls: {len(plan.grid) * calls_per_cell}")
+        if plan.packed:
+            print("Prompts: packed, one call answers all prompt types")
+
+    def _scan_tasks(self, plan: ScanPlan, resume: bool) -> Tuple[List[dict], set, List[str]]:
+        """
+        首轮任务、已完成任务集合和首轮扫描的格子 (续跑时为空)
+
+        任务日志: 新运行登记全部任务, 续跑时跳过已落库的任务。
+        """
+        if not resume:
+            cells = plan.hierarchy.initial_cells() if plan.hierarchy else plan.grid
+            tasks = self._build_tasks(
+                cells, plan.district, plan.platforms, plan.prompt_types, plan.scan_run_id, plan.tap_count
+            )
+            self.journal.start_run(plan.scan_run_id, plan.journal_params(), tasks)
+            return tasks, set(), [cell for cell, _, _ in cells]
+        
+        completed = self.journal.completed(plan.scan_run_id)
+        if plan.hierarchy:
+            # 分层扫描的格子在运行中决定, 从任务日志恢复
+            plan.hierarchy.restore(self.journal.cells(plan.scan_run_id))
+            tasks = [
+                self._task_from_key(key, plan.district, plan.scan_run_id)
+                for key in self.journal.unfinished(plan.scan_run_id)
+            ]
+        else:
+            tasks = [
+                t for t in self._build_tasks(
+                    plan.grid, plan.district, plan.platforms, plan.prompt_types, plan.scan_run_id, plan.tap_count
+                )
+                if task_key(t) not in completed
+            ]
+        print(f"Resuming: {len(completed)} tasks already done, {len(tasks)} remaining")
+        return tasks, completed, []
+
+    def _setup_outputs(
+        self, plan: ScanPlan, live_aggregate: bool, archive: bool
+    ) -> Tuple[IncrementalAggregator, ArchiveWriter]:
+        """数据库之外的输出: 增量热力图快照和本地 Parquet 归档"""
+        aggregator = None
+        if live_aggregate:
+            aggregator = IncrementalAggregator(create_sink(db=self.db))
+            aggregator.start()
+        archiver = ArchiveWriter() if archive else None
+        return aggregator, archiver
+
+    def _close_outputs(self, aggregator: IncrementalAggregator, archiver: ArchiveWriter, writer: StreamingWriter):
+        if aggregator:
+            aggregator.close()
+            print(f"\nLive heatmap: {aggregator.snapshots} snapshots from {aggregator.jobs} jobs")
+        if archiver:
+            archiver.close()
+            print(
+                f"\nArchived {archiver.jobs_written} jobs and {archiver.results_written} results "
+                f"in {archiver.files} Parquet files"
+            )
+        
+        print(
+            f"\nSaved {writer.jobs_written} jobs and {writer.results_written} results "
+            f"in {writer.flushes} flushes (backpressure {writer.blocked_seconds:.1f}s, "
+            f"{writer.failed_jobs} jobs failed to save)"
+        )
+
+    def _print_scan_report(self, plan: ScanPlan):
+        """扫描结束时的分层网格 / 自适应采样 / 响应缓存 / 任务日志摘要"""
+        if plan.hierarchy:
+            stats = plan.hierarchy.stats()
+            print(
+                f"\nHierarchical grid: {stats['scanned_cells']} cells scanned for "
+                f"{stats['target_cells']} res-{plan.hierarchy.target_resolution} cells "
+                f"({stats['reduction']}x fewer) | by resolution {stats['by_resolution']}"
+            )
+        
+        if plan.sampler:
+            report = plan.sampler.report(TAP_COUNT)
+            print(
+                f"\nAdaptive sampling: {report['series']} series | {report['calls']} calls | "
+                f"stop reasons {report['stop_reasons']}"
+            )
+            print(
+                f"  Saved {report['saved_vs_ceiling']} calls ({report['saved_vs_ceiling_pct']}%) "
+                f"vs fixed {plan.sampler.max_taps} taps; {report['extra_vs_tap_count']:+d} calls "
+                f"vs fixed TAP_COUNT={TAP_COUNT}"
+            )
+        
+        cache_stats = get_response_cache().stats()
+        if cache_stats['mode'] != 'off':
+            print(f"\nResponse cache: {cache_stats}")
+        
+        summary = self.journal.summary(plan.scan_run_id)
+        print(f"\nTask journal: {summary}")
+        if summary.get('failed') or summary.get('pending') or summary.get('in_flight'):
+            print(f"  Retry unfinished tasks with: python orchestrator.py --resume {plan.scan_run_id}")
+
+    def enqueue_scan(
+        self,
+        district: str,
+        platforms: List[str] = None,
+        prompt_types: List[str] = None,
+        packed: bool = False,
+        queue: WorkQueue = None
+    ) -> str:
+        """
+        分布式扫描: 把任务放入工作队列, 由 --worker 进程执行
+
+        等待队列中本次扫描的任务全部完成 (或 dead) 后, 从数据库读取结果补全位置信息。
+        调度进程中断不影响 worker, 再次运行时已在队列中的任务不会重复加入。
         """
         platforms = platforms or PLATFORMS
         prompt_types = prompt_types or PROMPT_TYPES
+        queue = queue or create_queue()
+        scan_run_id = self._new_run_id()
+
+        grid = self.generate_h3_grid(district)
+        tasks = self._build_tasks(grid, district, platforms, prompt_types, scan_run_id, TAP_COUNT)
+        units = self._pack_tasks(tasks) if packed else tasks
+        added = queue.put(units)
+        print(f"Queued scan run: {scan_run_id}")
+        print(f"District: {district} | {len(grid)} cells | {added} tasks{' (packed)' if packed else ''}")
+        print("Start workers with: python orchestrator.py --worker")
+
+        started = time.monotonic()
+        last = None
+        while True:
+            stats = queue.stats(scan_run_id)
+            if stats != last:
+                print(
+                    f"  {stats['done']}/{stats['total']} done | {stats['dead']} dead | "
+                    f"{time.monotonic() - started:.0f}s"
+                )
+                last = stats
+            if stats['remaining'] == 0:
+                break
+            time.sleep(WORKER_POLL_INTERVAL * 5)
+
+        print("\nResolving business locations...")
+        self._resolve_locations(*self._run_names(scan_run_id), district)
+
+        print(f"\n✅ Scan complete: {scan_run_id} ({last['dead']} tasks dead after {WORK_MAX_ATTEMPTS} attempts)")
+        return scan_run_id
+
+    def run_worker(self, engine: str = 'async', batch_size: int = WORKER_BATCH_SIZE, idle_exit: float = WORKER_IDLE_EXIT):
+        """
+        分布式扫描 worker: 从工作队列租用任务执行, 数据落库后确认
+
+        持有的任务每 WORK_HEARTBEAT_INTERVAL 秒续租一次; 执行失败的任务归还队列重试。
+        限流令牌桶保存在队列中, 所有 worker 合计遵守 PLATFORM_RATE_LIMITS。
+        连续 idle_exit 秒没有可租用的任务时退出。
+        """
+        queue = create_queue()
+        share_rate_limits(queue)
+        worker = f"{socket.gethostname()}-{os.getpid()}"
+        print(f"Worker {worker} started")
+
+        lock = threading.Lock()
+        held = {}       # 任务 id → 尚未落库的场景数
+        owners = {}     # 场景任务 key → 任务 id
+        counts = {'done': 0, 'failed': 0}
+        exporter = MetricsExporter()
+        exporter.start()
+        progress = ProgressReporter()
+
+        def on_flushed(jobs: List[ScanJob]):
+            finished = []
+            with lock:
+                for job in jobs:
+                    unit_id = owners.pop((job.scan_run_id, job.h3_index, job.platform, job.prompt_type, job.tap_number), None)
+                    if unit_id is None or unit_id not in held:
+                        continue
+                    held[unit_id] -= 1
+                    if held[unit_id] == 0:
+                        del held[unit_id]
+                        finished.append(unit_id)
+            queue.ack(finished)
+            counts['done'] += len(finished)
+
+        def on_error(task: dict, e: Exception):
+            unit_id = task_id(task)
+            with lock:
+                held.pop(unit_id, None)
+                for scenario in self._scenario_tasks(task):
+                    owners.pop((scenario['scan_run_id'], *task_key(scenario)), None)
+            queue.release(worker, unit_id, f"{type(e).__name__}: {e}")
+            counts['failed'] += 1
+            progress.task_failed(task, e, len(self._scenario_tasks(task)))
+
+        stop = threading.Event()
+
+        def heartbeat():
+            while not stop.wait(WORK_HEARTBEAT_INTERVAL):
+                with lock:
+                    unit_ids = list(held)
+                try:
+                    queue.heartbeat(worker, unit_ids)
+                except Exception as e:
+                    print(f"✗ Heartbeat failed: {e}")
+
+        heartbeat_thread = threading.Thread(target=heartbeat, name='queue-heartbeat', daemon=True)
+        heartbeat_thread.start()
+
+        # 整个 worker 生命周期共用一个事件循环和 eater 的异步客户端
+        with StreamingWriter(create_sink(db=self.db), on_flushed=on_flushed) as writer, self._event_loop():
+            def on_done(task: dict, job: ScanJob, results: List[ScanResult]):
+                writer.put(job, results)
+                self._record_parse(job)
+                progress.task_done(task)
+
+            async def on_done_async(task: dict, job: ScanJob, results: List[ScanResult]):
+                await writer.put_async(job, results)
+                self._record_parse(job)
+                progress.task_done(task)
+
+            idle_since = time.monotonic()
+            while True:
+                leases = queue.lease(worker, batch_size)
+                if not leases:
+                    if time.monotonic() - idle_since >= idle_exit:
+                        break
+                    time.sleep(WORKER_POLL_INTERVAL)
+                    continue
+
+                units = []
+                with lock:
+                    for unit_id, unit in leases:
+                        scenarios = self._scenario_tasks(unit)
+                        held[unit_id] = len(scenarios)
+                        for scenario in scenarios:
+                            owners[(scenario['scan_run_id'], *task_key(scenario))] = unit_id
+                        units.append(unit)
+                self._run_round(
+                    units, set(), None, False, 'sync', True, engine, on_done, on_done_async, on_error
+                )
+                idle_since = time.monotonic()
+
+        stop.set()
+        heartbeat_thread.join()
+        queue.close()
+        progress.close()
+        print(f"\nWorker {worker}: {counts['done']} tasks done | {counts['failed']} failed")
+        self._print_throttle_report()
+        exporter.close()
+        self._print_metrics_summary(worker)
+
+    def aggregate_run(self, scan_run_id: str, snapshot_date: date = None, from_archive: bool = False) -> dict:
+        """把一次扫描聚合为 mart.visibility_snapshots / mart.heatmap_cells (数据来自数据库或本地归档)"""
+        print(f"📊 Aggregating {scan_run_id}")
+        started = time.perf_counter()
+        if from_archive:
+            jobs = read_archive('jobs', scan_run_id, columns=[
+                'id', 'h3_index', 'grid_center_lat', 'grid_center_lng', 'district', 'prompt_type', 'platform'
+            ])
+            results = read_archive('results', scan_run_id, columns=[
+                'id', 'job_id', 'raw_name', 'normalized_name', 'business_id', 'rank_position'
+            ])
+        else:
+            jobs = self.db.get_run_jobs(scan_run_id)
+            results = self.db.get_run_results(scan_run_id)
+        # 分层扫描: 粗格子的结果按覆盖表展开到目标分辨率, 热力图中不混入中间层格子
+        try:
+            coverage = self.db.get_run_coverage(scan_run_id)
+        except Exception as e:
+            coverage = {}
+            print(f"  ✗ Could not load scan coverage, cells are aggregated as scanned: {e}")
+        load_seconds = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        stats = CellStats.from_records(jobs, results)
+        if coverage:
+            stats = stats.expand(coverage)
+        aggregate_seconds = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        sink = create_sink(db=self.db)
+        try:
+            counts = write_aggregates(stats, sink, snapshot_date)
+        finally:
+            sink.close()
+        write_seconds = time.perf_counter() - started
+        
+        levels = ', '.join(f"{table} {n}" for table, n in counts.items() if table.startswith('heatmap_cells_r'))
+        print(
+            f"  {len(jobs)} jobs / {len(results)} results → {counts['visibility_snapshots']} visibility rows, "
+            f"{counts['heatmap_cells']} heatmap rows ({levels})"
+        )
+        print(f"  Load {load_seconds:.1f}s | aggregate {aggregate_seconds:.2f}s | write {write_seconds:.1f}s")
+        return counts
+    
+    def export_run(self, scan_run_id: str, chunk_jobs: int = 5000):
+        """把数据库中的一次扫描导出为本地 Parquet 归档 (覆盖该扫描已有的归档)"""
+        print(f"📦 Exporting {scan_run_id}")
+        started = time.perf_counter()
+        jobs = self.db.get_run_jobs(scan_run_id, columns='*')
+        results = defaultdict(list)
+        for row in self.db.get_run_results(scan_run_id, columns='*'):
+            results[row['job_id']].append(row)
+        load_seconds = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        remove_run(scan_run_id)
+        with ArchiveWriter() as archiver:
+            for i in range(0, len(jobs), chunk_jobs):
+                chunk = jobs[i:i + chunk_jobs]
+                archiver.write(chunk, [r for job in chunk for r in results[job['id']]])
+        print(
+            f"  {archiver.jobs_written} jobs / {archiver.results_written} results → {archiver.files} files | "
+            f"load {load_seconds:.1f}s | write {time.perf_counter() - started:.1f}s"
+        )
+    
+    def compare_packing(
+        self,
+        district: str,
+        platforms: List[str] = None,
+        prompt_types: List[str] = None,
+        sample_cells: int = 10,
+        max_workers: int = 10
+    ) -> dict:
+        """
+        对比打包与单场景请求的结果漂移 (不落库)
         
-        scan_run_id = f"run-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        在抽样格子上对每个平台执行: 单场景 tap 1、单场景 tap 2、打包 tap 1。
+        - packed_rbo: 打包与单场景 tap 1 的排名一致度 (RBO)
+        - repeat_rbo: 单场景两次 tap 之间的一致度, 即模型自身的随机波动
+        drift = repeat_rbo - packed_rbo, 接近 0 说明打包带来的变化不超过正常波动。
+        """
+        platforms = platforms or PLATFORMS
+        prompt_types = prompt_types or PROMPT_TYPES
         grid = self.generate_h3_grid(district)
+        sample = random.Random(0).sample(grid, min(sample_cells, len(grid)))
+        scan_run_id = f"compare-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}"
+        
+        print(f"Comparing packed vs unpacked prompts on {len(sample)} cells of {district}")
+        
+        def ranking(results: List[ScanResult]) -> List[str]:
+            return [r.raw_name for r in sorted(results, key=lambda r: r.rank_position)]
         
-        print(f"Starting scan run: {scan_run_id}")
-        print(f"District: {district}")
-        print(f"Grid cells: {len(grid)}")
-        print(f"Platforms: {platforms}")
-        print(f"Prompt types: {prompt_types}")
-        print(f"Total API calls: {len(grid) * len(platforms) * len(prompt_types) * TAP_COUNT}")
+        def compare_cell(platform: str, h3_index: str, lat: float, lng: float) -> dict:
+            eater = self.eaters[platform]
+            scan_args = dict(h3_index=h3_index, lat=lat, lng=lng, district=district, scan_run_id=scan_run_id)
+            packed = {
+                job.prompt_type: (job, results)
+                for job, results in eater.scan_packed(prompt_types=prompt_types, tap_number=1, **scan_args)
+            }
+            row = {'packed_rbo': [], 'repeat_rbo': [], 'unpacked_tokens': 0, 'packed_tokens': 0}
+            for prompt_type in prompt_types:
+                job1, results1 = eater.scan(prompt_type=prompt_type, tap_number=1, **scan_args)
+                job2, results2 = eater.scan(prompt_type=prompt_type, tap_number=2, **scan_args)
+                packed_job, packed_results = packed[prompt_type]
+                row['packed_rbo'].append(rank_biased_overlap(ranking(results1), ranking(packed_results)))
+                row['repeat_rbo'].append(rank_biased_overlap(ranking(results1), ranking(results2)))
+                row['unpacked_tokens'] += job1.tokens_used or 0
+                row['packed_tokens'] += packed_job.tokens_used or 0
+            return row
         
-        all_jobs = []
-        all_results = []
+        rows = defaultdict(list)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(compare_cell, platform, h3_index, lat, lng): platform
+                for platform in platforms
+                for h3_index, lat, lng in sample
+            }
+            for future in as_completed(futures):
+                platform = futures[future]
+                try:
+                    rows[platform].append(future.result())
+                except Exception as e:
+                    print(f"✗ {platform} | Error: {e}")
+        
+        report = {}
+        for platform, cells in rows.items():
+            packed_rbo = [v for row in cells for v in row['packed_rbo']]
+            repeat_rbo = [v for row in cells for v in row['repeat_rbo']]
+            report[platform] = {
+                'cells': len(cells),
+                'packed_rbo': round(sum(packed_rbo) / len(packed_rbo), 3),
+                'repeat_rbo': round(sum(repeat_rbo) / len(repeat_rbo), 3),
+                'drift': round((sum(repeat_rbo) / len(repeat_rbo)) - (sum(packed_rbo) / len(packed_rbo)), 3),
+                'calls_per_cell': {'unpacked': len(prompt_types), 'packed': 1},
+                'tokens_per_cell': {
+                    'unpacked': sum(row['unpacked_tokens'] for row in cells) // len(cells),
+                    'packed': sum(row['packed_tokens'] for row in cells) // len(cells)
+                }
+            }
         
-        # 生成所有任务
+        print("\nPacked prompt drift (RBO vs unpacked tap 1; repeat = unpacked tap 1 vs tap 2):")
+        for platform, stats in report.items():
+            print(
+                f"  {platform}: packed {stats['packed_rbo']} | repeat {stats['repeat_rbo']} | "
+                f"drift {stats['drift']:+.3f} | calls/cell {stats['calls_per_cell']['unpacked']} → 1 | "
+                f"tokens/cell {stats['tokens_per_cell']['unpacked']} → {stats['tokens_per_cell']['packed']}"
+            )
+        return report
+    
+    def _build_tasks(
+        self,
+        cells: List[Tuple[str, float, float]],
+        district: str,
+        platforms: List[str],
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_count: int
+    ) -> List[dict]:
+        """为一组格子生成扫描任务"""
         tasks = []
-        for h3_index, lat, lng in grid:
+        for h3_index, lat, lng in cells:
             for platform in platforms:
                 for prompt_type in prompt_types:
-                    for tap in range(1, TAP_COUNT + 1):
+                    for tap in range(1, tap_count + 1):
                         tasks.append({
                             'h3_index': h3_index,
                             'lat': lat,
@@ -109,50 +755,575 @@ class Orchestrator:
                             'scan_run_id': scan_run_id,
                             'tap_number': tap
                         })
+        return tasks
+    
+    def _task_from_key(self, key: tuple, district: str, scan_run_id: str) -> dict:
+        """由任务日志中的 key 还原任务"""
+        h3_index, platform, prompt_type, tap = key
+        lat, lng = h3.cell_to_latlng(h3_index)
+        return {
+            'h3_index': h3_index,
+            'lat': lat,
+            'lng': lng,
+            'district': district,
+            'platform': platform,
+            'prompt_type': prompt_type,
+            'scan_run_id': scan_run_id,
+            'tap_number': tap
+        }
+    
+    def _run_round(
+        self,
+        tasks: List[dict],
+        completed: set,
+        sampler: AdaptiveSampler,
+        packed: bool,
+        mode: str,
+        parallel: bool,
+        engine: str,
+        on_done,
+        on_done_async,
+        on_error,
+        budget: ScanBudget = None,
+        priority: CellPriority = None
+    ) -> int:
+        """
+        执行一批任务 (分层扫描时每一层一批)
         
-        if parallel:
-            # 并行执行
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                futures = {
-                    executor.submit(self._execute_single_scan, task): task 
-                    for task in tasks
-                }
-                
-                for future in as_completed(futures):
-                    task = futures[future]
+        Returns:
+            因预算不足而未派发的任务数
+        """
+        # 自适应采样的调度单位是 (格子, 平台, 场景) 序列, 打包模式是 (格子, 平台, tap)
+        if sampler:
+            units = self._group_series(tasks, completed)
+        elif packed:
+            units = self._pack_tasks(tasks)
+        else:
+            units = tasks
+        
+        if mode == 'batch':
+            batch_groups, units = self._split_batch_tasks(units)
+        elif mode == 'sync':
+            batch_groups = {}
+        else:
+            raise ValueError(f"Unknown mode: {mode}")
+        
+        # 预算模式: 引擎从调度器按优先级取任务, 预算用完即停止派发
+        if budget:
+            units = BudgetScheduler(units, budget, priority)
+        
+        # 批处理平台在后台线程提交和轮询, 同时实时接口照常执行
+        with ThreadPoolExecutor(max_workers=max(1, len(batch_groups))) as batch_pool:
+            batch_futures = [
+                batch_pool.submit(self._run_batch, platform, group, on_done, on_error)
+                for platform, group in batch_groups.items()
+            ]
+            
+            if not parallel:
+                self._run_serial(units, on_done, on_error, sampler)
+            elif engine == 'async':
+                self._run_coroutine(self._run_async(units, on_done_async, on_error, sampler))
+            elif engine == 'thread':
+                self._run_threaded(units, on_done, on_error, sampler)
+            else:
+                raise ValueError(f"Unknown engine: {engine}")
+            
+            for future in batch_futures:
+                future.result()
+        
+        return units.pending() if budget else 0
+    
+    @contextmanager
+    def _event_loop(self):
+        """
+        一次运行 (全部分层轮次 / worker 的全部租约批次) 共用一个事件循环
+        
+        eater 缓存的异步客户端绑定在创建它的循环上, 每轮 asyncio.run 会让之后的请求
+        全部失败于 "Event loop is closed"; 结束时在同一个循环里关闭这些客户端。
+        """
+        if self._loop is not None:
+            yield self._loop
+            return
+        loop = asyncio.new_event_loop()
+        self._loop = loop
+        try:
+            yield loop
+        finally:
+            try:
+                loop.run_until_complete(self._close_async_clients())
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                self._loop = None
+                loop.close()
+    
+    def _run_coroutine(self, coro):
+        """在本次运行的事件循环里执行 (不在 _event_loop 中时临时建一个)"""
+        with self._event_loop() as loop:
+            return loop.run_until_complete(coro)
+    
+    async def _close_async_clients(self):
+        for eater in self.eaters.values():
+            aclose = getattr(eater, 'aclose', None)
+            if aclose is None:
+                continue
+            try:
+                await aclose()
+            except Exception as e:
+                print(f"✗ Could not close {eater.PLATFORM} client: {e}")
+    
+    def _refine_hierarchy(self, plan: ScanPlan, level: List[str], run_round):
+        """逐层细分分层网格, 每层扫描完成后再决定下一层"""
+        hierarchy, district = plan.hierarchy, plan.district
+        try:
+            hierarchy.set_businesses(
+                (float(b['lat']), float(b['lng'])) for b in self.db.get_businesses(district)
+            )
+        except Exception as e:
+            print(f"  ✗ Could not load business density: {e}")
+        
+        while True:
+            cells = hierarchy.refine(level)
+            if not cells:
+                break
+            print(f"\nRefining {len(cells)} cells at res {h3.get_resolution(cells[0][0])}")
+            tasks = self._build_tasks(
+                cells, district, plan.platforms, plan.prompt_types, plan.scan_run_id, plan.tap_count
+            )
+            self.journal.add_tasks(plan.scan_run_id, tasks)
+            run_round(tasks)
+            level = [cell for cell, _, _ in cells]
+    
+    def _cell_priority(self, district: str, prior_run: str, budget: ScanBudget) -> CellPriority:
+        """预算调度的格子价值: 已建档商户密度; 有上次扫描时加上 tap 间波动, 并用其 token 用量校准估算"""
+        priority = CellPriority()
+        try:
+            priority.set_businesses(
+                ((float(b['lat']), float(b['lng'])) for b in self.db.get_businesses(district)),
+                range(min(HIERARCHICAL_START_RESOLUTION, H3_RESOLUTION), H3_RESOLUTION + 1)
+            )
+        except Exception as e:
+            print(f"  ✗ Could not load businesses for prioritization: {e}")
+        if not prior_run:
+            return priority
+        try:
+            jobs = self.db.get_run_jobs(
+                prior_run, columns='id,h3_index,platform,prompt_type,tap_number,tokens_used,packed'
+            )
+            priority.set_prior_run(jobs, self.db.get_run_results(prior_run, columns='job_id,raw_name,rank_position'))
+        except Exception as e:
+            print(f"  ✗ Could not load prior run {prior_run}: {e}")
+            return priority
+        tokens = defaultdict(list)
+        for job in jobs:
+            if job.get('tokens_used') and not job.get('packed'):
+                tokens[job['platform']].append(job['tokens_used'])
+        for platform, used in tokens.items():
+            budget.seed(platform, sum(used) / len(used), len(used))
+        print(
+            f"  Prior run {prior_run}: {len(priority.volatility)} series with tap volatility, "
+            f"token estimates for {sorted(tokens)}"
+        )
+        return priority
+    
+    def _merchant_grid(self, merchant: str, rings: int) -> MerchantGrid:
+        """由 stg.businesses 中的商户生成商户中心网格"""
+        business = self.db.get_business(merchant)
+        if business is None:
+            raise ValueError(f"Unknown business: {merchant} (expected stg.businesses id or google_place_id)")
+        return MerchantGrid.around(business, rings)
+    
+    def _print_local_visibility(self, merchant_grid: MerchantGrid, scan_run_id: str) -> dict:
+        """从数据库读取本次扫描 (位置补全之后), 计算并输出 V_local"""
+        try:
+            jobs = self.db.get_run_jobs(scan_run_id, columns='id,h3_index,platform,prompt_type')
+            results = self.db.get_run_results(
+                scan_run_id, columns='id,job_id,raw_name,normalized_name,google_place_id'
+            )
+        except Exception as e:
+            print(f"\n✗ Could not load the run for V_local: {e}")
+            return {}
+        
+        report = merchant_grid.visibility(jobs, results)
+        print(
+            f"\nLocal visibility: {report['official_name']} | V_local {report['v_local']} "
+            f"over {report['points']} points"
+        )
+        print(f"  By platform: {report['by_platform']}")
+        print(f"  By prompt type: {report['by_prompt_type']}")
+        for cell in report['cells']:
+            print(
+                f"  {cell['h3_index']} | ring {cell['grid_distance']} | {cell['distance_m']:.0f} m | "
+                f"weight {cell['weight']:.2f} | mentioned {cell['mention_rate']:.0%} of {cell['taps']} jobs"
+            )
+        return report
+    
+    def _print_budget_report(self, budget: ScanBudget, deferred: int):
+        """输出预算花费与未派发的任务"""
+        report = budget.report()
+        total = report.pop('total')
+        limit = f" / {total['limit']}" if total['limit'] is not None else ''
+        print(
+            f"\nBudget ({budget.unit}): spent {total['spent']}{limit} | {total['calls']} calls | "
+            f"{total['tokens']} tokens | {deferred} tasks deferred"
+        )
+        for platform, stats in report.items():
+            limit = f" / {stats['limit']}" if stats['limit'] is not None else ''
+            print(
+                f"  {platform}: spent {stats['spent']}{limit} | {stats['calls']} calls | "
+                f"{stats['tokens']} tokens"
+            )
+        if deferred:
+            print("  Deferred tasks stay pending; continue with --resume and a new --budget")
+    
+    def _print_metrics_summary(self, name: str) -> dict:
+        """输出按平台的延迟 / 吞吐 / 错误摘要, 完整 JSON 写入 METRICS_SUMMARY_DIR/<name>.json"""
+        summary = get_metrics().summary()
+        print(f"\nRun metrics ({summary['elapsed_seconds']}s):")
+        for platform, stats in sorted(summary['platforms'].items()):
+            latency = stats.get('latency') or {}
+            errors = f" {stats['errors']}" if stats['errors'] else ''
+            print(
+                f"  {platform}: {stats['requests']} requests | latency p50 {latency.get('p50', '-')}s "
+                f"p95 {latency.get('p95', '-')}s | {stats['tokens_per_second']} tokens/s | "
+                f"{stats['retries']} retries | {stats['tasks_failed']} failed tasks{errors}"
+            )
+        database = summary['database']
+        flush = database['flush_seconds'] or {}
+        print(
+            f"  database: {database['flushes']} flushes | p50 {flush.get('p50', '-')}s p95 {flush.get('p95', '-')}s | "
+            f"writer blocked {database['writer_blocked_seconds']}s | {database['failed_callbacks']} failed callbacks"
+        )
+        if summary['places']:
+            print(f"  places: {summary['places']}")
+        try:
+            METRICS_SUMMARY_DIR.mkdir(parents=True, exist_ok=True)
+            path = METRICS_SUMMARY_DIR / f'{name}.json'
+            path.write_text(json.dumps(summary, indent=2))
+            print(f"  Summary: {path}")
+        except OSError as e:
+            print(f"  ✗ Could not write metrics summary: {e}")
+        return summary
+    
+    def _print_throttle_report(self):
+        """输出各平台限流、连接与回复解析统计"""
+        print("\nRate limiting:")
+        for platform, stats in throttle_report().items():
+            print(
+                f"  {platform}: {stats['requests']} requests | {stats['throttled']} throttled | "
+                f"{stats['retries']} retried | {stats['gave_up']} gave up | "
+                f"waited {stats['wait_seconds']}s | concurrency {stats['concurrency']} "
+                f"(min {stats['min_concurrency']})"
+            )
+        
+        print("\nHTTP connections:")
+        for host, stats in transport_stats().items():
+            print(
+                f"  {host}: {stats['requests']} requests | {stats['connections']} connections | "
+                f"{stats['reused']} reused"
+            )
+        
+        report = parse_report()
+        if report:
+            print("\nResponse parsing:")
+            for platform, stats in report.items():
+                recovered = stats['fenced'] + stats['embedded'] + stats['repaired']
+                print(
+                    f"  {platform}: {stats['total']} responses | {stats['strict']} strict | "
+                    f"{recovered} recovered ({stats['fenced']} fenced, {stats['embedded']} embedded, "
+                    f"{stats['repaired']} repaired) | {stats['failed']} failed ({stats['failure_rate']}%)"
+                )
+    
+    def _run_serial(self, tasks: List[dict], on_done, on_error, sampler: AdaptiveSampler = None):
+        """串行执行"""
+        for task in tasks:
+            if sampler:
+                self._run_series(task, sampler, on_done, on_error)
+                continue
+            try:
+                records = self._execute_task(task)
+            except Exception as e:
+                on_error(task, e)
+                continue
+            for scenario_task, job, results in records:
+                on_done(scenario_task, job, results)
+    
+    def _run_threaded(
+        self,
+        tasks: List[dict],
+        on_done,
+        on_error,
+        sampler: AdaptiveSampler = None,
+        max_workers: int = 10
+    ):
+        """
+        线程池并行执行 (调用各 GoldEater 的阻塞 scan)
+        
+        只保持 max_workers * 2 个已提交的任务, on_done 阻塞 (落库背压) 时
+        不再继续提交新任务。自适应采样时每个序列在工作线程内完成并自行回调。
+        tasks 是 BudgetScheduler 时每次补充都重新向它取任务 (在途任务记账后可能腾出预算)。
+        """
+        pending_tasks = iter(tasks)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            
+            def take(n: int):
+                if not isinstance(tasks, BudgetScheduler):
+                    return islice(pending_tasks, n)
+                taken = []
+                while len(taken) < n and (task := tasks.next()) is not None:
+                    taken.append(task)
+                return taken
+            
+            def submit_next(n: int):
+                for task in take(n):
+                    if sampler:
+                        future = executor.submit(self._run_series, task, sampler, on_done, on_error)
+                    else:
+                        future = executor.submit(self._execute_task, task)
+                    futures[future] = task
+            
+            submit_next(max_workers * 2)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = futures.pop(future)
+                    if sampler:
+                        future.result()
+                        continue
                     try:
-                        job, results = future.result()
-                        all_jobs.append(job)
-                        all_results.extend(results)
-                        print(f"✓ {task['platform']} | {task['h3_index'][:8]}... | {task['prompt_type']} | tap{task['tap_number']}")
+                        records = future.result()
                     except Exception as e:
-                        print(f"✗ {task['platform']} | {task['h3_index'][:8]}... | Error: {e}")
+                        on_error(task, e)
+                        continue
+                    for scenario_task, job, results in records:
+                        on_done(scenario_task, job, results)
+                submit_next(len(done))
+    
+    async def _run_async(self, tasks: List[dict], on_done, on_error, sampler: AdaptiveSampler = None):
+        """
+        单事件循环执行所有任务
+        
+        每个平台一组 worker 协程, worker 数量即该平台的并发上限
+        (PLATFORM_CONCURRENCY), 各平台互不阻塞。自适应采样时队列元素是序列,
+        一个 worker 依次执行序列内的 tap。tasks 是 BudgetScheduler 时 worker 逐个向它取任务。
+        """
+        if isinstance(tasks, BudgetScheduler):
+            scheduler = tasks
+            counts = {platform: scheduler.pending(platform) for platform in scheduler.platforms()}
         else:
-            # 串行执行
+            queues = defaultdict(deque)
             for task in tasks:
+                queues[task['platform']].append(task)
+            counts = {platform: len(queue) for platform, queue in queues.items()}
+            scheduler = None
+        
+        def take(platform: str):
+            if scheduler:
+                return scheduler.next(platform)
+            queue = queues[platform]
+            return queue.popleft() if queue else None
+        
+        async def worker(platform: str):
+            while (task := take(platform)) is not None:
+                if sampler:
+                    await self._run_series_async(task, sampler, on_done, on_error)
+                    continue
                 try:
-                    job, results = self._execute_single_scan(task)
-                    all_jobs.append(job)
-                    all_results.extend(results)
-                    print(f"✓ {task['platform']} | {task['h3_index'][:8]}... | {task['prompt_type']}")
+                    records = await self._execute_task_async(task)
                 except Exception as e:
-                    print(f"✗ {task['platform']} | Error: {e}")
+                    on_error(task, e)
+                    continue
+                for scenario_task, job, results in records:
+                    await on_done(scenario_task, job, results)
         
-        # 保存到数据库
-        print(f"\nSaving {len(all_jobs)} jobs and {len(all_results)} results to database...")
-        for job in all_jobs:
-            self.db.insert_scan_job(job)
-        self.db.insert_scan_results(all_results)
+        workers = []
+        for platform, count in counts.items():
+            limit = PLATFORM_CONCURRENCY.get(platform, 10)
+            workers.extend(worker(platform) for _ in range(min(limit, count)))
         
-        # 补全位置信息
-        print("\nResolving business locations...")
-        self._resolve_locations(all_results, district)
+        await asyncio.gather(*workers)
+    
+    def _group_series(self, tasks: List[dict], completed: set) -> List[dict]:
+        """
+        按 (格子, 平台, 场景) 把 tap 任务组成采样序列
         
-        print(f"\n✅ Scan complete: {scan_run_id}")
-        return scan_run_id
+        序列是一个带 platform 字段的 dict, tasks 为待执行的 tap, last_tap 为已登记的最大 tap
+        (包括续跑前已完成的), 新增 tap 从 last_tap + 1 开始编号; calls 为本进程中已执行的 tap 数。
+        """
+        series = {}
+        for task in tasks:
+            key = task_key(task)[:3]
+            entry = series.setdefault(key, {'platform': task['platform'], 'tasks': [], 'last_tap': 0, 'calls': 0})
+            entry['tasks'].append(task)
+            entry['last_tap'] = max(entry['last_tap'], task['tap_number'])
+        for h3_index, platform, prompt_type, tap in completed:
+            entry = series.get((h3_index, platform, prompt_type))
+            if entry:
+                entry['last_tap'] = max(entry['last_tap'], tap)
+        for entry in series.values():
+            entry['tasks'].sort(key=lambda t: t['tap_number'])
+        return list(series.values())
+    
+    def _run_series(self, series: dict, sampler: AdaptiveSampler, on_done, on_error):
+        """顺序执行一个采样序列, 直到 sampler 给出停止原因"""
+        queue = deque(series['tasks'])
+        rankings = []
+        while queue:
+            task = queue.popleft()
+            series['calls'] += 1
+            try:
+                job, results = self._execute_single_scan(task)
+            except Exception as e:
+                on_error(task, e)
+                self._sample_failed(series, sampler, queue)
+                continue
+            self._sample_step(series, task, job, results, rankings, sampler, queue)
+            on_done(task, job, results)
+    
+    async def _run_series_async(self, series: dict, sampler: AdaptiveSampler, on_done, on_error):
+        """顺序执行一个采样序列 (异步)"""
+        queue = deque(series['tasks'])
+        rankings = []
+        while queue:
+            task = queue.popleft()
+            series['calls'] += 1
+            try:
+                job, results = await self._execute_single_scan_async(task)
+            except Exception as e:
+                on_error(task, e)
+                self._sample_failed(series, sampler, queue)
+                continue
+            self._sample_step(series, task, job, results, rankings, sampler, queue)
+            await on_done(task, job, results)
+    
+    def _sample_step(
+        self,
+        series: dict,
+        task: dict,
+        job: ScanJob,
+        results: List[ScanResult],
+        rankings: List[List[str]],
+        sampler: AdaptiveSampler,
+        queue: deque
+    ):
+        """记录本次 tap 的排名; 已登记的 tap 全部完成后决定停止或追加下一个 tap"""
+        ranking = [r.raw_name for r in sorted(results, key=lambda r: r.rank_position)]
+        if rankings:
+            job.tap_agreement = round(sampler.agreement(rankings[-1], ranking), 4)
+        rankings.append(ranking)
+        if queue:
+            return
+        
+        reason = sampler.decide(rankings, series['last_tap'])
+        if reason:
+            job.stop_reason = reason
+            sampler.record(series['calls'], reason)
+            return
+        
+        series['last_tap'] += 1
+        next_task = dict(task, tap_number=series['last_tap'])
+        self.journal.add_tasks(task['scan_run_id'], [next_task])
+        queue.append(next_task)
+    
+    def _sample_failed(self, series: dict, sampler: AdaptiveSampler, queue: deque):
+        """最后一个 tap 失败时序列结束, 不再经过 _sample_step, 按 failed 计入采样统计"""
+        if not queue:
+            sampler.record_failed(series['calls'])
+    
+    def _split_batch_tasks(self, tasks: List[dict]) -> Tuple[dict, List[dict]]:
+        """拆分为 {平台: 批处理任务} 和仍走实时接口的任务"""
+        groups = defaultdict(list)
+        sync_tasks = []
+        for task in tasks:
+            if getattr(self.eaters[task['platform']], 'SUPPORTS_BATCH', False):
+                groups[task['platform']].append(task)
+            else:
+                sync_tasks.append(task)
+        for platform, group in groups.items():
+            print(f"  {platform}: {len(group)} tasks via batch API")
+        return dict(groups), sync_tasks
+    
+    def _run_batch(self, platform: str, tasks: List[dict], on_done, on_error):
+        """提交一个平台的批处理任务并等待结果"""
+        for task in tasks:
+            self.journal.mark_in_flight(task['scan_run_id'], task)
+        try:
+            BatchRunner(self.eaters[platform], tasks[0]['scan_run_id']).run(tasks, on_done, on_error)
+        except Exception as e:
+            # 已提交的批次记录在 manifest 中, --resume 时重新挂接
+            print(f"✗ {platform} batch run aborted: {e}")
+    
+    def _pack_tasks(self, tasks: List[dict]) -> List[dict]:
+        """把同一 (格子, 平台, tap) 的各场景任务合并为一个打包任务"""
+        packed = {}
+        for task in tasks:
+            key = (task['h3_index'], task['platform'], task['tap_number'])
+            if key not in packed:
+                packed[key] = dict(task, prompt_type='packed', prompt_types=[])
+            packed[key]['prompt_types'].append(task['prompt_type'])
+        return list(packed.values())
+    
+    def _scenario_tasks(self, task: dict) -> List[dict]:
+        """打包任务展开为各场景任务 (任务日志按场景记录)"""
+        if 'prompt_types' not in task:
+            return [task]
+        base = {k: v for k, v in task.items() if k != 'prompt_types'}
+        return [dict(base, prompt_type=prompt_type) for prompt_type in task['prompt_types']]
+    
+    def _execute_task(self, task: dict) -> List[Tuple[dict, ScanJob, List[ScanResult]]]:
+        """执行一个调度任务 (单场景或打包), 返回 (场景任务, job, results) 列表"""
+        if 'prompt_types' not in task:
+            return [(task, *self._execute_single_scan(task))]
+        task['started'] = time.monotonic()
+        scenario_tasks = self._scenario_tasks(task)
+        for scenario_task in scenario_tasks:
+            self.journal.mark_in_flight(task['scan_run_id'], scenario_task)
+        records = self.eaters[task['platform']].scan_packed(
+            h3_index=task['h3_index'],
+            lat=task['lat'],
+            lng=task['lng'],
+            district=task['district'],
+            prompt_types=task['prompt_types'],
+            scan_run_id=task['scan_run_id'],
+            tap_number=task['tap_number']
+        )
+        self._record_packed_parse(task, records)
+        return [(t, job, results) for t, (job, results) in zip(scenario_tasks, records)]
+    
+    async def _execute_task_async(self, task: dict) -> List[Tuple[dict, ScanJob, List[ScanResult]]]:
+        """_execute_task 的异步版本"""
+        if 'prompt_types' not in task:
+            return [(task, *await self._execute_single_scan_async(task))]
+        task['started'] = time.monotonic()
+        scenario_tasks = self._scenario_tasks(task)
+        for scenario_task in scenario_tasks:
+            self.journal.mark_in_flight(task['scan_run_id'], scenario_task)
+        records = await self.eaters[task['platform']].scan_packed_async(
+            h3_index=task['h3_index'],
+            lat=task['lat'],
+            lng=task['lng'],
+            district=task['district'],
+            prompt_types=task['prompt_types'],
+            scan_run_id=task['scan_run_id'],
+            tap_number=task['tap_number']
+        )
+        self._record_packed_parse(task, records)
+        return [(t, job, results) for t, (job, results) in zip(scenario_tasks, records)]
+    
+    def _record_parse(self, job: ScanJob):
+        """记录单场景 job 的解析策略; 打包拆出的场景 job 不重复记录"""
+        if not job.packed:
+            record_parse(job.platform, job.parse_strategy)
+    
+    def _record_packed_parse(self, task: dict, records: List[Tuple[ScanJob, List[ScanResult]]]):
+        """一次打包调用只解析一段回复, 记录一次 (各场景 job 的 parse_strategy 相同)"""
+        if records:
+            record_parse(task['platform'], records[0][0].parse_strategy)
     
     def _execute_single_scan(self, task: dict) -> Tuple[ScanJob, List[ScanResult]]:
         """执行单次扫描"""
+        task['started'] = time.monotonic()
+        self.journal.mark_in_flight(task['scan_run_id'], task)
         eater = self.eaters[task['platform']]
         return eater.scan(
             h3_index=task['h3_index'],
@@ -164,62 +1335,269 @@ class Orchestrator:
             tap_number=task['tap_number']
         )
     
-    def _resolve_locations(self, results: List[ScanResult], district: str):
-        """补全所有结果的位置信息"""
-        # 去重 raw_name
-        unique_names = set(r.raw_name for r in results if r.raw_name)
+    async def _execute_single_scan_async(self, task: dict) -> Tuple[ScanJob, List[ScanResult]]:
+        """执行单次扫描 (异步)"""
+        task['started'] = time.monotonic()
+        self.journal.mark_in_flight(task['scan_run_id'], task)
+        eater = self.eaters[task['platform']]
+        return await eater.scan_async(
+            h3_index=task['h3_index'],
+            lat=task['lat'],
+            lng=task['lng'],
+            district=task['district'],
+            prompt_type=task['prompt_type'],
+            scan_run_id=task['scan_run_id'],
+            tap_number=task['tap_number']
+        )
+    
+    def _run_names(self, scan_run_id: str) -> Tuple[Dict[str, Set[str]], Dict[str, Set[str]]]:
+        """位置补全的输入: raw_name → 出现的格子 / job, 从本次运行落库的结果读取"""
+        try:
+            return self.db.get_run_names(scan_run_id)
+        except Exception as e:
+            print(f"  ✗ Could not load result names: {e}")
+            return {}, {}
+    
+    def _resolve_locations(
+        self,
+        raw_names: Dict[str, Set[str]],
+        name_jobs: Dict[str, Set[str]],
+        district: str,
+        sweep_cells: List[str] = None
+    ):
+        """
+        补全本次运行所有 raw_name 的位置信息
+        
+        1. 建立 规范化名称 → raw_name 列表 的索引, 每个规范化名称只解析一次
+        2. 用 Nearby Search 扫描区域建立地名录 (已扫描过的格子跳过)
+        3. 在 Places 限流额度内并发解析: 解析缓存 → 地名录模糊匹配 → Text Search,
+           Text Search 以出现该名称的扫描格子的中心为搜索点
+        4. 批量 upsert 商户, 并发按 raw_name 回写本次运行中尚未补全的结果行
+        
+        Args:
+            raw_names: raw_name → 出现该名称的扫描格子
+            name_jobs: raw_name → 出现该名称的 job (回写范围限于这些 job)
+            sweep_cells: 建立地名录的范围 (默认整个区域的网格)
+        """
+        started = time.perf_counter()
+        
+        index = defaultdict(list)
+        for name in raw_names:
+            if name:
+                index[normalize_name(name)].append(name)
         
-        for name in unique_names:
+        # 用已建档商户预热解析缓存, 已知商户不再调用 Places API
+        try:
+            warmed = self.places_eater.warm_start_cache(self.db.get_businesses(district))
+            print(f"  Resolution cache warmed with {warmed} known names")
+        except Exception as e:
+            print(f"  ✗ Could not warm resolution cache: {e}")
+        
+        max_workers = PLATFORM_CONCURRENCY.get('places', 8)
+        if self.places_eater.gazetteer is not None:
             try:
-                # 使用区域中心点搜索
-                bounds = DISTRICT_BOUNDS[district]
-                business = self.places_eater.resolve_and_create_business(
-                    raw_name=name,
-                    lat=bounds['center']['lat'],
-                    lng=bounds['center']['lng'],
-                    district=district
+                cells = sweep_cells or [cell for cell, _, _ in district_grid(district, H3_RESOLUTION)]
+                sweep = self.places_eater.sweep_district(district, cells, max_workers=max_workers)
+                print(
+                    f"  Gazetteer: {sweep['venues']} venues | swept {sweep['cells']} cells "
+                    f"with {sweep['calls']} Nearby Search calls"
+                )
+            except Exception as e:
+                print(f"  ✗ Could not build gazetteer: {e}")
+        
+        center = load_district(district).center
+        counts = {'resolved': 0, 'unresolved': 0, 'error': 0}
+        resolved = []
+        
+        def search_point(names: List[str]) -> Tuple[float, float, Set[str]]:
+            """出现该名称的格子的中心 (没有格子时用区域中心)"""
+            cells = set().union(*(raw_names.get(name, ()) for name in names))
+            if not cells:
+                return center['lat'], center['lng'], cells
+            points = [h3.cell_to_latlng(cell) for cell in cells]
+            return sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points), cells
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for names in index.values():
+                lat, lng, cells = search_point(names)
+                future = executor.submit(
+                    self.places_eater.resolve_and_create_business,
+                    raw_name=names[0],
+                    lat=lat,
+                    lng=lng,
+                    district=district,
+                    cells=cells
                 )
-                
+                futures[future] = names
+            for future in as_completed(futures):
+                names = futures[future]
+                try:
+                    business = future.result()
+                except Exception as e:
+                    counts['error'] += 1
+                    print(f"  ✗ Error resolving {names[0]}: {e}")
+                    continue
                 if business:
-                    # 更新所有匹配的结果
-                    for r in results:
-                        if r.raw_name == name:
-                            r.google_place_id = business.google_place_id
-                            r.business_lat = business.lat
-                            r.business_lng = business.lng
-                            r.business_address = business.address
-                            r.normalized_name = business.official_name
-                    
-                    # 保存商户
-                    self.db.upsert_business(business)
-                    print(f"  ✓ Resolved: {name} → {business.official_name}")
+                    counts['resolved'] += 1
+                    resolved.append((names, business))
                 else:
-                    print(f"  ✗ Not found (hallucination?): {name}")
-                    
-            except Exception as e:
-                print(f"  ✗ Error resolving {name}: {e}")
-
+                    counts['unresolved'] += 1
+        resolve_seconds = time.perf_counter() - started
+        
+        # 保存商户 (按 google_place_id 去重后批量 upsert)
+        write_started = time.perf_counter()
+        businesses = {business.google_place_id: business for _, business in resolved}
+        business_ids = {}
+        if businesses:
+            self.db.upsert_businesses(list(businesses.values()))
+            # 聚合按 business_id 生成 mart.visibility_snapshots, 回写 stg.businesses 的主键
+            business_ids = self.db.get_business_ids(list(businesses))
+        
+        # 更新所有匹配的结果
+        patches = [
+            (name, {
+                'business_id': business_ids.get(business.google_place_id),
+                'google_place_id': business.google_place_id,
+                'business_lat': business.lat,
+                'business_lng': business.lng,
+                'business_address': business.address,
+                'normalized_name': business.official_name
+            }, name_jobs.get(name, ()))
+            for names, business in resolved
+            for name in names
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda patch: self.db.update_result_locations_by_name(*patch), patches))
+        write_seconds = time.perf_counter() - write_started
+        
+        print(
+            f"  {len(index)} unique names: {counts['resolved']} resolved | "
+            f"{counts['unresolved']} not found (hallucination?) | {counts['error']} errors"
+        )
+        print(
+            f"  Resolve {resolve_seconds:.1f}s | save {len(businesses)} businesses + "
+            f"{len(patches)} result patches {write_seconds:.1f}s"
+        )
+        print(f"  Resolution cache: {self.places_eater.cache.stats()}")
+        if self.places_eater.gazetteer is not None:
+            print(f"  Gazetteer matches: {self.places_eater.gazetteer.stats()}")
 
 if __name__ == '__main__':
     import argparse
     
     parser = argparse.ArgumentParser(description='GoldEater Orchestrator')
-    parser.add_argument('--district', default='surry_hills', help='District to scan')
+    parser.add_argument('--district', default='surry_hills',
+                        help='District to scan (districts/<name>.geojson)')
     parser.add_argument('--platforms', nargs='+', help='Platforms to scan')
     parser.add_argument('--prompt-types', nargs='+', help='Prompt types to scan')
     parser.add_argument('--full-scan', action='store_true', help='Run full scan')
+    parser.add_argument('--precompute-grids', action='store_true',
+                        help='Build the grid cache for every district in districts/')
+    parser.add_argument('--aggregate', metavar='SCAN_RUN_ID',
+                        help='Aggregate a finished run into mart.visibility_snapshots / mart.heatmap_cells')
+    parser.add_argument('--from-archive', action='store_true',
+                        help='Read the run for --aggregate from the local Parquet archive instead of the database')
+    parser.add_argument('--export-run', metavar='SCAN_RUN_ID',
+                        help='Export a run from the database into the local Parquet archive')
+    parser.add_argument('--archive', action='store_true',
+                        help='Also write scan results to the local Parquet archive (ARCHIVE_DIR)')
+    parser.add_argument('--snapshot-date', type=date.fromisoformat,
+                        help='Snapshot date for --aggregate (default: today)')
     parser.add_argument('--no-parallel', action='store_true', help='Disable parallel execution')
+    parser.add_argument('--resume', metavar='SCAN_RUN_ID',
+                        help='Resume an interrupted scan run, skipping completed tasks')
+    parser.add_argument('--cache-mode', choices=CACHE_MODES,
+                        help='LLM response cache mode (default: RESPONSE_CACHE_MODE env or off)')
+    parser.add_argument('--engine', choices=['async', 'thread'], default='async',
+                        help='Parallel engine (thread = ThreadPoolExecutor fallback)')
+    parser.add_argument('--mode', choices=['sync', 'batch'], default='sync',
+                        help='batch = submit to OpenAI / Anthropic batch APIs, other platforms stay sync')
+    parser.add_argument('--grid', choices=['flat', 'hierarchical'], default='flat',
+                        help='hierarchical = scan coarse H3 cells first, refine only where results differ')
+    parser.add_argument('--packed', action='store_true',
+                        help='Answer all prompt types in one call per cell/platform/tap')
+    parser.add_argument('--compare-packing', action='store_true',
+                        help='Measure packed vs unpacked result drift on a sample of cells (not saved)')
+    parser.add_argument('--sample-cells', type=int, default=10,
+                        help='Cells sampled by --compare-packing')
+    parser.add_argument('--live-aggregate', action='store_true',
+                        help='Publish partial heatmaps while the scan runs (every AGGREGATE_SNAPSHOT_INTERVAL s)')
+    parser.add_argument('--sampling', choices=['fixed', 'adaptive'], default='fixed',
+                        help='adaptive = add taps until successive rankings agree (RBO), up to ADAPTIVE_MAX_TAPS')
+    parser.add_argument('--budget', action='append', metavar='[PLATFORM=]AMOUNT',
+                        help='Spend cap for --full-scan / --resume, total or per platform (repeatable); '
+                             'tasks run in priority order until the budget is used')
+    parser.add_argument('--budget-unit', choices=['usd', 'tokens'], default='usd',
+                        help='Unit of --budget (usd priced from PLATFORM_PRICING)')
+    parser.add_argument('--prior-run', metavar='SCAN_RUN_ID',
+                        help='Earlier run used by --budget for tap volatility and token estimates')
+    parser.add_argument('--merchant', metavar='BUSINESS',
+                        help='Scan only a grid_disk around one business (stg.businesses id or google_place_id) '
+                             'and report its distance-weighted V_local')
+    parser.add_argument('--rings', type=int, default=MERCHANT_GRID_RINGS,
+                        help='Rings around the business for --merchant (1 = 7 points, 2 = 19 points)')
+    parser.add_argument('--distributed', action='store_true',
+                        help='With --full-scan: enqueue tasks into WORK_QUEUE_URL for --worker processes and wait')
+    parser.add_argument('--worker', action='store_true',
+                        help='Lease and run tasks from WORK_QUEUE_URL until idle for WORKER_IDLE_EXIT seconds')
     
     args = parser.parse_args()
     
+    if args.cache_mode:
+        get_response_cache().mode = args.cache_mode
+    
+    if args.precompute_grids:
+        for name in list_districts():
+            started = time.perf_counter()
+            cells, _, _ = district_grid_arrays(name, H3_RESOLUTION)
+            print(f"{name}: {len(cells)} cells at res {H3_RESOLUTION} ({time.perf_counter() - started:.3f}s)")
+        raise SystemExit(0)
+    
     orchestrator = Orchestrator()
     
-    if args.full_scan:
+    if args.worker:
+        orchestrator.run_worker(engine=args.engine)
+    elif args.full_scan and args.distributed:
+        if args.merchant:
+            parser.error('--merchant scans run in-process; drop --distributed')
+        if args.mode != 'sync' or args.sampling != 'fixed' or args.grid != 'flat':
+            parser.error('--distributed supports flat grids with fixed sampling in sync mode (optionally --packed)')
+        orchestrator.enqueue_scan(
+            district=args.district,
+            platforms=args.platforms,
+            prompt_types=args.prompt_types,
+            packed=args.packed
+        )
+    elif args.full_scan or args.resume or args.merchant:
         orchestrator.run_full_scan(
             district=args.district,
             platforms=args.platforms,
             prompt_types=args.prompt_types,
-            parallel=not args.no_parallel
+            parallel=not args.no_parallel,
+            engine=args.engine,
+            resume=args.resume,
+            mode=args.mode,
+            sampling=args.sampling,
+            grid_mode=args.grid,
+            packed=args.packed,
+            live_aggregate=args.live_aggregate,
+            archive=args.archive,
+            budget=ScanBudget(parse_budget(args.budget), args.budget_unit) if args.budget else None,
+            prior_run=args.prior_run,
+            merchant=args.merchant,
+            rings=args.rings
+        )
+    elif args.aggregate:
+        orchestrator.aggregate_run(args.aggregate, args.snapshot_date, args.from_archive)
+    elif args.export_run:
+        orchestrator.export_run(args.export_run)
+    elif args.compare_packing:
+        orchestrator.compare_packing(
+            district=args.district,
+            platforms=args.platforms,
+            prompt_types=args.prompt_types,
+            sample_cells=args.sample_cells
         )
     else:
         # 测试模式: 只扫描一个格子
@@ -2,14 +2,15 @@
 Perplexity GoldEater - Perplexity API 数据采集
 特点: 支持 citation_urls 引用来源
 """
-import json
-import requests
+import httpx
 from typing import List
 from datetime import datetime
 
 from ..shared import (
-    ScanJob, ScanResult, APIConfig,
-    SYSTEM_PROMPT, get_user_prompt
+    ScanJob, ScanResult, APIConfig, Completion,
+    SYSTEM_PROMPT, get_user_prompt, get_packed_prompt, unpack_completion, extract_recommendations,
+    get_rate_limiter, get_response_cache,
+    get_session, create_async_http_client
 )
 
 class PerplexityEater:
@@ -17,10 +18,27 @@ class PerplexityEater:
     
     PLATFORM = 'perplexity'
     MODEL_VERSION = 'llama-3.1-sonar-large-128k-online'
+    TEMPERATURE = 0.7
     API_URL = 'https://api.perplexity.ai/chat/completions'
     
     def __init__(self, api_config: APIConfig = None):
         self.config = api_config or APIConfig()
+        self.limiter = get_rate_limiter(self.PLATFORM)
+        self.cache = get_response_cache()
+        self.session = get_session()
+        self._async_client = None
+    
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = create_async_http_client()
+        return self._async_client
+    
+    async def aclose(self):
+        """关闭异步客户端 (它绑定在创建它的事件循环上), 下一个事件循环里重新创建"""
+        client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.aclose()
     
     def scan(
         self,
@@ -34,37 +52,169 @@ class PerplexityEater:
         system_prompt_version: str = "v1.0.0"
     ) -> tuple[ScanJob, List[ScanResult]]:
         """执行单次扫描"""
-        
         user_prompt = get_user_prompt(prompt_type, lat, lng, district)
-        
-        # 调用 Perplexity API
-        headers = {
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = self.cache.fetch(
+            key, lambda: self.limiter.call(lambda: self._complete(user_prompt))
+        )
+        return self._build_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_type, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    async def scan_async(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_type: str,
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> tuple[ScanJob, List[ScanResult]]:
+        """执行单次扫描 (异步版本, 使用 httpx)"""
+        user_prompt = get_user_prompt(prompt_type, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = await self.cache.fetch_async(
+            key, lambda: self.limiter.call_async(lambda: self._complete_async(user_prompt))
+        )
+        return self._build_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_type, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    def scan_packed(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """一次调用回答多个场景, 按 prompt_type 拆分为多个 ScanJob"""
+        user_prompt = get_packed_prompt(prompt_types, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = self.cache.fetch(
+            key, lambda: self.limiter.call(lambda: self._complete(user_prompt))
+        )
+        return self._build_packed_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_types, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    async def scan_packed_async(
+        self,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str = "v1.0.0"
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """scan_packed 的异步版本"""
+        user_prompt = get_packed_prompt(prompt_types, lat, lng, district)
+        key = self._cache_key(user_prompt, system_prompt_version, tap_number)
+        completion = await self.cache.fetch_async(
+            key, lambda: self.limiter.call_async(lambda: self._complete_async(user_prompt))
+        )
+        return self._build_packed_records(
+            completion, user_prompt, h3_index, lat, lng, district,
+            prompt_types, scan_run_id, tap_number, system_prompt_version
+        )
+    
+    def _build_packed_records(
+        self,
+        completion: Completion,
+        user_prompt: str,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_types: List[str],
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str
+    ) -> List[tuple[ScanJob, List[ScanResult]]]:
+        """拆分打包回复, 每个场景沿用单场景的解析"""
+        records = []
+        parts, parse_strategy = unpack_completion(completion, prompt_types)
+        for prompt_type, part in parts.items():
+            job, results = self._build_records(
+                part, user_prompt, h3_index, lat, lng, district,
+                prompt_type, scan_run_id, tap_number, system_prompt_version
+            )
+            job.packed = True
+            job.parse_strategy = parse_strategy
+            records.append((job, results))
+        return records
+    
+    def _cache_key(self, user_prompt: str, system_prompt_version: str, tap_number: int) -> str:
+        return self.cache.make_key(
+            self.PLATFORM, self.MODEL_VERSION, system_prompt_version,
+            user_prompt, self.TEMPERATURE, tap_number
+        )
+    
+    def _headers(self) -> dict:
+        return {
             'Authorization': f'Bearer {self.config.perplexity_api_key}',
             'Content-Type': 'application/json'
         }
-        
-        payload = {
+    
+    def _payload(self, user_prompt: str) -> dict:
+        return {
             'model': self.MODEL_VERSION,
             'messages': [
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": user_prompt}
             ],
-            'temperature': 0.7,
+            'temperature': self.TEMPERATURE,
             'return_citations': True  # Perplexity 特有: 返回引用
         }
-        
-        response = requests.post(self.API_URL, headers=headers, json=payload)
+    
+    def _complete(self, user_prompt: str) -> Completion:
+        """调用 Perplexity API"""
+        response = self.session.post(self.API_URL, headers=self._headers(), json=self._payload(user_prompt))
+        self.limiter.observe_headers(response.headers)
         response.raise_for_status()
-        data = response.json()
-        
-        raw_content = data['choices'][0]['message']['content']
-        citations = data.get('citations', [])  # 引用 URL 列表
-        
-        try:
-            parsed = json.loads(raw_content)
-            recommendations = parsed.get('recommendations', [])
-        except json.JSONDecodeError:
-            recommendations = []
+        return self._to_completion(response.json())
+    
+    async def _complete_async(self, user_prompt: str) -> Completion:
+        """调用 Perplexity API (异步, httpx)"""
+        response = await self.async_client.post(
+            self.API_URL, headers=self._headers(), json=self._payload(user_prompt)
+        )
+        self.limiter.observe_headers(response.headers)
+        response.raise_for_status()
+        return self._to_completion(response.json())
+    
+    def _to_completion(self, data: dict) -> Completion:
+        return Completion(
+            content=data['choices'][0]['message']['content'],
+            tokens_used=(data.get('usage') or {}).get('total_tokens'),
+            citations=data.get('citations', [])  # 引用 URL 列表
+        )
+    
+    def _build_records(
+        self,
+        completion: Completion,
+        user_prompt: str,
+        h3_index: str,
+        lat: float,
+        lng: float,
+        district: str,
+        prompt_type: str,
+        scan_run_id: str,
+        tap_number: int,
+        system_prompt_version: str
+    ) -> tuple[ScanJob, List[ScanResult]]:
+        """解析响应并生成 ScanJob / ScanResult"""
+        recommendations, parse_strategy = extract_recommendations(completion.content)
         
         # 创建 ScanJob
         job = ScanJob(
@@ -79,10 +229,13 @@ class PerplexityEater:
             scan_run_id=scan_run_id,
             tap_number=tap_number,
             user_prompt_template=user_prompt,
+            tokens_used=completion.tokens_used,
+            parse_strategy=parse_strategy,
             scanned_at=datetime.utcnow()
         )
         
         # 创建 ScanResults (带 citation)
+        citations = completion.citations
         results = []
         for rec in recommendations:
             result = ScanResult(
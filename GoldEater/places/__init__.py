@@ -1,3 +1,4 @@
 from .eater import PlacesEater, PlaceResult
+from .gazetteer import Gazetteer
 
-__all__ = ['PlacesEater', 'PlaceResult']
+__all__ = ['PlacesEater', 'PlaceResult', 'Gazetteer']
@@ -0,0 +1,149 @@
+"""
+Places 名称解析缓存
+
+把 (规范化名称, 粗粒度位置) 映射到已解析的 Business, 持久化在本地 SQLite:
+- 正向条目: 找到的商户, PLACES_POSITIVE_TTL 后过期
+- 负向条目: Places 查无此店 (疑似 AI 幻觉), PLACES_NEGATIVE_TTL 后过期
+位置 key 取搜索点所在的 H3 res-7 父格子, 查询时同时检查相邻格子。
+可以从 stg.businesses 预热, 大部分名称解析因此变成本地查询。
+"""
+import json
+import time
+import sqlite3
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+import h3
+
+from ..shared import Business, normalize_name
+from ..shared.config import (
+    PLACES_CACHE_PATH, PLACES_CACHE_RESOLUTION,
+    PLACES_POSITIVE_TTL, PLACES_NEGATIVE_TTL
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resolutions (
+    name_key        TEXT NOT NULL,
+    location_key    TEXT NOT NULL,
+    business        TEXT,
+    created_at      REAL NOT NULL,
+    PRIMARY KEY (name_key, location_key)
+) WITHOUT ROWID;
+"""
+
+
+class ResolutionCache:
+    """raw_name → Business 的持久化缓存"""
+
+    def __init__(
+        self,
+        path: Path = PLACES_CACHE_PATH,
+        resolution: int = PLACES_CACHE_RESOLUTION,
+        positive_ttl: float = PLACES_POSITIVE_TTL,
+        negative_ttl: float = PLACES_NEGATIVE_TTL
+    ):
+        self.path = Path(path)
+        self.resolution = resolution
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._conn = None
+        self._lock = threading.Lock()
+
+        # 统计
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def location_key(self, lat: float, lng: float) -> str:
+        return h3.latlng_to_cell(lat, lng, self.resolution)
+
+    def lookup(self, raw_name: str, lat: float, lng: float) -> Tuple[bool, Optional[Business]]:
+        """
+        查询缓存
+
+        Returns:
+            (命中与否, Business 或 None)。命中且为 None 表示已知查无此店。
+        """
+        name_key = normalize_name(raw_name)
+        center = self.location_key(lat, lng)
+        cells = h3.grid_disk(center, 1)
+        now = time.time()
+
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT location_key, business, created_at FROM resolutions "
+                f"WHERE name_key = ? AND location_key IN ({','.join('?' * len(cells))})",
+                (name_key, *cells)
+            ).fetchall()
+
+        negative = False
+        for location_key, business, created_at in rows:
+            if business is not None and now - created_at <= self.positive_ttl:
+                self.hits += 1
+                return True, Business(**json.loads(business))
+            # 负向条目只对同一个搜索格子有效
+            if business is None and location_key == center and now - created_at <= self.negative_ttl:
+                negative = True
+
+        if negative:
+            self.negative_hits += 1
+            return True, None
+        self.misses += 1
+        return False, None
+
+    def store(self, raw_name: str, lat: float, lng: float, business: Optional[Business]):
+        """记录一次解析结果 (business 为 None 时记为负向条目)"""
+        if business is not None:
+            location_key = self.location_key(business.lat, business.lng)
+        else:
+            location_key = self.location_key(lat, lng)
+        self._write([(normalize_name(raw_name), location_key, business)])
+
+    def warm_start(self, businesses: Iterable[Business], aliases: Optional[dict] = None) -> int:
+        """
+        用已建档的商户预热缓存
+
+        Args:
+            businesses: 商户列表 (通常来自 stg.businesses)
+            aliases: 可选 {google_place_id: [别名, ...]}
+        """
+        entries = []
+        for business in businesses:
+            location_key = self.location_key(business.lat, business.lng)
+            names = [business.official_name, *(aliases or {}).get(business.google_place_id, [])]
+            for name in names:
+                entries.append((normalize_name(name), location_key, business))
+        self._write(entries)
+        return len(entries)
+
+    def _write(self, entries: List[Tuple[str, str, Optional[Business]]]):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute('BEGIN')
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO resolutions (name_key, location_key, business, created_at) '
+                'VALUES (?, ?, ?, ?)',
+                [
+                    (name_key, location_key, json.dumps(asdict(b)) if b else None, now)
+                    for name_key, location_key, b in entries
+                ]
+            )
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses
+        }
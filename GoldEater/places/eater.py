@@ -2,11 +2,34 @@
 Places GoldEater - Google Places API 数据补全
 负责将 AI 返回的 raw_name 转换为真实的商户信息
 """
-import requests
-from typing import Optional, Dict
-from dataclasses import dataclass
+import time
+from typing import Optional, Dict, Iterable, List, Tuple
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
 
-from ..shared import APIConfig, Business
+import h3
+
+from ..shared import APIConfig, Business, H3_RESOLUTION, get_metrics, get_rate_limiter, get_session
+from ..shared.config import GAZETTEER_ENABLED, GAZETTEER_RESOLUTION, GAZETTEER_MAX_RESOLUTION, GAZETTEER_TYPES
+from .cache import ResolutionCache
+from .gazetteer import Gazetteer
+
+# Places types → 菜系
+CUISINE_TYPES = {
+    'chinese_restaurant': 'Chinese',
+    'japanese_restaurant': 'Japanese',
+    'italian_restaurant': 'Italian',
+    'french_restaurant': 'French',
+    'indian_restaurant': 'Indian',
+    'thai_restaurant': 'Thai',
+    'mexican_restaurant': 'Mexican',
+    'korean_restaurant': 'Korean',
+    'vietnamese_restaurant': 'Vietnamese',
+}
+
+class PlacesQuotaError(Exception):
+    """Places API 返回 OVER_QUERY_LIMIT (按 429 交给限流器重试)"""
+    status_code = 429
 
 @dataclass
 class PlaceResult:
@@ -20,16 +43,34 @@ class PlaceResult:
     price_level: Optional[int] = None
     rating: Optional[float] = None
     user_ratings_total: Optional[int] = None
+    types: List[str] = field(default_factory=list)
+
+def _cuisine_from_types(types: List[str]) -> Optional[str]:
+    """提取菜系类型"""
+    for t in types:
+        if t in CUISINE_TYPES:
+            return CUISINE_TYPES[t]
+    return None
 
 class PlacesEater:
     """Google Places 数据补全器"""
     
     SEARCH_URL = 'https://maps.googleapis.com/maps/api/place/textsearch/json'
+    NEARBY_URL = 'https://maps.googleapis.com/maps/api/place/nearbysearch/json'
     DETAILS_URL = 'https://maps.googleapis.com/maps/api/place/details/json'
     
-    def __init__(self, api_config: APIConfig = None):
+    # Nearby Search 每次查询最多 3 页共 60 个结果; next_page_token 要等几秒才生效
+    NEARBY_MAX_RESULTS = 60
+    PAGE_TOKEN_DELAY = 2.0
+    PAGE_TOKEN_RETRIES = 3
+    
+    def __init__(self, api_config: APIConfig = None, use_gazetteer: bool = GAZETTEER_ENABLED):
         self.config = api_config or APIConfig()
         self.api_key = self.config.google_places_api_key
+        self.cache = ResolutionCache()
+        self.gazetteer = Gazetteer() if use_gazetteer else None
+        self.limiter = get_rate_limiter('places')
+        self.session = get_session()
     
     def search_place(
         self,
@@ -58,26 +99,107 @@ class PlacesEater:
             'key': self.api_key
         }
         
-        response = requests.get(self.SEARCH_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = self.limiter.call(lambda: self._get(self.SEARCH_URL, params))
         
         if data['status'] != 'OK' or not data.get('results'):
             return None
         
         # 取第一个结果
-        place = data['results'][0]
+        return self._to_place(data['results'][0])
+    
+    def nearby_search(
+        self,
+        lat: float,
+        lng: float,
+        radius: int,
+        place_type: str = 'restaurant'
+    ) -> Tuple[List[PlaceResult], int]:
+        """
+        搜索点周围的全部商户 (最多 NEARBY_MAX_RESULTS 个)
         
-        return PlaceResult(
-            google_place_id=place['place_id'],
-            name=place['name'],
-            address=place.get('formatted_address', ''),
-            lat=place['geometry']['location']['lat'],
-            lng=place['geometry']['location']['lng'],
-            price_level=place.get('price_level'),
-            rating=place.get('rating'),
-            user_ratings_total=place.get('user_ratings_total')
-        )
+        Returns:
+            (PlaceResult 列表, 请求次数)
+        """
+        params = {
+            'location': f'{lat},{lng}',
+            'radius': radius,
+            'type': place_type,
+            'key': self.api_key
+        }
+        places = []
+        calls = 0
+        retries = 0
+        while True:
+            data = self.limiter.call(lambda: self._get(self.NEARBY_URL, params))
+            calls += 1
+            # 翻页 token 尚未生效
+            if data['status'] == 'INVALID_REQUEST' and 'pagetoken' in params and retries < self.PAGE_TOKEN_RETRIES:
+                retries += 1
+                time.sleep(self.PAGE_TOKEN_DELAY)
+                continue
+            if data['status'] != 'OK':
+                break
+            places.extend(self._to_place(place) for place in data.get('results', []))
+            token = data.get('next_page_token')
+            if not token:
+                break
+            params = {'pagetoken': token, 'key': self.api_key}
+            retries = 0
+            time.sleep(self.PAGE_TOKEN_DELAY)
+        return places, calls
+    
+    def sweep_district(self, district: str, cells: Iterable[str], max_workers: int = 8) -> dict:
+        """
+        用 Nearby Search 扫描区域, 建立地名录
+        
+        扫描格子取 cells 在 GAZETTEER_RESOLUTION 的父格子, 搜索半径覆盖整个六边形;
+        结果达到上限的格子细分到下一级重新扫描。GAZETTEER_TTL 内扫描过的格子跳过。
+        
+        Args:
+            district: 区域名称
+            cells: 覆盖区域的格子 (通常是扫描网格, 任意分辨率)
+            max_workers: 并发扫描的格子数
+        
+        Returns:
+            {'cells': 扫描的格子数, 'calls': Nearby Search 请求数, 'venues': 地名录中的商户数}
+        """
+        if self.gazetteer is None:
+            raise RuntimeError('Gazetteer is disabled (GAZETTEER_ENABLED=false)')
+        roots = {
+            h3.cell_to_parent(cell, GAZETTEER_RESOLUTION)
+            if h3.get_resolution(cell) > GAZETTEER_RESOLUTION else cell
+            for cell in cells
+        }
+        
+        swept = calls = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for place_type in GAZETTEER_TYPES:
+                fresh = self.gazetteer.fresh_cells(place_type)
+                pending = sorted(roots - fresh)
+                while pending:
+                    outcomes = list(executor.map(
+                        lambda cell: self._sweep_cell(cell, place_type, district), pending
+                    ))
+                    swept += len(pending)
+                    calls += sum(cell_calls for cell_calls, _ in outcomes)
+                    pending = [
+                        child
+                        for cell, (_, saturated) in zip(pending, outcomes)
+                        if saturated and h3.get_resolution(cell) < GAZETTEER_MAX_RESOLUTION
+                        for child in h3.cell_to_children(cell)
+                        if child not in fresh
+                    ]
+        
+        return {'cells': swept, 'calls': calls, 'venues': self.gazetteer.load(district)}
+    
+    def _sweep_cell(self, cell: str, place_type: str, district: str) -> Tuple[int, bool]:
+        """扫描一个格子, 返回 (请求次数, 是否达到结果上限)"""
+        lat, lng = h3.cell_to_latlng(cell)
+        # 六边形外接圆半径即边长, 留一点余量覆盖边长的变化
+        radius = round(h3.average_hexagon_edge_length(h3.get_resolution(cell), unit='m') * 1.2)
+        places, calls = self.nearby_search(lat, lng, radius, place_type)
+        self.gazetteer.store(cell, place_type, [self._to_business(place, district) for place in places])
+        return calls, len(places) >= self.NEARBY_MAX_RESULTS
     
     def get_place_details(self, place_id: str) -> Optional[Dict]:
         """
@@ -95,33 +217,14 @@ class PlacesEater:
             'key': self.api_key
         }
         
-        response = requests.get(self.DETAILS_URL, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = self.limiter.call(lambda: self._get(self.DETAILS_URL, params))
         
         if data['status'] != 'OK':
             return None
         
         result = data['result']
         
-        # 提取菜系类型
-        cuisine_type = None
-        types = result.get('types', [])
-        cuisine_mapping = {
-            'chinese_restaurant': 'Chinese',
-            'japanese_restaurant': 'Japanese',
-            'italian_restaurant': 'Italian',
-            'french_restaurant': 'French',
-            'indian_restaurant': 'Indian',
-            'thai_restaurant': 'Thai',
-            'mexican_restaurant': 'Mexican',
-            'korean_restaurant': 'Korean',
-            'vietnamese_restaurant': 'Vietnamese',
-        }
-        for t in types:
-            if t in cuisine_mapping:
-                cuisine_type = cuisine_mapping[t]
-                break
+        cuisine_type = _cuisine_from_types(result.get('types', []))
         
         return {
             'name': result.get('name'),
@@ -137,39 +240,133 @@ class PlacesEater:
             'phone': result.get('formatted_phone_number')
         }
     
+    def _get(self, url: str, params: dict) -> dict:
+        response = self.session.get(url, params=params)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('status') == 'OVER_QUERY_LIMIT':
+            raise PlacesQuotaError(data.get('error_message', 'OVER_QUERY_LIMIT'))
+        return data
+    
+    def _to_place(self, place: dict) -> PlaceResult:
+        """Text Search / Nearby Search 结果 → PlaceResult"""
+        return PlaceResult(
+            google_place_id=place['place_id'],
+            name=place['name'],
+            address=place.get('formatted_address') or place.get('vicinity', ''),
+            lat=place['geometry']['location']['lat'],
+            lng=place['geometry']['location']['lng'],
+            price_level=place.get('price_level'),
+            rating=place.get('rating'),
+            user_ratings_total=place.get('user_ratings_total'),
+            types=place.get('types', [])
+        )
+    
+    def _to_business(self, place: PlaceResult, district: str) -> Business:
+        return Business(
+            google_place_id=place.google_place_id,
+            official_name=place.name,
+            address=place.address,
+            lat=place.lat,
+            lng=place.lng,
+            district=district,
+            h3_index=h3.latlng_to_cell(place.lat, place.lng, H3_RESOLUTION),
+            cuisine=_cuisine_from_types(place.types),
+            price_range=self._price_level_to_range(place.price_level)
+        )
+    
     def resolve_and_create_business(
         self,
         raw_name: str,
         lat: float,
         lng: float,
-        district: str
+        district: str,
+        cells: Iterable[str] = ()
     ) -> Optional[Business]:
         """
         解析 raw_name 并创建 Business 对象
         
+        依次查本地解析缓存、地名录 (在 cells 附近模糊匹配), 都没有结果才调用 Text Search + Details,
+        API 的结果 (包括查无此店) 写回缓存。
+        
+        Args:
+            raw_name: AI 返回的原始名称
+            lat / lng: Text Search 的搜索中心
+            district: 区域名称
+            cells: 出现该名称的扫描格子, 用于地名录的空间过滤
+        
         Returns:
             Business 对象或 None
         """
+        metrics = get_metrics()
+        hit, business = self.cache.lookup(raw_name, lat, lng)
+        if business:
+            metrics.inc('goldeater_places_lookups_total', source='cache', result='hit')
+            return business
+        
+        if self.gazetteer is not None and len(self.gazetteer):
+            business = self.gazetteer.match(raw_name, cells)
+            metrics.inc('goldeater_places_lookups_total', source='gazetteer', result='hit' if business else 'miss')
+            if business:
+                return business
+        if hit:
+            # 缓存中记录过查无此店
+            metrics.inc('goldeater_places_lookups_total', source='cache', result='not_found')
+            return None
+        
+        metrics.inc('goldeater_places_lookups_total', source='cache', result='miss')
+        business = self._resolve_business(raw_name, lat, lng, district)
+        metrics.inc('goldeater_places_lookups_total', source='text_search', result='hit' if business else 'miss')
+        self.cache.store(raw_name, lat, lng, business)
+        return business
+    
+    def warm_start_cache(self, rows: List[dict]) -> int:
+        """
+        用 stg.businesses 的行预热解析缓存
+        
+        Returns:
+            写入的缓存条目数
+        """
+        businesses = []
+        aliases = {}
+        for row in rows:
+            if not row.get('google_place_id'):
+                continue
+            businesses.append(Business(
+                id=row.get('business_id') or row.get('id'),
+                google_place_id=row['google_place_id'],
+                official_name=row['official_name'],
+                address=row.get('address') or '',
+                lat=float(row['lat']),
+                lng=float(row['lng']),
+                district=row['district'],
+                h3_index=row.get('h3_index'),
+                cuisine=row.get('cuisine'),
+                category=row.get('category'),
+                price_range=row.get('price_range'),
+                description=row.get('description'),
+                ai_tags=row.get('ai_tags') or []
+            ))
+            aliases[row['google_place_id']] = row.get('aliases') or []
+        return self.cache.warm_start(businesses, aliases)
+    
+    def _resolve_business(
+        self,
+        raw_name: str,
+        lat: float,
+        lng: float,
+        district: str
+    ) -> Optional[Business]:
+        """调用 Places API 解析 raw_name"""
         place = self.search_place(raw_name, lat, lng)
         if not place:
             return None
         
+        business = self._to_business(place, district)
         details = self.get_place_details(place.google_place_id)
-        
-        import h3
-        h3_index = h3.latlng_to_cell(place.lat, place.lng, 10)
-        
-        return Business(
-            google_place_id=place.google_place_id,
-            official_name=place.name,
-            address=place.address,
-            lat=place.lat,
-            lng=place.lng,
-            district=district,
-            h3_index=h3_index,
-            cuisine=details.get('cuisine_type') if details else None,
-            price_range=self._price_level_to_range(place.price_level)
-        )
+        if details:
+            business.cuisine = details.get('cuisine_type')
+        return business
     
     def _price_level_to_range(self, level: Optional[int]) -> Optional[str]:
         """转换价格等级"""
@@ -0,0 +1,211 @@
+"""
+Places 地名录 (gazetteer)
+
+区域内的候选商户由 Nearby Search 按 H3 格子批量拉取, 持久化在本地 SQLite:
+- venues: google_place_id → Business (JSON), 规范化名称, 所在区域
+- sweeps: (格子, 类型) 的拉取时间, GAZETTEER_TTL 内不重复扫描
+
+load() 把一个区域的商户读入内存并建立三元组倒排索引, match() 对 raw_name 做模糊匹配,
+候选限于出现该名称的扫描格子附近。没有可信匹配时由调用方回退到 Text Search。
+"""
+import json
+import time
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import h3
+
+from ..shared import Business, name_similarity, name_trigrams, normalize_name
+from ..shared.config import (
+    GAZETTEER_PATH, GAZETTEER_RESOLUTION, GAZETTEER_TTL,
+    GAZETTEER_MATCH_THRESHOLD, GAZETTEER_MATCH_MARGIN, GAZETTEER_MATCH_RING
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS venues (
+    google_place_id TEXT PRIMARY KEY,
+    district        TEXT NOT NULL,
+    name_key        TEXT NOT NULL,
+    business        TEXT NOT NULL,
+    fetched_at      REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_venues_district ON venues (district);
+
+CREATE TABLE IF NOT EXISTS sweeps (
+    h3_index        TEXT NOT NULL,
+    place_type      TEXT NOT NULL,
+    results         INTEGER NOT NULL,
+    fetched_at      REAL NOT NULL,
+    PRIMARY KEY (h3_index, place_type)
+) WITHOUT ROWID;
+"""
+
+# 每个名称最多精确计算相似度的候选数 (按共有三元组数预筛)
+_MAX_CANDIDATES = 50
+
+
+class Gazetteer:
+    """区域商户地名录"""
+
+    def __init__(
+        self,
+        path: Path = GAZETTEER_PATH,
+        ttl: float = GAZETTEER_TTL,
+        resolution: int = GAZETTEER_RESOLUTION,
+        threshold: float = GAZETTEER_MATCH_THRESHOLD,
+        margin: float = GAZETTEER_MATCH_MARGIN,
+        ring: int = GAZETTEER_MATCH_RING
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.resolution = resolution
+        self.threshold = threshold
+        self.margin = margin
+        self.ring = ring
+        self._conn = None
+        self._lock = threading.Lock()
+
+        # 内存索引 (load() 建立)
+        self._venues: List[Tuple[str, str, Business]] = []   # (name_key, 格子, Business)
+        self._by_trigram: Dict[str, List[int]] = defaultdict(list)
+
+        # 统计
+        self.matched = 0
+        self.ambiguous = 0
+        self.unmatched = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def __len__(self) -> int:
+        return len(self._venues)
+
+    # ------------------------------------------------------------
+    # 存储
+    # ------------------------------------------------------------
+
+    def fresh_cells(self, place_type: str) -> Set[str]:
+        """GAZETTEER_TTL 内已扫描过的格子"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT h3_index FROM sweeps WHERE place_type = ? AND fetched_at >= ?',
+                (place_type, time.time() - self.ttl)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def store(self, cell: str, place_type: str, businesses: List[Business]):
+        """记录一个格子的扫描结果"""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute('BEGIN')
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO venues (google_place_id, district, name_key, business, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [
+                    (b.google_place_id, b.district, normalize_name(b.official_name), json.dumps(asdict(b)), now)
+                    for b in businesses
+                ]
+            )
+            self.conn.execute(
+                'INSERT OR REPLACE INTO sweeps (h3_index, place_type, results, fetched_at) VALUES (?, ?, ?, ?)',
+                (cell, place_type, len(businesses), now)
+            )
+
+    # ------------------------------------------------------------
+    # 匹配
+    # ------------------------------------------------------------
+
+    def load(self, district: str) -> int:
+        """把区域内的商户读入内存索引, 返回商户数"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT name_key, business FROM venues WHERE district = ?', (district,)
+            ).fetchall()
+        self._venues = []
+        self._by_trigram = defaultdict(list)
+        for name_key, business in rows:
+            if not name_key:
+                continue
+            business = Business(**json.loads(business))
+            cell = h3.latlng_to_cell(business.lat, business.lng, self.resolution)
+            for trigram in name_trigrams(name_key):
+                self._by_trigram[trigram].append(len(self._venues))
+            self._venues.append((name_key, cell, business))
+        return len(self._venues)
+
+    def match(self, raw_name: str, cells: Iterable[str] = ()) -> Optional[Business]:
+        """
+        在地名录中查找 raw_name
+
+        Args:
+            raw_name: AI 返回的原始名称
+            cells: 出现该名称的扫描格子 (任意分辨率); 为空则不做空间过滤
+
+        Returns:
+            可信的匹配 (相似度达到阈值且领先其他店名) 或 None。
+            同名连锁店取离扫描格子最近的一家。
+        """
+        name_key = normalize_name(raw_name)
+        trigrams = name_trigrams(name_key)
+        if not trigrams or not self._venues:
+            self.unmatched += 1
+            return None
+
+        origins = {self._parent(cell) for cell in cells}
+        nearby = set().union(*(h3.grid_disk(origin, self.ring) for origin in origins)) if origins else None
+
+        shared = Counter()
+        for trigram in trigrams:
+            shared.update(self._by_trigram.get(trigram, ()))
+
+        scored = []
+        for i, _ in shared.most_common(_MAX_CANDIDATES):
+            candidate_key, cell, business = self._venues[i]
+            if nearby is not None and cell not in nearby:
+                continue
+            scored.append((name_similarity(name_key, candidate_key), candidate_key, cell, business))
+        if not scored:
+            self.unmatched += 1
+            return None
+
+        best_score = max(score for score, _, _, _ in scored)
+        if best_score < self.threshold:
+            self.unmatched += 1
+            return None
+        best = [entry for entry in scored if entry[0] == best_score]
+        best_key = best[0][1]
+        if any(key != best_key and score > best_score - self.margin for score, key, _, _ in scored):
+            self.ambiguous += 1
+            return None
+
+        self.matched += 1
+        if len(best) == 1 or not origins:
+            return best[0][3]
+        return min(best, key=lambda entry: min(h3.grid_distance(entry[2], origin) for origin in origins))[3]
+
+    def _parent(self, cell: str) -> str:
+        resolution = h3.get_resolution(cell)
+        if resolution > self.resolution:
+            return h3.cell_to_parent(cell, self.resolution)
+        if resolution < self.resolution:
+            return h3.cell_to_center_child(cell, self.resolution)
+        return cell
+
+    def stats(self) -> dict:
+        return {
+            'venues': len(self._venues),
+            'matched': self.matched,
+            'ambiguous': self.ambiguous,
+            'unmatched': self.unmatched
+        }
@@ -3,29 +3,120 @@ from .config import (
     PROMPT_TYPES,
     H3_RESOLUTION,
     TAP_COUNT,
+    PLATFORM_CONCURRENCY,
+    PLATFORM_RATE_LIMITS,
+    HTTP_READ_TIMEOUT,
     ScanConfig,
     APIConfig,
     DatabaseConfig,
-    DISTRICT_BOUNDS
+    DISTRICTS_DIR,
+    STATE_DIR
 )
-from .models import ScanJob, ScanResult, Business
-from .prompts import SYSTEM_PROMPT, USER_PROMPTS, get_user_prompt
+from .models import ScanJob, ScanResult, Business, Completion
+from .prompts import SYSTEM_PROMPT, USER_PROMPTS, get_user_prompt, get_packed_prompt
+from .packing import unpack_completion
+from .parsing import parse_json_response, extract_recommendations, record_parse, parse_report
 from .db import DatabaseClient
+from .names import normalize_name, name_similarity, name_trigrams
+from .storage import StorageSink, PostgRESTSink, PostgresCopySink, create_sink
+from .writer import StreamingWriter
+from .journal import TaskJournal, task_key
+from .cache import ResponseCache, CacheMiss, CACHE_MODES, get_response_cache
+from .transport import (
+    get_session, create_http_client, create_async_http_client, http_timeout, transport_stats
+)
+from .ratelimit import RateLimiter, RateLimitExceeded, get_rate_limiter, share_rate_limits, throttle_report
+from .workqueue import WorkQueue, SQLiteQueue, RedisQueue, create_queue, task_id
+from .batch import BatchRunner, BatchFailed, batch_custom_id
+from .districts import District, list_districts, load_district, district_grid, district_grid_arrays
+from .sampling import AdaptiveSampler, rank_biased_overlap
+from .hierarchy import HierarchicalGrid
+from .metrics import MetricsRegistry, MetricsExporter, ProgressReporter, get_metrics
+from .budget import ScanBudget, CellPriority, BudgetScheduler, parse_budget
+from .merchant import MerchantGrid
+from .aggregate import CellStats, IncrementalAggregator, write_aggregates
+from .archive import ArchiveWriter, read_archive, remove_run
 
 __all__ = [
     'PLATFORMS',
     'PROMPT_TYPES', 
     'H3_RESOLUTION',
     'TAP_COUNT',
+    'PLATFORM_CONCURRENCY',
+    'PLATFORM_RATE_LIMITS',
+    'HTTP_READ_TIMEOUT',
     'ScanConfig',
     'APIConfig',
     'DatabaseConfig',
-    'DISTRICT_BOUNDS',
+    'DISTRICTS_DIR',
+    'STATE_DIR',
     'ScanJob',
     'ScanResult',
     'Business',
+    'Completion',
     'SYSTEM_PROMPT',
     'USER_PROMPTS',
     'get_user_prompt',
-    'DatabaseClient'
+    'get_packed_prompt',
+    'unpack_completion',
+    'parse_json_response',
+    'extract_recommendations',
+    'record_parse',
+    'parse_report',
+    'DatabaseClient',
+    'normalize_name',
+    'name_similarity',
+    'name_trigrams',
+    'StorageSink',
+    'PostgRESTSink',
+    'PostgresCopySink',
+    'create_sink',
+    'StreamingWriter',
+    'TaskJournal',
+    'task_key',
+    'ResponseCache',
+    'CacheMiss',
+    'CACHE_MODES',
+    'get_response_cache',
+    'get_session',
+    'create_http_client',
+    'create_async_http_client',
+    'http_timeout',
+    'transport_stats',
+    'RateLimiter',
+    'RateLimitExceeded',
+    'get_rate_limiter',
+    'throttle_report',
+    'share_rate_limits',
+    'WorkQueue',
+    'SQLiteQueue',
+    'RedisQueue',
+    'create_queue',
+    'task_id',
+    'BatchRunner',
+    'BatchFailed',
+    'batch_custom_id',
+    'AdaptiveSampler',
+    'rank_biased_overlap',
+    'HierarchicalGrid',
+    'ScanBudget',
+    'CellPriority',
+    'BudgetScheduler',
+    'parse_budget',
+    'MetricsRegistry',
+    'MetricsExporter',
+    'ProgressReporter',
+    'get_metrics',
+    'MerchantGrid',
+    'District',
+    'list_districts',
+    'load_district',
+    'district_grid',
+    'district_grid_arrays',
+    'CellStats',
+    'IncrementalAggregator',
+    'write_aggregates',
+    'ArchiveWriter',
+    'read_archive',
+    'remove_run'
 ]
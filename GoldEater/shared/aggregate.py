@@ -0,0 +1,619 @@
+"""
+GoldEater 指标聚合 (raw → mart)
+
+把一次扫描的 ScanJob / ScanResult 聚合为 mart.visibility_snapshots 和 mart.heatmap_cells。
+
+计算分两步:
+1. CellStats: 可合并的充分统计量, 全部是整数编码列上的 NumPy 运算
+   - 每个 (格子, 场景, 平台) 组: taps (成功的 job 数)
+   - 每个 (组, 商户): mentions / rank_sum / score_sum (同一 job 内重复提及只计排名最靠前的一次)
+   统计量可以相加, 所以跨平台 ('all')、跨分辨率汇总都只是重新分组求和, 不会出现平均值的平均。
+2. 由统计量导出指标:
+   - mention_frequency = mentions / taps
+   - avg_rank = rank_sum / mentions
+   - visibility_score = score_sum / taps, 排名分数 #1 = 100, #2 = 90, ..., #10 = 10
+     (即 docs 中 calculate_visibility_score 的 avg_rank_score × stability)
+   - share_of_voice = mentions / 组内全部 mentions
+   - competition_score = 100 × (1 - Σ share_of_voice²)
+   - heat_score = 组内前 HEATMAP_TOP_BUSINESSES 名商户的平均 visibility_score
+
+粗分辨率的热力图金字塔 (ROLLUP_RESOLUTIONS) 由 rollup 把统计量按父格子求和后用同样的公式计算。
+"""
+import threading
+from dataclasses import dataclass
+from operator import attrgetter, itemgetter
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import h3
+import numpy as np
+
+from .models import ScanJob, ScanResult
+from .names import normalize_name
+from .config import HEATMAP_TOP_BUSINESSES, AGGREGATE_SNAPSHOT_INTERVAL, ROLLUP_RESOLUTIONS
+
+ALL_PLATFORMS = 'all'
+
+
+def rank_score(rank: np.ndarray) -> np.ndarray:
+    """排名分数: #1 = 100, #2 = 90, ..., #10 及以后 = 10 / 0"""
+    return np.clip(110 - 10 * rank, 0, 100)
+
+
+def _column(records: Sequence, name: str) -> list:
+    """ScanJob / ScanResult、数据库行 (dict) 或 Arrow Table (read_archive) 的一列"""
+    if hasattr(records, 'column'):
+        return records.column(name).to_pylist()
+    if records and isinstance(records[0], dict):
+        return list(map(itemgetter(name), records))
+    return list(map(attrgetter(name), records))
+
+
+def _encode(values: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    字符串列 → (取值, int64 编码), 取值按首次出现的顺序
+
+    用哈希表编码而不是 np.unique: 对象数组排序比一次字典遍历慢一个数量级。
+    """
+    index = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), dtype=np.int64, count=len(values))
+    labels = np.empty(len(index), dtype=object)
+    labels[:] = list(index)
+    return labels, codes
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """拼接 [starts[i], starts[i] + counts[i]) 各区间的下标"""
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def _group_starts(sorted_keys: np.ndarray) -> np.ndarray:
+    """已排序的键中每一段的起始下标"""
+    if len(sorted_keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+
+
+@dataclass
+class CellStats:
+    """
+    聚合的充分统计量
+
+    g_*: 每个 (格子, 场景, 平台) 组一行
+    p_*: 每个 (组, 商户) 一行, p_group 指向组
+    """
+    cells: np.ndarray
+    prompts: np.ndarray
+    platforms: np.ndarray
+    businesses: np.ndarray
+    business_ids: np.ndarray
+    business_names: np.ndarray
+
+    g_cell: np.ndarray
+    g_prompt: np.ndarray
+    g_platform: np.ndarray
+    g_district: np.ndarray
+    g_lat: np.ndarray
+    g_lng: np.ndarray
+    g_taps: np.ndarray
+
+    p_group: np.ndarray
+    p_business: np.ndarray
+    p_mentions: np.ndarray
+    p_rank_sum: np.ndarray
+    p_score_sum: np.ndarray
+
+    # ------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------
+
+    @classmethod
+    def from_records(cls, jobs: Sequence, results: Sequence) -> 'CellStats':
+        """
+        由一次扫描的 job / result 构建 (ScanJob / ScanResult、raw 表的行或归档的 Arrow Table)
+
+        商户按 business_id 识别, 未匹配的结果按规范化名称识别;
+        job_id 不在 jobs 中的结果被忽略。
+        """
+        n_jobs = len(jobs)
+        cells, job_cell = _encode(_column(jobs, 'h3_index'))
+        prompts, job_prompt = _encode(_column(jobs, 'prompt_type'))
+        platforms, job_platform = _encode(_column(jobs, 'platform'))
+        districts = np.asarray(_column(jobs, 'district'), dtype=object)
+        lat = np.asarray(_column(jobs, 'grid_center_lat'), dtype=np.float64)
+        lng = np.asarray(_column(jobs, 'grid_center_lng'), dtype=np.float64)
+
+        # job_id → job 下标: 两边的 id 一起编码
+        ids, id_codes = _encode(_column(jobs, 'id') + _column(results, 'job_id'))
+        job_of_id = np.full(len(ids), -1, dtype=np.int64)
+        job_of_id[id_codes[:n_jobs]] = np.arange(n_jobs)
+        result_job = job_of_id[id_codes[n_jobs:]]
+
+        # 商户键: business_id, 否则规范化名称 (每个不同的名称只规范化一次)
+        names = [n or r or '' for n, r in zip(_column(results, 'normalized_name'), _column(results, 'raw_name'))]
+        name_labels, name_codes = _encode(names)
+        normalized = np.array([normalize_name(n) for n in name_labels], dtype=object)[name_codes]
+        business_id = np.asarray(_column(results, 'business_id'), dtype=object)
+        has_id = business_id.astype(bool)
+        keys = np.where(has_id, business_id, normalized)
+        valid = (result_job >= 0) & (has_id | (normalized != ''))
+
+        businesses, result_business = _encode(keys[valid])
+        first = np.unique(result_business, return_index=True)[1]
+        business_ids = np.where(has_id[valid][first], businesses[result_business[first]], None)
+
+        # 商户显示名取字典序最小的名称, 与结果到达顺序无关 (增量聚合得到相同的名称)
+        name_order = np.argsort(np.argsort(name_labels)) if len(name_labels) else np.zeros(0, dtype=np.int64)
+        best = np.full(len(businesses), len(name_labels), dtype=np.int64)
+        np.minimum.at(best, result_business, name_order[name_codes[valid]])
+        business_names = np.empty(len(businesses), dtype=object)
+        business_names[:] = np.sort(name_labels)[best] if len(businesses) else []
+
+        rank = np.asarray(_column(results, 'rank_position'), dtype=np.int64)[valid]
+        return cls._reduce(
+            cells, prompts, platforms, businesses, business_ids, business_names,
+            job_cell, job_prompt, job_platform, districts, lat, lng,
+            result_job[valid], result_business, rank
+        )
+
+    @classmethod
+    def _reduce(
+        cls, cells, prompts, platforms, businesses, business_ids, business_names,
+        job_cell, job_prompt, job_platform, districts, lat, lng,
+        result_job, result_business, rank
+    ) -> 'CellStats':
+        job_key = (job_cell * len(prompts) + job_prompt) * len(platforms) + job_platform
+        _, first_job, job_group = np.unique(job_key, return_index=True, return_inverse=True)
+        job_group = job_group.astype(np.int64)
+
+        # 同一 job 内同一商户只保留排名最靠前的一次
+        order = np.lexsort((rank, result_business, result_job))
+        result_job, result_business, rank = result_job[order], result_business[order], rank[order]
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (result_job[1:] != result_job[:-1]) | (result_business[1:] != result_business[:-1])
+
+        stats = cls(
+            cells=cells, prompts=prompts, platforms=platforms,
+            businesses=businesses, business_ids=business_ids, business_names=business_names,
+            g_cell=job_cell[first_job], g_prompt=job_prompt[first_job], g_platform=job_platform[first_job],
+            g_district=districts[first_job], g_lat=lat[first_job], g_lng=lng[first_job],
+            g_taps=np.bincount(job_group, minlength=len(first_job)),
+            p_group=np.zeros(0, dtype=np.int64), p_business=np.zeros(0, dtype=np.int64),
+            p_mentions=np.zeros(0, dtype=np.int64), p_rank_sum=np.zeros(0, dtype=np.int64),
+            p_score_sum=np.zeros(0, dtype=np.int64)
+        )
+        stats._set_pairs(job_group[result_job[keep]], result_business[keep], np.ones(int(keep.sum()), dtype=np.int64),
+                         rank[keep], rank_score(rank[keep]))
+        return stats
+
+    def _set_pairs(self, group, business, mentions, rank_sum, score_sum):
+        """按 (组, 商户) 求和"""
+        key = group * max(len(self.businesses), 1) + business
+        pairs, inverse = np.unique(key, return_inverse=True)
+        self.p_group = pairs // max(len(self.businesses), 1)
+        self.p_business = pairs % max(len(self.businesses), 1)
+        self.p_mentions = np.bincount(inverse, weights=mentions, minlength=len(pairs)).astype(np.int64)
+        self.p_rank_sum = np.bincount(inverse, weights=rank_sum, minlength=len(pairs)).astype(np.int64)
+        self.p_score_sum = np.bincount(inverse, weights=score_sum, minlength=len(pairs)).astype(np.int64)
+
+    # ------------------------------------------------------------
+    # 重新分组
+    # ------------------------------------------------------------
+
+    def regroup(
+        self,
+        cells: np.ndarray,
+        g_cell: np.ndarray,
+        platforms: np.ndarray,
+        g_platform: np.ndarray,
+        g_lat: np.ndarray,
+        g_lng: np.ndarray
+    ) -> 'CellStats':
+        """
+        把现有的组映射到新的 (格子, 平台) 上并求和
+
+        g_cell / g_platform / g_lat / g_lng 与现有的组一一对应, 新组的中心取第一个映射到它的组。
+        """
+        key = (g_cell * len(self.prompts) + self.g_prompt) * len(platforms) + g_platform
+        _, first, group_of = np.unique(key, return_index=True, return_inverse=True)
+        group_of = group_of.astype(np.int64)
+        stats = CellStats(
+            cells=cells, prompts=self.prompts, platforms=platforms,
+            businesses=self.businesses, business_ids=self.business_ids, business_names=self.business_names,
+            g_cell=g_cell[first], g_prompt=self.g_prompt[first], g_platform=g_platform[first],
+            g_district=self.g_district[first], g_lat=g_lat[first], g_lng=g_lng[first],
+            g_taps=np.bincount(group_of, weights=self.g_taps, minlength=len(first)).astype(np.int64),
+            p_group=self.p_group, p_business=self.p_business, p_mentions=self.p_mentions,
+            p_rank_sum=self.p_rank_sum, p_score_sum=self.p_score_sum
+        )
+        stats._set_pairs(group_of[self.p_group], self.p_business, self.p_mentions, self.p_rank_sum, self.p_score_sum)
+        return stats
+
+    def expand(self, coverage: Dict[str, str]) -> 'CellStats':
+        """
+        按分层扫描的覆盖表 (raw.scan_coverage: 目标格子 → 来源格子) 展开到目标分辨率
+
+        每个目标格子复制来源格子 (自身或已扫描的祖先) 的组和统计量; 不是任何目标来源的
+        中间层格子被丢弃, 热力图中只有目标分辨率的格子。
+        """
+        cell_index = {cell: i for i, cell in enumerate(self.cells.tolist())}
+        covered = sorted((target, cell_index[source]) for target, source in coverage.items() if source in cell_index)
+        cells = np.empty(len(covered), dtype=object)
+        cells[:] = [target for target, _ in covered]
+        source = np.array([s for _, s in covered], dtype=np.int64)
+
+        # 来源格子的组 → 每个目标格子一份
+        by_cell = np.argsort(self.g_cell, kind='stable')
+        cell_groups = np.bincount(self.g_cell, minlength=len(self.cells))
+        cell_starts = np.cumsum(cell_groups) - cell_groups
+        group = by_cell[_ranges(cell_starts[source], cell_groups[source])]
+        g_cell = np.repeat(np.arange(len(cells)), cell_groups[source])
+        centers = np.array([h3.cell_to_latlng(cell) for cell in cells], dtype=np.float64).reshape(-1, 2)
+
+        # 组内商户 (p_group 已按组排序)
+        group_pairs = np.bincount(self.p_group, minlength=len(self.g_taps))
+        pair_starts = np.cumsum(group_pairs) - group_pairs
+        pair = _ranges(pair_starts[group], group_pairs[group])
+
+        return CellStats(
+            cells=cells, prompts=self.prompts, platforms=self.platforms,
+            businesses=self.businesses, business_ids=self.business_ids, business_names=self.business_names,
+            g_cell=g_cell, g_prompt=self.g_prompt[group], g_platform=self.g_platform[group],
+            g_district=self.g_district[group], g_lat=centers[g_cell, 0], g_lng=centers[g_cell, 1],
+            g_taps=self.g_taps[group],
+            p_group=np.repeat(np.arange(len(group)), group_pairs[group]), p_business=self.p_business[pair],
+            p_mentions=self.p_mentions[pair], p_rank_sum=self.p_rank_sum[pair], p_score_sum=self.p_score_sum[pair]
+        )
+
+    def rollup(self, resolution: int) -> 'CellStats':
+        """
+        汇总到父分辨率 (cell_to_parent), 统计量求和后重新计算指标
+
+        只对不同的格子调用一次 h3; 比目标分辨率更粗的格子 (分层扫描) 保持不变。
+        """
+        parents = [
+            h3.cell_to_parent(cell, resolution) if h3.get_resolution(cell) > resolution else cell
+            for cell in self.cells
+        ]
+        cells, parent_of = _encode(parents)
+        centers = np.array([h3.cell_to_latlng(cell) for cell in cells], dtype=np.float64).reshape(-1, 2)
+        g_cell = parent_of[self.g_cell]
+        return self.regroup(cells, g_cell, self.platforms, self.g_platform, centers[g_cell, 0], centers[g_cell, 1])
+
+    def all_platforms(self) -> 'CellStats':
+        """跨平台汇总 (platform = 'all')"""
+        return self.regroup(
+            self.cells, self.g_cell,
+            np.array([ALL_PLATFORMS], dtype=object), np.zeros(len(self.g_cell), dtype=np.int64),
+            self.g_lat, self.g_lng
+        )
+
+    # ------------------------------------------------------------
+    # 指标
+    # ------------------------------------------------------------
+
+    def metrics(self, top_n: int = HEATMAP_TOP_BUSINESSES) -> dict:
+        """
+        由统计量导出指标
+
+        Returns:
+            p_* (每个组内商户) 与 g_* (每个组) 的指标数组
+        """
+        n_groups = len(self.g_taps)
+        taps = self.g_taps[self.p_group]
+        frequency = self.p_mentions / taps
+        visibility = np.minimum(np.floor(self.p_score_sum / taps + 1e-9), 100).astype(np.int64)
+        avg_rank = self.p_rank_sum / self.p_mentions
+
+        group_mentions = np.bincount(self.p_group, weights=self.p_mentions, minlength=n_groups)
+        share = self.p_mentions / group_mentions[self.p_group]
+        business_count = np.bincount(self.p_group, minlength=n_groups)
+        hhi = np.bincount(self.p_group, weights=share ** 2, minlength=n_groups)
+        competition = np.where(business_count > 0, np.rint(100 * (1 - hhi)), 0).astype(np.int64)
+
+        # 组内名次: visibility 高 → 平均排名靠前 → 提及多 → 商户键 (字典序)
+        key_order = np.argsort(np.argsort(self.businesses)) if len(self.businesses) else np.zeros(0, dtype=np.int64)
+        order = np.lexsort((key_order[self.p_business], -self.p_mentions, avg_rank, -visibility, self.p_group))
+        starts = _group_starts(self.p_group[order])
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+        position += 1
+
+        top = position <= top_n
+        top_count = np.bincount(self.p_group, weights=top, minlength=n_groups)
+        top_visibility = np.bincount(self.p_group, weights=visibility * top, minlength=n_groups)
+        visibility_sum = np.bincount(self.p_group, weights=visibility, minlength=n_groups)
+        max_visibility = np.zeros(n_groups, dtype=np.int64)
+        max_visibility[self.p_group[position == 1]] = visibility[position == 1]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            heat = np.where(top_count > 0, np.rint(top_visibility / top_count), 0).astype(np.int64)
+            avg_visibility = np.where(business_count > 0, np.rint(visibility_sum / business_count), 0).astype(np.int64)
+
+        return {
+            'p_frequency': frequency,
+            'p_visibility': visibility,
+            'p_avg_rank': avg_rank,
+            'p_share': share,
+            'p_position': position,
+            'g_heat': heat,
+            'g_avg_visibility': avg_visibility,
+            'g_max_visibility': max_visibility,
+            'g_business_count': business_count,
+            'g_competition': competition,
+        }
+
+    # ------------------------------------------------------------
+    # mart 行
+    # ------------------------------------------------------------
+
+    def visibility_rows(self, snapshot_date: Optional[date] = None) -> List[dict]:
+        """mart.visibility_snapshots 行 (只包含已匹配 business_id 的商户)"""
+        snapshot = (snapshot_date or date.today()).isoformat()
+        m = self.metrics()
+        has_id = np.array([b is not None for b in self.business_ids], dtype=bool)
+        matched = np.flatnonzero(has_id[self.p_business])
+        group = self.p_group[matched]
+        business = self.p_business[matched]
+        columns = zip(
+            self.business_ids[business].tolist(),
+            self.business_names[business].tolist(),
+            self.cells[self.g_cell[group]].tolist(),
+            self.g_district[group].tolist(),
+            self.prompts[self.g_prompt[group]].tolist(),
+            self.platforms[self.g_platform[group]].tolist(),
+            m['p_visibility'][matched].tolist(),
+            np.round(m['p_avg_rank'][matched], 2).tolist(),
+            np.round(m['p_frequency'][matched], 2).tolist(),
+            np.round(m['p_share'][matched], 4).tolist(),
+        )
+        return [
+            {
+                'business_id': business_id,
+                'business_normalized_name': name,
+                'h3_index': h3_index,
+                'district': district,
+                'prompt_type': prompt_type,
+                'platform': platform,
+                'visibility_score': visibility,
+                'avg_rank': avg_rank,
+                'mention_frequency': frequency,
+                'share_of_voice': share,
+                'snapshot_date': snapshot,
+            }
+            for business_id, name, h3_index, district, prompt_type, platform, visibility, avg_rank, frequency, share
+            in columns
+        ]
+
+    def heatmap_rows(self, snapshot_date: Optional[date] = None, top_n: int = HEATMAP_TOP_BUSINESSES) -> List[dict]:
+        """mart.heatmap_cells 行, 每个组一行 (没有推荐结果的组 heat_score = 0)"""
+        snapshot = (snapshot_date or date.today()).isoformat()
+        m = self.metrics(top_n)
+
+        top_businesses = [[] for _ in range(len(self.g_taps))]
+        top = np.flatnonzero(m['p_position'] <= top_n)
+        top = top[np.lexsort((m['p_position'][top], self.p_group[top]))]
+        for group, business, visibility, share, avg_rank, frequency in zip(
+            self.p_group[top].tolist(),
+            self.p_business[top].tolist(),
+            m['p_visibility'][top].tolist(),
+            np.round(m['p_share'][top], 4).tolist(),
+            np.round(m['p_avg_rank'][top], 2).tolist(),
+            np.round(m['p_frequency'][top], 2).tolist()
+        ):
+            top_businesses[group].append({
+                'business_id': self.business_ids[business],
+                'name': self.business_names[business],
+                'visibility_score': visibility,
+                'share_of_voice': share,
+                'avg_rank': avg_rank,
+                'mention_frequency': frequency,
+            })
+
+        columns = zip(
+            self.cells[self.g_cell].tolist(),
+            self.g_district.tolist(),
+            np.round(self.g_lat, 7).tolist(),
+            np.round(self.g_lng, 7).tolist(),
+            self.prompts[self.g_prompt].tolist(),
+            self.platforms[self.g_platform].tolist(),
+            m['g_heat'].tolist(),
+            m['g_avg_visibility'].tolist(),
+            m['g_max_visibility'].tolist(),
+            m['g_business_count'].tolist(),
+            m['g_competition'].tolist(),
+            top_businesses
+        )
+        return [
+            {
+                'h3_index': h3_index,
+                'district': district,
+                'center_lat': lat,
+                'center_lng': lng,
+                'prompt_type': prompt_type,
+                'platform': platform,
+                'heat_score': heat,
+                'avg_visibility': avg_visibility,
+                'max_visibility': max_visibility,
+                'business_count': business_count,
+                'competition_score': competition,
+                'top_businesses': top,
+                'snapshot_date': snapshot,
+            }
+            for h3_index, district, lat, lng, prompt_type, platform, heat, avg_visibility, max_visibility,
+                business_count, competition, top in columns
+        ]
+
+
+class IncrementalAggregator:
+    """
+    扫描过程中的增量聚合
+
+    run_full_scan 的每个完成的 (ScanJob, List[ScanResult]) 调用一次 add, 只累加
+    CellStats 同样的充分统计量 (按组的 taps, 按 (组, 商户) 的 mentions / rank_sum / score_sum),
+    内存与 格子 × 场景 × 平台 × 出现过的商户 成正比, 不保留原始结果。
+    后台线程每 snapshot_interval 秒把有变化的快照 upsert 到 mart; close 时写入最终快照,
+    与对同一批 job / result 调用 CellStats.from_records 的结果一致。
+    """
+
+    def __init__(
+        self,
+        sink=None,
+        snapshot_interval: float = AGGREGATE_SNAPSHOT_INTERVAL,
+        snapshot_date: Optional[date] = None
+    ):
+        """
+        Args:
+            sink: 存储后端, 为 None 时不发布 (只在内存中聚合)
+            snapshot_interval: 发布快照的间隔 (秒)
+            snapshot_date: mart 行的 snapshot_date (默认今天)
+        """
+        self.sink = sink
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_date = snapshot_date or date.today()
+        self._lock = threading.Lock()
+        self._groups: Dict[tuple, list] = {}
+        self._pairs: Dict[tuple, list] = {}
+        self._names: Dict[str, str] = {}
+        self._ids: Dict[str, Optional[str]] = {}
+        self._version = 0
+        self._published = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='incremental-aggregator', daemon=True)
+
+        # 统计
+        self.jobs = 0
+        self.snapshots = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        if self.sink is not None:
+            self._thread.start()
+
+    def add(self, job: ScanJob, results: List[ScanResult]):
+        """累加一个 job (同一 job 内重复提及的商户只计排名最靠前的一次)"""
+        best = {}
+        for r in results:
+            name = r.normalized_name or r.raw_name or ''
+            key = r.business_id or normalize_name(name)
+            if not key:
+                continue
+            current = best.get(key)
+            if current is None:
+                best[key] = (r.rank_position, name, r.business_id)
+            else:
+                best[key] = (min(current[0], r.rank_position), min(current[1], name), current[2])
+        group = (job.h3_index, job.prompt_type, job.platform)
+
+        with self._lock:
+            entry = self._groups.get(group)
+            if entry is None:
+                self._groups[group] = [1, job.district, job.grid_center_lat, job.grid_center_lng]
+            else:
+                entry[0] += 1
+            for key, (rank, name, business_id) in best.items():
+                # rank_score 的标量版, 避免逐个结果调用 NumPy
+                score = max(0, min(100, 110 - 10 * rank))
+                pair = self._pairs.get(group + (key,))
+                if pair is None:
+                    self._pairs[group + (key,)] = [1, rank, score]
+                else:
+                    pair[0] += 1
+                    pair[1] += rank
+                    pair[2] += score
+                if key not in self._names or name < self._names[key]:
+                    self._names[key] = name
+                self._ids.setdefault(key, business_id or None)
+            self.jobs += 1
+            self._version += 1
+
+    def stats(self) -> CellStats:
+        """当前累计的充分统计量"""
+        with self._lock:
+            groups = list(self._groups.items())
+            pairs = list(self._pairs.items())
+            names = dict(self._names)
+            ids = dict(self._ids)
+
+        cells, g_cell = _encode([g[0] for g, _ in groups])
+        prompts, g_prompt = _encode([g[1] for g, _ in groups])
+        platforms, g_platform = _encode([g[2] for g, _ in groups])
+        group_index = {g: i for i, (g, _) in enumerate(groups)}
+        businesses, p_business = _encode([p[3] for p, _ in pairs])
+        values = np.array([v for _, v in pairs], dtype=np.int64).reshape(-1, 3)
+
+        business_ids = np.empty(len(businesses), dtype=object)
+        business_ids[:] = [ids[b] for b in businesses]
+        business_names = np.empty(len(businesses), dtype=object)
+        business_names[:] = [names[b] for b in businesses]
+        district = np.empty(len(groups), dtype=object)
+        district[:] = [v[1] for _, v in groups]
+
+        return CellStats(
+            cells=cells, prompts=prompts, platforms=platforms,
+            businesses=businesses, business_ids=business_ids, business_names=business_names,
+            g_cell=g_cell, g_prompt=g_prompt, g_platform=g_platform, g_district=district,
+            g_lat=np.array([v[2] for _, v in groups], dtype=np.float64),
+            g_lng=np.array([v[3] for _, v in groups], dtype=np.float64),
+            g_taps=np.array([v[0] for _, v in groups], dtype=np.int64),
+            p_group=np.array([group_index[p[:3]] for p, _ in pairs], dtype=np.int64),
+            p_business=p_business,
+            p_mentions=values[:, 0], p_rank_sum=values[:, 1], p_score_sum=values[:, 2]
+        )
+
+    def publish(self) -> dict:
+        """立即把当前快照写入 mart"""
+        version = self._version
+        counts = write_aggregates(self.stats(), self.sink, self.snapshot_date)
+        self._published = version
+        self.snapshots += 1
+        return counts
+
+    def close(self):
+        """停止后台线程, 写入最终快照并关闭存储后端"""
+        if self._thread.is_alive():
+            self._stop.set()
+            self._thread.join()
+        if self.sink is not None:
+            try:
+                if self._version != self._published:
+                    self.publish()
+            finally:
+                self.sink.close()
+
+    def _run(self):
+        while not self._stop.wait(self.snapshot_interval):
+            if self._version == self._published:
+                continue
+            try:
+                self.publish()
+            except Exception as e:
+                # 快照失败不影响扫描, 下一个间隔再试
+                print(f"✗ Heatmap snapshot failed: {e}")
+
+
+def write_aggregates(stats: CellStats, sink, snapshot_date: Optional[date] = None) -> dict:
+    """
+    把一次扫描的聚合结果批量写入 mart (按平台 + 跨平台 'all')
+
+    heatmap_cells 之外, ROLLUP_RESOLUTIONS 的每一层写入各自的 heatmap_cells_r{res} 表。
+    """
+    visibility = stats.visibility_rows(snapshot_date)
+    heatmap = stats.heatmap_rows(snapshot_date) + stats.all_platforms().heatmap_rows(snapshot_date)
+    sink.write_visibility(visibility)
+    sink.write_heatmap(heatmap)
+    counts = {'visibility_snapshots': len(visibility), 'heatmap_cells': len(heatmap)}
+
+    for resolution in ROLLUP_RESOLUTIONS:
+        level = stats.rollup(resolution)
+        rows = level.heatmap_rows(snapshot_date) + level.all_platforms().heatmap_rows(snapshot_date)
+        sink.write_heatmap(rows, resolution)
+        counts[f'heatmap_cells_r{resolution}'] = len(rows)
+    return counts
@@ -0,0 +1,259 @@
+"""
+GoldEater 本地列式归档 (Parquet)
+
+ScanJob / ScanResult 按分区缓冲, 攒够 ARCHIVE_BATCH_ROWS 行转换为 Arrow RecordBatch,
+写入 ARCHIVE_DIR 下 hive 分区的 Parquet 文件:
+
+    ARCHIVE_DIR/jobs/scan_run_id=<run>/district=<district>/platform=<platform>/part-<id>.parquet
+    ARCHIVE_DIR/results/scan_run_id=<run>/district=<district>/platform=<platform>/part-<id>.parquet
+
+重复度高的字符串列用字典编码, vibe_tags / negative_flags / citation_urls 是 list<string>,
+results 冗余了 h3_index / prompt_type / tap_number, 本地分析不需要再 join jobs。
+分区列 (scan_run_id / district / platform) 只存在于目录名中, 读取时由 read_archive 恢复。
+
+需要 pyarrow (可选依赖, 只在使用归档时导入)。
+"""
+import json
+import uuid
+import shutil
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .config import ARCHIVE_DIR, ARCHIVE_BATCH_ROWS
+
+PARTITIONS = ['scan_run_id', 'district', 'platform']
+
+# (列名, 类型); 'dict' = dictionary<int32, string>, 'list' = list<string>
+JOB_FIELDS = [
+    ('id', 'string'),
+    ('h3_index', 'dict'),
+    ('grid_center_lat', 'float64'),
+    ('grid_center_lng', 'float64'),
+    ('prompt_type', 'dict'),
+    ('system_prompt_version', 'dict'),
+    ('user_prompt_template', 'string'),
+    ('model_version', 'dict'),
+    ('tap_number', 'int16'),
+    ('tokens_used', 'int32'),
+    ('tap_agreement', 'float64'),
+    ('stop_reason', 'dict'),
+    ('packed', 'bool'),
+    ('parse_strategy', 'dict'),
+    ('scanned_at', 'timestamp'),
+]
+
+RESULT_FIELDS = [
+    ('id', 'string'),
+    ('job_id', 'string'),
+    ('h3_index', 'dict'),
+    ('prompt_type', 'dict'),
+    ('tap_number', 'int16'),
+    ('raw_name', 'dict'),
+    ('rank_position', 'int16'),
+    ('normalized_name', 'dict'),
+    ('business_id', 'dict'),
+    ('business_lat', 'float64'),
+    ('business_lng', 'float64'),
+    ('business_address', 'dict'),
+    ('google_place_id', 'dict'),
+    ('cuisine_type', 'dict'),
+    ('price_level', 'int8'),
+    ('reasoning', 'string'),
+    ('vibe_tags', 'list'),
+    ('negative_flags', 'list'),
+    ('sentiment_score', 'float64'),
+    ('citation_urls', 'list'),
+    ('citation_count', 'int32'),
+    ('raw_json_response', 'string'),
+]
+
+# results 从所属 job 冗余的列
+RESULT_JOB_FIELDS = ('h3_index', 'prompt_type', 'tap_number')
+
+
+def _arrow_type(pa, kind: str):
+    return {
+        'string': pa.string(),
+        'dict': pa.dictionary(pa.int32(), pa.string()),
+        'list': pa.list_(pa.string()),
+        'float64': pa.float64(),
+        'int32': pa.int32(),
+        'int16': pa.int16(),
+        'int8': pa.int8(),
+        'bool': pa.bool_(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }[kind]
+
+
+def _schema(fields):
+    import pyarrow as pa
+    return pa.schema([(name, _arrow_type(pa, kind)) for name, kind in fields])
+
+
+def _value(record, name: str):
+    if isinstance(record, dict):
+        return record.get(name)
+    if name == 'raw_json_response':
+        return record.response()
+    return getattr(record, name)
+
+
+def _normalize(value, kind: str):
+    """数据库行 (JSON) 与 dataclass 的取值统一为 Arrow 可接受的值"""
+    if value is None:
+        return [] if kind == 'list' else None
+    if kind == 'list' and isinstance(value, tuple):
+        return list(value)
+    if kind == 'timestamp' and isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if kind == 'float64' and not isinstance(value, float):
+        return float(value)
+    if kind in ('string', 'dict') and not isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else str(value)
+    return value
+
+
+class ArchiveWriter:
+    """
+    流式 Parquet 归档
+
+    write() 可以在扫描回调中逐个 job 调用 (线程安全), 也可以一次传入整批数据库行 (导出)。
+    每个分区保持一个打开的 ParquetWriter, 每批写一个 row group; close() 后文件才完整。
+    """
+
+    def __init__(self, root: Path = ARCHIVE_DIR, batch_rows: int = ARCHIVE_BATCH_ROWS):
+        import pyarrow.parquet  # noqa: F401  缺少 pyarrow 时尽早报错
+
+        self.root = Path(root)
+        self.batch_rows = batch_rows
+        self._job_schema = _schema(JOB_FIELDS)
+        self._result_schema = _schema(RESULT_FIELDS)
+        self._pending: Dict[Tuple[str, str, str], Tuple[list, list]] = {}
+        self._writers = {}
+        self._lock = threading.Lock()
+
+        # 统计
+        self.jobs_written = 0
+        self.results_written = 0
+        self.files = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, jobs: Sequence, results: Sequence):
+        """
+        缓冲一批 job 及其结果 (ScanJob / ScanResult 或 raw 表的行)
+
+        job_id 不在本批 jobs 中的结果被忽略。
+        """
+        by_id = {str(_value(job, 'id')): job for job in jobs}
+        with self._lock:
+            for job in jobs:
+                self._buffer(job)[0].append(job)
+            for result in results:
+                job = by_id.get(str(_value(result, 'job_id')))
+                if job is not None:
+                    self._buffer(job)[1].append((job, result))
+            for key, (pending_jobs, pending_results) in list(self._pending.items()):
+                if len(pending_jobs) + len(pending_results) >= self.batch_rows:
+                    self._flush(key)
+
+    def close(self):
+        """写出剩余缓冲并关闭所有 Parquet 文件"""
+        with self._lock:
+            for key in list(self._pending):
+                self._flush(key)
+            for writer in self._writers.values():
+                writer.close()
+            self._writers.clear()
+
+    def _buffer(self, job) -> Tuple[list, list]:
+        key = tuple(str(_value(job, name)) for name in PARTITIONS)
+        if key not in self._pending:
+            self._pending[key] = ([], [])
+        return self._pending[key]
+
+    def _flush(self, key: Tuple[str, str, str]):
+        import pyarrow as pa
+
+        jobs, results = self._pending.pop(key)
+        if jobs:
+            batch = pa.RecordBatch.from_arrays([
+                pa.array([_normalize(_value(job, name), kind) for job in jobs], type=_arrow_type(pa, kind))
+                for name, kind in JOB_FIELDS
+            ], schema=self._job_schema)
+            self._writer('jobs', key, self._job_schema).write_batch(batch)
+            self.jobs_written += len(jobs)
+        if results:
+            batch = pa.RecordBatch.from_arrays([
+                pa.array([
+                    _normalize(_value(job if name in RESULT_JOB_FIELDS else result, name), kind)
+                    for job, result in results
+                ], type=_arrow_type(pa, kind))
+                for name, kind in RESULT_FIELDS
+            ], schema=self._result_schema)
+            self._writer('results', key, self._result_schema).write_batch(batch)
+            self.results_written += len(results)
+
+    def _writer(self, kind: str, key: Tuple[str, str, str], schema):
+        import pyarrow.parquet as pq
+
+        writer = self._writers.get((kind, key))
+        if writer is None:
+            directory = self.root / kind
+            for name, value in zip(PARTITIONS, key):
+                directory = directory / f'{name}={value}'
+            directory.mkdir(parents=True, exist_ok=True)
+            writer = pq.ParquetWriter(
+                directory / f'part-{uuid.uuid4().hex[:12]}.parquet', schema, compression='zstd'
+            )
+            self._writers[(kind, key)] = writer
+            self.files += 1
+        return writer
+
+
+def remove_run(scan_run_id: str, root: Path = ARCHIVE_DIR):
+    """删除一次扫描的归档 (重新导出前调用, 避免重复行)"""
+    for kind in ('jobs', 'results'):
+        shutil.rmtree(Path(root) / kind / f'scan_run_id={scan_run_id}', ignore_errors=True)
+
+
+def read_archive(
+    kind: str = 'results',
+    scan_run_id: Optional[str] = None,
+    district: Optional[str] = None,
+    platform: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    root: Path = ARCHIVE_DIR
+):
+    """
+    读取归档为 Arrow Table
+
+    文件以 memory_map 方式打开, 只读取所需的分区和列; 分区列以字典列的形式返回。
+
+    Args:
+        kind: 'jobs' 或 'results'
+        scan_run_id / district / platform: 分区过滤, None 表示全部
+        columns: 只读取这些列 (默认全部)
+    """
+    import pyarrow.parquet as pq
+
+    if kind not in ('jobs', 'results'):
+        raise ValueError(f"Unknown archive kind: {kind}")
+    filters = [
+        (name, '=', value)
+        for name, value in zip(PARTITIONS, (scan_run_id, district, platform))
+        if value is not None
+    ]
+    return pq.read_table(
+        Path(root) / kind,
+        columns=columns,
+        filters=filters or None,
+        partitioning='hive',
+        memory_map=True
+    )
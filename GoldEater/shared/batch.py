@@ -0,0 +1,143 @@
+"""
+GoldEater 批处理扫描
+
+周扫描没有时延要求, 支持批处理接口的平台 (OpenAI Batch, Anthropic Message Batches)
+走离线批处理: 任务写成 JSONL → 提交 → 轮询 → 下载输出 → 用与同步路径相同的
+解析代码生成 ScanJob / ScanResult。
+
+已提交批次的 batch_id 及其 custom_id 记录在
+STATE_DIR/batches/<scan_run_id>/<platform>/manifest.json, 续跑时重新挂接尚未收取的批次,
+不会重复提交。
+
+GoldEater 需要提供:
+    SUPPORTS_BATCH = True
+    MAX_BATCH_REQUESTS                         单个批次的请求数上限
+    batch_request(custom_id, task) -> dict     JSONL 中的一行
+    submit_batch(path) -> batch_id
+    batch_status(batch_id) -> 'running' | 'ended' | 'failed'
+    batch_outputs(batch_id) -> Iterator[(custom_id, Completion 或 Exception)]
+    task_cache_key(task) -> str                响应缓存 key
+    build_task_records(task, completion) -> (ScanJob, List[ScanResult])
+"""
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from .config import STATE_DIR, BATCH_POLL_INTERVAL
+
+BATCH_DIR = STATE_DIR / 'batches'
+
+
+class BatchFailed(Exception):
+    """批次整体失败或过期"""
+
+
+def batch_custom_id(task: dict) -> str:
+    """批处理请求的 custom_id (平台内唯一, 满足 ^[a-zA-Z0-9_-]{1,64}$)"""
+    return f"{task['h3_index']}-{task['prompt_type']}-{task['tap_number']}"
+
+
+class BatchRunner:
+    """单个平台的批处理执行器"""
+
+    def __init__(self, eater, scan_run_id: str, poll_interval: float = BATCH_POLL_INTERVAL):
+        self.eater = eater
+        self.poll_interval = poll_interval
+        self.workdir = Path(BATCH_DIR) / scan_run_id / eater.PLATFORM
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.workdir / 'manifest.json'
+
+    def run(self, tasks: List[dict], on_done: Callable, on_error: Callable):
+        """提交全部任务并等待批次结束, 每个任务回调一次 on_done 或 on_error"""
+        by_id = {}
+        for task in tasks:
+            # 缓存命中的任务直接在本地生成结果
+            cached = self.eater.cache.get(self.eater.task_cache_key(task))
+            if cached is None:
+                by_id[batch_custom_id(task)] = task
+                continue
+            # 与 _collect 相同: 单个条目解析失败只影响该任务
+            try:
+                job, results = self.eater.build_task_records(task, cached)
+            except Exception as e:
+                on_error(task, e)
+                continue
+            on_done(task, job, results)
+        if not by_id:
+            return
+
+        # 重新挂接之前已提交、尚未收取的批次
+        manifest = self._load_manifest()
+        pending = {}
+        for batch_id, ids in manifest.items():
+            ids = [i for i in ids if i in by_id]
+            if ids:
+                pending[batch_id] = ids
+                print(f"  {self.eater.PLATFORM}: reattached batch {batch_id} ({len(ids)} requests)")
+        covered = {i for ids in pending.values() for i in ids}
+
+        ids = [i for i in by_id if i not in covered]
+        size = self.eater.MAX_BATCH_REQUESTS
+        for start in range(0, len(ids), size):
+            chunk = ids[start:start + size]
+            path = self.workdir / f'input-{time.strftime("%Y%m%d-%H%M%S")}-{start // size:04d}.jsonl'
+            with open(path, 'w', encoding='utf-8') as f:
+                for custom_id in chunk:
+                    f.write(json.dumps(self.eater.batch_request(custom_id, by_id[custom_id]), ensure_ascii=False) + '\n')
+            batch_id = self.eater.submit_batch(path)
+            manifest[batch_id] = chunk
+            self._save_manifest(manifest)
+            pending[batch_id] = chunk
+            print(f"  {self.eater.PLATFORM}: submitted batch {batch_id} ({len(chunk)} requests)")
+
+        while pending:
+            for batch_id in list(pending):
+                try:
+                    status = self.eater.batch_status(batch_id)
+                except Exception as e:
+                    # 轮询失败不影响批次本身, 下一轮再查
+                    print(f"  {self.eater.PLATFORM}: could not poll batch {batch_id}: {e}")
+                    continue
+                if status == 'running':
+                    continue
+                chunk = pending.pop(batch_id)
+                if status == 'failed':
+                    error = BatchFailed(f"{self.eater.PLATFORM} batch {batch_id} failed")
+                    for custom_id in chunk:
+                        on_error(by_id[custom_id], error)
+                else:
+                    self._collect(batch_id, chunk, by_id, on_done, on_error)
+                # 收取完毕后不再挂接; 失败的任务续跑时重新提交
+                manifest.pop(batch_id, None)
+                self._save_manifest(manifest)
+            if pending:
+                time.sleep(self.poll_interval)
+
+    def _collect(self, batch_id: str, chunk: List[str], by_id: Dict[str, dict], on_done, on_error):
+        remaining = set(chunk)
+        for custom_id, output in self.eater.batch_outputs(batch_id):
+            task = by_id.get(custom_id)
+            if task is None:
+                continue
+            remaining.discard(custom_id)
+            if isinstance(output, Exception):
+                on_error(task, output)
+                continue
+            self.eater.cache.put(self.eater.task_cache_key(task), output)
+            try:
+                job, results = self.eater.build_task_records(task, output)
+            except Exception as e:
+                on_error(task, e)
+                continue
+            on_done(task, job, results)
+        for custom_id in remaining:
+            on_error(by_id[custom_id], BatchFailed(f"No output for {custom_id} in batch {batch_id}"))
+
+    def _load_manifest(self) -> Dict[str, List[str]]:
+        if self.manifest_path.exists():
+            return json.loads(self.manifest_path.read_text())
+        return {}
+
+    def _save_manifest(self, manifest: Dict[str, List[str]]):
+        self.manifest_path.write_text(json.dumps(manifest, indent=2))
@@ -0,0 +1,372 @@
+"""
+GoldEater 预算调度
+
+按网格顺序跑完全部任务时, 预算中途用完得到的是网格的任意前缀。预算模式 (--budget) 下:
+- ScanBudget: 各平台 (或全部平台合计) 的花费上限, 单位美元 (价格来自 PLATFORM_PRICING) 或 token。
+  任务在派发时预留预估花费 (该平台已完成 job 的平均 token 数), 完成后按回复报告的 tokens_used
+  记账, 失败时释放预留; 已花费 + 在途预留 + 本任务预估超过上限的平台不再接纳新任务。
+- CellPriority: 格子价值, 附近已建档商户多、上次扫描 tap 间排名不一致的格子优先。
+- BudgetScheduler: 按 价值 / tap 序号 从高到低派发任务, 同等价值时已派发样本少的场景优先。
+  未派发的任务留在任务日志中 (pending), 之后可以用 --resume 追加预算继续。
+
+得到的是固定花费下信息量最大的部分热力图: 先覆盖重要格子的全部场景, 再补第二个 tap。
+"""
+import math
+import heapq
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import h3
+
+from .sampling import rank_biased_overlap
+from .config import (
+    PLATFORM_PRICING, PLATFORM_RATE_LIMITS,
+    BUDGET_BUSINESS_WEIGHT, BUDGET_VOLATILITY_WEIGHT, BUDGET_DEFAULT_VOLATILITY
+)
+
+TOTAL = 'total'
+BUDGET_UNITS = ('usd', 'tokens')
+
+
+def parse_budget(specs: Iterable[str]) -> Dict[str, float]:
+    """命令行预算: '25' (全部平台合计) 或 'chatgpt=10' (单个平台), 可以组合"""
+    limits = {}
+    for spec in specs:
+        platform, _, amount = spec.rpartition('=')
+        limits[platform or TOTAL] = float(amount)
+    return limits
+
+
+class ScanBudget:
+    """花费上限与实时记账"""
+
+    def __init__(self, limits: Dict[str, float], unit: str = 'usd', pricing: Dict[str, dict] = PLATFORM_PRICING):
+        """
+        Args:
+            limits: {平台: 上限}, 'total' 为全部平台合计; 未列出的平台只受 total 约束
+            unit: 'usd' 或 'tokens'
+        """
+        if unit not in BUDGET_UNITS:
+            raise ValueError(f"Unknown budget unit: {unit}")
+        self.limits = dict(limits)
+        self.unit = unit
+        self.pricing = pricing
+
+        self.spent = Counter()
+        self.reserved = Counter()
+        self.tokens = Counter()
+        self.calls = Counter()
+        self.refused = Counter()
+
+        # 每个 job 的平均 token 数: (平台, 是否打包) → [总 token, job 数]
+        self._usage: Dict[Tuple[str, bool], List[int]] = defaultdict(lambda: [0, 0])
+        # 在途预留: budget_id → [平台, 每个场景的预留, 未完成的场景数, 每个场景分摊的请求数]
+        self._reservations: Dict[int, list] = {}
+        # 合计预算按平台分配的份额 (allocate), 避免并发高的平台在途预留占满合计预算
+        self._shares: Dict[str, float] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------
+    # 估算
+    # ------------------------------------------------------------
+
+    def cost(self, platform: str, tokens: float, requests: float = 1.0) -> float:
+        """token 数与请求数 → 预算单位的花费"""
+        if self.unit == 'tokens':
+            return tokens
+        price = self.pricing.get(platform, {})
+        return tokens * price.get('per_million_tokens', 0.0) / 1e6 + requests * price.get('per_request', 0.0)
+
+    def seed(self, platform: str, tokens_per_job: float, jobs: int = 1):
+        """用上次扫描的 token 用量作为估算的初始样本"""
+        with self._lock:
+            usage = self._usage[(platform, False)]
+            usage[0] += tokens_per_job * jobs
+            usage[1] += jobs
+
+    def tokens_per_job(self, platform: str, packed: bool = False) -> float:
+        """该平台每个 job 的平均 token 数; 打包 job 没有样本时用单场景的值"""
+        for key in ((platform, packed), (platform, False)):
+            total, jobs = self._usage.get(key, (0, 0))
+            if jobs:
+                return total / jobs
+        return PLATFORM_RATE_LIMITS.get(platform, {}).get('est_tokens', 1500)
+
+    def estimate(self, task: dict) -> float:
+        """一个调度任务 (单场景或打包) 的预估花费"""
+        scenarios = len(task.get('prompt_types', ())) or 1
+        tokens = self.tokens_per_job(task['platform'], 'prompt_types' in task) * scenarios
+        return self.cost(task['platform'], tokens)
+
+    # ------------------------------------------------------------
+    # 记账
+    # ------------------------------------------------------------
+
+    def reserve(self, task: dict) -> bool:
+        """预算足够时为任务预留预估花费并返回 True (任务中记下 budget_id), 否则返回 False"""
+        platform = task['platform']
+        scenarios = len(task.get('prompt_types', ())) or 1
+        with self._lock:
+            estimate = self.estimate(task)
+            if not self._fits(platform, estimate):
+                self.refused[platform] += 1
+                return False
+            self._next_id += 1
+            task['budget_id'] = self._next_id
+            self._reservations[self._next_id] = [platform, estimate / scenarios, scenarios, 1.0 / scenarios]
+            self.reserved[platform] += estimate
+            return True
+
+    def settle(self, task: dict, job):
+        """一个场景 job 完成: 按报告的 tokens_used 记账 (缺失时按预估), 释放对应的预留"""
+        with self._lock:
+            entry = self._reservations.get(task.get('budget_id'))
+            if entry is None:
+                return
+            platform, share, _, requests = entry
+            self._release_share(task['budget_id'], entry)
+            tokens = job.tokens_used
+            if tokens is None:
+                spent = share
+            else:
+                spent = self.cost(platform, tokens, requests)
+                self.tokens[platform] += tokens
+                usage = self._usage[(platform, job.packed)]
+                usage[0] += tokens
+                usage[1] += 1
+            self.spent[platform] += spent
+            self.calls[platform] += requests
+
+    def release(self, task: dict):
+        """任务失败: 释放全部剩余预留, 不记花费"""
+        with self._lock:
+            entry = self._reservations.pop(task.get('budget_id'), None)
+            if entry is not None:
+                self.reserved[entry[0]] -= entry[1] * entry[2]
+
+    def allocate(self, pending: Dict[str, float]):
+        """
+        把合计预算的剩余部分分配给各平台 (每轮调度开始时), pending 为各平台待执行任务的预估花费
+
+        各平台覆盖同样比例的任务, 部分热力图在各平台上是同一批格子;
+        受单平台上限约束的平台用不完的部分分给其他平台 (water-filling)。
+        """
+        total = self.limits.get(TOTAL)
+        pending = {platform: cost for platform, cost in pending.items() if cost > 0}
+        if total is None or not pending:
+            return
+        with self._lock:
+            used = {platform: self.spent[platform] + self.reserved[platform] for platform in pending}
+            caps = {
+                platform: self.limits[platform] - used[platform] if platform in self.limits else float('inf')
+                for platform in pending
+            }
+            left = max(0.0, total - sum(self.spent.values()) - sum(self.reserved.values()))
+            demand = sum(pending.values())
+            allocation = {}
+            for platform in sorted(pending, key=lambda p: caps[p] / pending[p]):
+                fraction = left / demand
+                if pending[platform] * fraction >= caps[platform]:
+                    allocation[platform] = max(0.0, caps[platform])
+                    left -= allocation[platform]
+                    demand -= pending[platform]
+            for platform in pending:
+                if platform not in allocation:
+                    allocation[platform] = pending[platform] * left / demand
+            for platform, amount in allocation.items():
+                self._shares[platform] = used[platform] + amount
+
+    def _release_share(self, budget_id: int, entry: list):
+        entry[2] -= 1
+        self.reserved[entry[0]] -= entry[1]
+        if entry[2] <= 0:
+            del self._reservations[budget_id]
+
+    def _fits(self, platform: str, estimate: float) -> bool:
+        limit = self.limits.get(platform)
+        if limit is not None and self.spent[platform] + self.reserved[platform] + estimate > limit:
+            return False
+        share = self._shares.get(platform)
+        if share is not None and self.spent[platform] + self.reserved[platform] + estimate > share:
+            return False
+        total = self.limits.get(TOTAL)
+        if total is not None and sum(self.spent.values()) + sum(self.reserved.values()) + estimate > total:
+            return False
+        return True
+
+    def report(self) -> Dict[str, dict]:
+        """按平台: 花费、上限、调用数、token 数、被拒绝的任务数"""
+        with self._lock:
+            platforms = sorted(set(self.spent) | set(self.refused) | (set(self.limits) - {TOTAL}))
+            report = {
+                platform: {
+                    'spent': round(self.spent[platform], 4),
+                    'limit': self.limits.get(platform),
+                    'calls': round(self.calls[platform], 1),
+                    'tokens': self.tokens[platform],
+                    'refused': self.refused[platform]
+                }
+                for platform in platforms
+            }
+            report[TOTAL] = {
+                'spent': round(sum(self.spent.values()), 4),
+                'limit': self.limits.get(TOTAL),
+                'calls': round(sum(self.calls.values()), 1),
+                'tokens': sum(self.tokens.values()),
+                'refused': sum(self.refused.values())
+            }
+            return report
+
+
+class CellPriority:
+    """格子 / 序列的信息价值"""
+
+    def __init__(
+        self,
+        business_weight: float = BUDGET_BUSINESS_WEIGHT,
+        volatility_weight: float = BUDGET_VOLATILITY_WEIGHT,
+        default_volatility: float = BUDGET_DEFAULT_VOLATILITY
+    ):
+        self.business_weight = business_weight
+        self.volatility_weight = volatility_weight
+        self.default_volatility = default_volatility
+        self.businesses = Counter()
+        # 1 - 相邻 tap 的平均 RBO: (格子, 平台, 场景) 与按格子平均
+        self.volatility: Dict[Tuple[str, str, str], float] = {}
+        self.cell_volatility: Dict[str, float] = {}
+
+    def set_businesses(self, points: Iterable[Tuple[float, float]], resolutions: Iterable[int]):
+        """
+        已建档商户坐标, 按各分辨率计数 (分层扫描的粗格子也有价值)
+
+        商户所在格子计 1, 相邻一圈计 0.5 (推荐范围不止一个格子)。
+        """
+        resolutions = list(resolutions)
+        for lat, lng in points:
+            for res in resolutions:
+                cell = h3.latlng_to_cell(lat, lng, res)
+                for neighbour in h3.grid_disk(cell, 1):
+                    self.businesses[neighbour] += 1.0 if neighbour == cell else 0.5
+
+    def set_prior_run(self, jobs: List[dict], results: List[dict]):
+        """
+        上次扫描的 job / result 行 (id, h3_index, platform, prompt_type, tap_number / job_id, raw_name, rank_position)
+
+        每个序列相邻 tap 的排名 RBO 越低越不稳定, 需要优先 (也更值得补 tap)。
+        """
+        rankings = defaultdict(list)
+        for row in sorted(results, key=lambda r: r['rank_position'] or 0):
+            rankings[row['job_id']].append(row['raw_name'])
+
+        series = defaultdict(list)
+        for job in jobs:
+            key = (job['h3_index'], job['platform'], job['prompt_type'])
+            series[key].append((job['tap_number'], rankings.get(job['id'], [])))
+
+        by_cell = defaultdict(list)
+        for key, taps in series.items():
+            taps.sort(key=lambda t: t[0])
+            if len(taps) < 2:
+                continue
+            agreement = [rank_biased_overlap(a, b) for (_, a), (_, b) in zip(taps, taps[1:])]
+            self.volatility[key] = 1.0 - sum(agreement) / len(agreement)
+            by_cell[key[0]].append(self.volatility[key])
+        self.cell_volatility = {cell: sum(v) / len(v) for cell, v in by_cell.items()}
+
+    def value(self, h3_index: str, platform: str, prompt_type: str) -> float:
+        volatility = self.volatility.get((h3_index, platform, prompt_type))
+        if volatility is None:
+            volatility = self.cell_volatility.get(h3_index, self.default_volatility)
+        return (
+            1.0
+            + self.business_weight * math.log1p(self.businesses.get(h3_index, 0))
+            + self.volatility_weight * volatility
+        )
+
+    def priority(self, task: dict) -> float:
+        """任务优先级: 价值 / tap 序号 (打包任务取各场景的平均价值)"""
+        prompt_types = task.get('prompt_types') or [task['prompt_type']]
+        value = sum(self.value(task['h3_index'], task['platform'], p) for p in prompt_types) / len(prompt_types)
+        return value / task['tap_number']
+
+
+class BudgetScheduler:
+    """
+    按优先级派发任务并在派发时检查预算
+
+    执行引擎从这里取任务: 串行引擎直接迭代, 线程池引擎每完成一个任务调用一次 next(),
+    asyncio 引擎的每个平台 worker 调用 next(platform)。预算不足时 next 返回 None;
+    在途任务按实际用量记账后可能腾出预算, 所以引擎在任务完成后会再取一次。
+    """
+
+    def __init__(self, tasks: Iterable[dict], budget: ScanBudget, priority: CellPriority):
+        self.budget = budget
+        self._heaps: Dict[str, list] = defaultdict(list)
+        for seq, task in enumerate(tasks):
+            self._heaps[task['platform']].append((-round(priority.priority(task), 6), 0, seq, task))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+        budget.allocate({
+            platform: sum(budget.estimate(task) for *_, task in heap) for platform, heap in self._heaps.items()
+        })
+        # 已派发的 (平台, 场景) 样本数, 同等优先级时少的先派发
+        self._dispatched = Counter()
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        while True:
+            task = self.next()
+            if task is None:
+                return
+            yield task
+
+    def platforms(self) -> List[str]:
+        return list(self._heaps)
+
+    def pending(self, platform: Optional[str] = None) -> int:
+        """尚未派发的任务数"""
+        with self._lock:
+            heaps = [self._heaps[platform]] if platform else self._heaps.values()
+            return sum(len(heap) for heap in heaps)
+
+    def next(self, platform: Optional[str] = None) -> Optional[dict]:
+        """
+        取下一个任务 (指定平台或全部平台中优先级最高的), 没有可派发的任务时返回 None
+
+        某个平台的预算放不下它的堆顶任务时跳过该平台, 其他平台的任务仍可继续派发。
+        """
+        with self._lock:
+            skipped = set()
+            while True:
+                candidates = [platform] if platform else list(self._heaps)
+                best = None
+                for p in candidates:
+                    if p in skipped:
+                        continue
+                    entry = self._top(p)
+                    if entry is not None and (best is None or entry < best[1]):
+                        best = (p, entry)
+                if best is None:
+                    return None
+
+                p, (_, _, _, task) = best
+                if not self.budget.reserve(task):
+                    skipped.add(p)
+                    continue
+                heapq.heappop(self._heaps[p])
+                for prompt_type in task.get('prompt_types') or [task['prompt_type']]:
+                    self._dispatched[(p, prompt_type)] += 1
+                return task
+
+    def _top(self, platform: str):
+        """堆顶任务; 场景样本数变化后重新排序 (惰性更新)"""
+        heap = self._heaps[platform]
+        while heap:
+            priority, dispatched, seq, task = heap[0]
+            current = min(self._dispatched[(platform, p)] for p in task.get('prompt_types') or [task['prompt_type']])
+            if current == dispatched:
+                return heap[0]
+            heapq.heapreplace(heap, (priority, current, seq, task))
+        return None
@@ -0,0 +1,208 @@
+"""
+GoldEater LLM 响应缓存
+
+按 (platform, model_version, system_prompt_version, prompt, temperature, tap_number)
+的哈希把平台原始回复 (Completion) 存在本地 SQLite 中, 支持 TTL 和按总大小的
+LRU 淘汰。解析或落库逻辑修改后可以在不花 API 费用的情况下重跑整个区域。
+
+模式:
+- off: 不读不写 (默认)
+- read_through: 命中直接返回, 未命中调用 API 并写入
+- write_only: 总是调用 API, 只写入 (为之后的离线重跑做准备)
+- offline: 只读缓存, 未命中抛出 CacheMiss, 不产生任何 API 调用
+"""
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from .models import Completion
+from .config import RESPONSE_CACHE_PATH, RESPONSE_CACHE_MODE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_BYTES
+
+CACHE_MODES = ('off', 'read_through', 'write_only', 'offline')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key             TEXT PRIMARY KEY,
+    payload         BLOB NOT NULL,
+    size            INTEGER NOT NULL,
+    created_at      REAL NOT NULL,
+    accessed_at     REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at);
+"""
+
+
+class CacheMiss(Exception):
+    """offline 模式下缓存未命中"""
+
+
+class ResponseCache:
+    """内容寻址的 LLM 响应缓存"""
+
+    def __init__(
+        self,
+        path: Path = RESPONSE_CACHE_PATH,
+        mode: str = RESPONSE_CACHE_MODE,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(_SCHEMA)
+            self._total_bytes = self._conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def make_key(
+        platform: str,
+        model_version: str,
+        system_prompt_version: str,
+        prompt: str,
+        temperature: Optional[float],
+        tap_number: int
+    ) -> str:
+        """缓存 key: 请求要素的 SHA-256"""
+        material = json.dumps(
+            [platform, model_version, system_prompt_version, prompt, temperature, tap_number],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    # ------------------------------------------------------------
+    # 读写
+    # ------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Completion]:
+        if self.mode in ('off', 'write_only'):
+            return None
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT payload, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return Completion(**json.loads(zlib.decompress(row[0])))
+
+    def put(self, key: str, completion: Completion):
+        if self.mode in ('off', 'offline'):
+            return
+        payload = zlib.compress(json.dumps({
+            'content': completion.content,
+            'tokens_used': completion.tokens_used,
+            'citations': completion.citations
+        }, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses (key, payload, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, payload, len(payload), now, now)
+            )
+            self._total_bytes += len(payload) - (old[0] if old else 0)
+            self.writes += 1
+            if self.max_bytes and self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """删除过期条目, 再按 LRU 淘汰到 max_bytes 的 90%"""
+        if self.ttl:
+            self.evictions += self.conn.execute(
+                'DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl,)
+            ).rowcount
+        self._total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        while self._total_bytes > target:
+            rows = self.conn.execute(
+                'SELECT key, size FROM responses ORDER BY accessed_at LIMIT 256'
+            ).fetchall()
+            if not rows:
+                break
+            victims = []
+            for key, size in rows:
+                if self._total_bytes <= target:
+                    break
+                victims.append((key,))
+                self._total_bytes -= size
+            self.conn.executemany('DELETE FROM responses WHERE key = ?', victims)
+            self.evictions += len(victims)
+
+    # ------------------------------------------------------------
+    # 调用入口
+    # ------------------------------------------------------------
+
+    def fetch(self, key: str, fn: Callable[[], Completion]) -> Completion:
+        """按模式读取缓存或调用 fn"""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        if self.mode == 'offline':
+            raise CacheMiss(key)
+        completion = fn()
+        self.put(key, completion)
+        return completion
+
+    async def fetch_async(self, key: str, fn: Callable[[], Awaitable[Completion]]) -> Completion:
+        """fetch 的异步版本"""
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        if self.mode == 'offline':
+            raise CacheMiss(key)
+        completion = await fn()
+        self.put(key, completion)
+        return completion
+
+    def stats(self) -> dict:
+        return {
+            'mode': self.mode,
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'evictions': self.evictions
+        }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """获取进程内共享的响应缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
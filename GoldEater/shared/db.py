@@ -1,7 +1,9 @@
 """
 GoldEater 数据库操作
 """
-from typing import List, Optional
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from dataclasses import asdict
 from .models import ScanJob, ScanResult, Business
 from .config import DatabaseConfig
@@ -25,18 +27,35 @@ class DatabaseClient:
     
     def insert_scan_job(self, job: ScanJob) -> str:
         """插入扫描任务"""
-        data = asdict(job)
-        data['scanned_at'] = job.scanned_at.isoformat()
+        from .storage import job_to_row
+        data = job_to_row(job)
         
         result = self.client.table('raw.scan_jobs').insert(data).execute()
         return result.data[0]['id']
     
+    def insert_scan_jobs(self, jobs: List[ScanJob]) -> List[str]:
+        """批量插入扫描任务"""
+        from .storage import job_to_row
+        data = [job_to_row(job) for job in jobs]
+        result = self.client.table('raw.scan_jobs').insert(data).execute()
+        return [r['id'] for r in result.data]
+    
     def insert_scan_results(self, results: List[ScanResult]) -> List[str]:
         """批量插入扫描结果"""
-        data = [asdict(r) for r in results]
+        from .storage import result_to_row
+        data = [result_to_row(r) for r in results]
         result = self.client.table('raw.scan_results').insert(data).execute()
         return [r['id'] for r in result.data]
     
+    def insert_rows(self, table: str, rows: List[dict]) -> List[str]:
+        """向任意表批量插入已转换好的行"""
+        result = self.client.table(table).insert(rows).execute()
+        return [r.get('id') for r in result.data]
+    
+    def upsert_rows(self, table: str, rows: List[dict], on_conflict: str):
+        """向任意表批量 upsert 已转换好的行"""
+        self.client.table(table).upsert(rows, on_conflict=on_conflict).execute()
+    
     def upsert_business(self, business: Business) -> str:
         """插入或更新商户"""
         data = asdict(business)
@@ -46,6 +65,104 @@ class DatabaseClient:
         ).execute()
         return result.data[0]['id']
     
+    def upsert_businesses(self, businesses: List[Business], chunk_size: int = 500):
+        """批量插入或更新商户"""
+        data = [asdict(b) for b in businesses]
+        for i in range(0, len(data), chunk_size):
+            self.client.table('stg.businesses').upsert(
+                data[i:i + chunk_size],
+                on_conflict='google_place_id'
+            ).execute()
+    
+    def get_businesses(self, district: str) -> List[dict]:
+        """获取区域内已建档的商户"""
+        result = self.client.table('stg.businesses')\
+            .select('*')\
+            .eq('district', district)\
+            .execute()
+        return result.data
+    
+    def get_business_ids(self, google_place_ids: List[str], chunk_size: int = 200) -> dict:
+        """google_place_id → stg.businesses.business_id"""
+        ids = {}
+        for i in range(0, len(google_place_ids), chunk_size):
+            result = self.client.table('stg.businesses')\
+                .select('business_id,google_place_id')\
+                .in_('google_place_id', google_place_ids[i:i + chunk_size])\
+                .execute()
+            ids.update((row['google_place_id'], row['business_id']) for row in result.data)
+        return ids
+    
+    def get_business(self, business_ref: str) -> Optional[dict]:
+        """按 business_id 或 google_place_id 获取一个已建档商户"""
+        try:
+            uuid.UUID(business_ref)
+            column = 'business_id'
+        except ValueError:
+            column = 'google_place_id'
+        result = self.client.table('stg.businesses')\
+            .select('*')\
+            .eq(column, business_ref)\
+            .limit(1)\
+            .execute()
+        return result.data[0] if result.data else None
+    
+    def get_run_jobs(
+        self,
+        scan_run_id: str,
+        columns: str = 'id,h3_index,grid_center_lat,grid_center_lng,district,prompt_type,platform',
+        page_size: int = 1000
+    ) -> List[dict]:
+        """一次扫描的全部 job (默认只取聚合所需的列)"""
+        return self._paged(lambda: self.client.table('raw.scan_jobs')\
+            .select(columns)\
+            .eq('scan_run_id', scan_run_id)\
+            .order('id'), page_size)
+
+    def get_run_results(
+        self,
+        scan_run_id: str,
+        columns: str = 'id,job_id,raw_name,normalized_name,business_id,rank_position',
+        page_size: int = 1000
+    ) -> List[dict]:
+        """一次扫描的全部结果 (默认只取聚合所需的列)"""
+        return self._paged(lambda: self.client.table('raw.scan_results')\
+            .select(f'{columns},scan_jobs!inner(scan_run_id)')\
+            .eq('scan_jobs.scan_run_id', scan_run_id)\
+            .order('id'), page_size)
+
+    def get_run_names(self, scan_run_id: str) -> Tuple[Dict[str, Set[str]], Dict[str, Set[str]]]:
+        """
+        一次扫描中出现过的 raw_name → 出现的格子 / job (位置补全的搜索点和回写范围)
+
+        扫描结束后从落库数据分页读取, 扫描过程中不在内存中累积。
+        """
+        cells = {job['id']: job['h3_index'] for job in self.get_run_jobs(scan_run_id, columns='id,h3_index')}
+        raw_names = defaultdict(set)
+        name_jobs = defaultdict(set)
+        for row in self.get_run_results(scan_run_id, columns='job_id,raw_name'):
+            if row['raw_name'] and row['job_id'] in cells:
+                raw_names[row['raw_name']].add(cells[row['job_id']])
+                name_jobs[row['raw_name']].add(row['job_id'])
+        return raw_names, name_jobs
+
+    def get_run_coverage(self, scan_run_id: str, page_size: int = 1000) -> dict:
+        """分层扫描的覆盖表: 目标格子 → 提供结果的已扫描格子 (不是分层扫描时为空)"""
+        rows = self._paged(lambda: self.client.table('raw.scan_coverage')\
+            .select('h3_index,source_h3_index')\
+            .eq('scan_run_id', scan_run_id)\
+            .order('h3_index'), page_size)
+        return {row['h3_index']: row['source_h3_index'] for row in rows}
+
+    def _paged(self, query: Callable, page_size: int) -> List[dict]:
+        """按页拉取; postgrest 的查询构建器会累积 offset / limit 参数, 每页都由 query() 新建"""
+        rows = []
+        while True:
+            page = query().range(len(rows), len(rows) + page_size - 1).execute().data
+            rows.extend(page)
+            if len(page) < page_size:
+                return rows
+
     def get_unresolved_results(self, limit: int = 100) -> List[dict]:
         """获取未补全位置信息的结果"""
         result = self.client.table('raw.scan_results')\
@@ -55,6 +172,23 @@ class DatabaseClient:
             .execute()
         return result.data
     
+    def update_result_locations_by_name(
+        self,
+        raw_name: str,
+        location_data: dict,
+        job_ids: List[str],
+        chunk_size: int = 100
+    ):
+        """按 raw_name 更新给定 job (本次运行中出现该名称的 job) 下尚未补全位置的结果"""
+        job_ids = list(job_ids)
+        for i in range(0, len(job_ids), chunk_size):
+            self.client.table('raw.scan_results')\
+                .update(location_data)\
+                .eq('raw_name', raw_name)\
+                .in_('job_id', job_ids[i:i + chunk_size])\
+                .is_('google_place_id', 'null')\
+                .execute()
+    
     def update_result_location(self, result_id: str, location_data: dict):
         """更新结果的位置信息"""
         self.client.table('raw.scan_results')\
@@ -0,0 +1,130 @@
+"""
+GoldEater 区域定义与网格缓存
+
+区域边界是 DISTRICTS_DIR 下的 GeoJSON 文件 (<name>.geojson), 支持 Polygon /
+MultiPolygon (整个 LGA), 可以是 Feature、FeatureCollection 或裸 geometry。
+properties.center ({"lat", "lng"}) 可选, 缺省时取边界框中心。
+
+每个 (区域, 分辨率) 的 H3 网格只计算一次, 以 npz 存在 GRID_CACHE_DIR:
+cells (uint64) / lat / lng 三个数组 + 边界哈希。边界文件修改后哈希变化, 缓存自动重建。
+"""
+import os
+import json
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import h3
+import h3.api.numpy_int as h3_np
+import numpy as np
+
+from .config import DISTRICTS_DIR, GRID_CACHE_DIR
+
+
+@dataclass
+class District:
+    """区域边界"""
+    name: str
+    geometry: dict
+    center: Dict[str, float]
+    polygon_hash: str
+
+
+def list_districts(directory: Path = DISTRICTS_DIR) -> List[str]:
+    """已定义的区域名称"""
+    return sorted(p.stem for p in Path(directory).glob('*.geojson'))
+
+
+def _geometry(data: dict) -> dict:
+    """Feature / FeatureCollection / geometry → 单个 Polygon 或 MultiPolygon"""
+    if data['type'] == 'Feature':
+        return _geometry(data['geometry'])
+    if data['type'] == 'FeatureCollection':
+        polygons = []
+        for feature in data['features']:
+            geometry = _geometry(feature)
+            if geometry['type'] == 'Polygon':
+                polygons.append(geometry['coordinates'])
+            else:
+                polygons.extend(geometry['coordinates'])
+        return {'type': 'MultiPolygon', 'coordinates': polygons}
+    if data['type'] in ('Polygon', 'MultiPolygon'):
+        return {'type': data['type'], 'coordinates': data['coordinates']}
+    raise ValueError(f"Unsupported GeoJSON type: {data['type']}")
+
+
+def _bbox_center(geometry: dict) -> Dict[str, float]:
+    rings = geometry['coordinates'] if geometry['type'] == 'Polygon' else [
+        ring for polygon in geometry['coordinates'] for ring in polygon
+    ]
+    points = np.array([point[:2] for ring in rings for point in ring], dtype=np.float64)
+    lng_min, lat_min = points.min(axis=0)
+    lng_max, lat_max = points.max(axis=0)
+    return {'lat': (lat_min + lat_max) / 2, 'lng': (lng_min + lng_max) / 2}
+
+
+def load_district(name: str, directory: Path = DISTRICTS_DIR) -> District:
+    """读取区域边界"""
+    path = Path(directory) / f'{name}.geojson'
+    if not path.exists():
+        raise ValueError(f"Unknown district: {name} (no {path})")
+    data = json.loads(path.read_text(encoding='utf-8'))
+    geometry = _geometry(data)
+    properties = data.get('properties') or {}
+    canonical = json.dumps(geometry, sort_keys=True, separators=(',', ':'))
+    return District(
+        name=name,
+        geometry=geometry,
+        center=properties.get('center') or _bbox_center(geometry),
+        polygon_hash=hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+    )
+
+
+def _compute_grid(district: District, resolution: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    shape = h3.geo_to_h3shape(district.geometry)
+    cells = np.sort(np.asarray(h3_np.h3shape_to_cells(shape, resolution), dtype=np.uint64))
+    # h3 没有批量 cell_to_latlng, 一次写入预分配数组
+    centers = np.fromiter(
+        (v for cell in cells for v in h3_np.cell_to_latlng(int(cell))),
+        dtype=np.float64,
+        count=2 * len(cells)
+    ).reshape(-1, 2)
+    return cells, centers[:, 0].copy(), centers[:, 1].copy()
+
+
+def district_grid_arrays(
+    name: str,
+    resolution: int,
+    directory: Path = DISTRICTS_DIR,
+    cache_dir: Path = GRID_CACHE_DIR
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    区域网格 (带磁盘缓存)
+
+    Returns:
+        (cells uint64, center_lat, center_lng) 三个等长数组, 按 cell 排序
+    """
+    district = load_district(name, directory)
+    path = Path(cache_dir) / f'{name}-r{resolution}.npz'
+    if path.exists():
+        with np.load(path) as cached:
+            if str(cached['polygon_hash']) == district.polygon_hash:
+                return cached['cells'], cached['lat'], cached['lng']
+
+    cells, lat, lng = _compute_grid(district, resolution)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        np.savez(f, cells=cells, lat=lat, lng=lng, polygon_hash=np.array(district.polygon_hash))
+    os.replace(tmp, path)
+    return cells, lat, lng
+
+
+def district_grid(name: str, resolution: int) -> List[Tuple[str, float, float]]:
+    """区域网格: List of (h3_index, center_lat, center_lng)"""
+    cells, lat, lng = district_grid_arrays(name, resolution)
+    return [
+        (h3.int_to_str(int(cell)), float(cell_lat), float(cell_lng))
+        for cell, cell_lat, cell_lng in zip(cells, lat, lng)
+    ]
@@ -0,0 +1,188 @@
+"""
+GoldEater 分层 (coarse-to-fine) H3 扫描
+
+相邻的 res-10 格子 (约 66 m) 经常得到相同的推荐列表。分层模式先在粗分辨率
+(HIERARCHICAL_START_RESOLUTION) 扫描整个区域, 再逐层用 cell_to_children 细分:
+- 与相邻格子 (缺失时取其最近的已扫描祖先) 的推荐排名一致度 (RBO) 低于阈值, 或
+- 格子内已建档商户数达到阈值
+的格子才继续下探, 直到目标分辨率或格子预算用完。
+没有被扫描到的 res-10 格子继承最近一个已扫描祖先的结果 (coverage)。
+"""
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import h3
+
+from .sampling import rank_biased_overlap
+from .config import (
+    HIERARCHICAL_START_RESOLUTION, HIERARCHICAL_REFINE_RBO,
+    HIERARCHICAL_DENSITY_THRESHOLD, HIERARCHICAL_CELL_BUDGET
+)
+
+
+class HierarchicalGrid:
+    """分层扫描的格子选择与结果继承"""
+
+    def __init__(
+        self,
+        target_cells: Iterable[str],
+        start_resolution: int = HIERARCHICAL_START_RESOLUTION,
+        refine_threshold: float = HIERARCHICAL_REFINE_RBO,
+        density_threshold: int = HIERARCHICAL_DENSITY_THRESHOLD,
+        cell_budget: Optional[int] = HIERARCHICAL_CELL_BUDGET
+    ):
+        self.targets = set(target_cells)
+        if not self.targets:
+            raise ValueError("HierarchicalGrid needs at least one target cell")
+        self.target_resolution = h3.get_resolution(next(iter(self.targets)))
+        self.start_resolution = min(start_resolution, self.target_resolution)
+        self.refine_threshold = refine_threshold
+        self.density_threshold = density_threshold
+        self.cell_budget = cell_budget
+
+        # 每一层中有目标格子作为后代的格子
+        self._levels = {
+            res: {h3.cell_to_parent(c, res) for c in self.targets}
+            for res in range(self.start_resolution, self.target_resolution)
+        }
+        self._levels[self.target_resolution] = self.targets
+
+        self.scanned = set()
+        self.density = Counter()
+        # 格子 → {(platform, prompt_type): (tap, 排名)}, 按格子索引, 细分时不必遍历全部排名
+        self._rankings: Dict[str, Dict[Tuple[str, str], Tuple[int, List[str]]]] = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------
+    # 输入
+    # ------------------------------------------------------------
+
+    def set_businesses(self, points: Iterable[Tuple[float, float]]):
+        """已建档商户坐标, 用于按密度细分"""
+        for lat, lng in points:
+            for res in self._levels:
+                self.density[h3.latlng_to_cell(lat, lng, res)] += 1
+
+    def record(self, job, results):
+        """记录一个 job 的推荐排名 (同一格子/平台/场景保留最小 tap 的结果)"""
+        key = (job.platform, job.prompt_type)
+        ranking = [r.raw_name for r in sorted(results, key=lambda r: r.rank_position)]
+        with self._lock:
+            cell = self._rankings[job.h3_index]
+            current = cell.get(key)
+            if current is None or job.tap_number < current[0]:
+                cell[key] = (job.tap_number, ranking)
+
+    def restore(self, cells: Iterable[str]):
+        """续跑时恢复已扫描的格子 (只用于计算 coverage)"""
+        self.scanned.update(cells)
+
+    # ------------------------------------------------------------
+    # 格子选择
+    # ------------------------------------------------------------
+
+    def initial_cells(self) -> List[Tuple[str, float, float]]:
+        """最粗一层的全部格子 (不受预算限制)"""
+        return self._claim(sorted(self._levels[self.start_resolution]))
+
+    def refine(self, cells: Iterable[str]) -> List[Tuple[str, float, float]]:
+        """
+        决定下一层要扫描的格子
+
+        Returns:
+            List of (h3_index, center_lat, center_lng), 为空表示结束
+        """
+        cells = list(cells)
+        if not cells:
+            return []
+        res = h3.get_resolution(cells[0])
+        if res >= self.target_resolution:
+            return []
+
+        candidates = []
+        for cell in cells:
+            agreement = self.neighbour_agreement(cell)
+            dense = self.density[cell] >= self.density_threshold
+            if dense or (agreement is not None and agreement < self.refine_threshold):
+                candidates.append((agreement if agreement is not None else 1.0, -self.density[cell], cell))
+
+        # 最不一致的格子优先, 同一父格子的子格子整组加入
+        selected = []
+        remaining = None if self.cell_budget is None else self.cell_budget - len(self.scanned)
+        for _, _, cell in sorted(candidates):
+            children = [c for c in h3.cell_to_children(cell, res + 1) if c in self._levels[res + 1]]
+            if remaining is not None:
+                if len(children) > remaining:
+                    continue
+                remaining -= len(children)
+            selected.extend(children)
+        return self._claim(sorted(selected))
+
+    def neighbour_agreement(self, cell: str) -> Optional[float]:
+        """与相邻格子推荐排名的最低平均 RBO; 没有可比较的邻居时为 None"""
+        own = self._cell_rankings(cell)
+        if not own:
+            return None
+        scores = []
+        for neighbour in h3.grid_disk(cell, 1):
+            if neighbour == cell:
+                continue
+            source = self._nearest_scanned(neighbour)
+            if source is None or source == cell:
+                continue
+            other = self._cell_rankings(source)
+            shared = own.keys() & other.keys()
+            if shared:
+                scores.append(sum(rank_biased_overlap(own[k], other[k]) for k in shared) / len(shared))
+        return min(scores) if scores else None
+
+    def _cell_rankings(self, cell: str) -> Dict[Tuple[str, str], List[str]]:
+        with self._lock:
+            rankings = self._rankings.get(cell)
+            return {key: ranking for key, (_, ranking) in rankings.items()} if rankings else {}
+
+    def _nearest_scanned(self, cell: str) -> Optional[str]:
+        for res in range(h3.get_resolution(cell), self.start_resolution - 1, -1):
+            ancestor = h3.cell_to_parent(cell, res)
+            if ancestor in self.scanned:
+                return ancestor
+        return None
+
+    def _claim(self, cells: List[str]) -> List[Tuple[str, float, float]]:
+        self.scanned.update(cells)
+        return [(cell, *h3.cell_to_latlng(cell)) for cell in cells]
+
+    # ------------------------------------------------------------
+    # 输出
+    # ------------------------------------------------------------
+
+    def coverage(self) -> Dict[str, str]:
+        """每个目标格子 → 提供其结果的已扫描祖先 (可能是它自己)"""
+        mapping = {}
+        for target in self.targets:
+            source = self._nearest_scanned(target)
+            if source is not None:
+                mapping[target] = source
+        return mapping
+
+    def coverage_rows(self, scan_run_id: str) -> List[dict]:
+        """raw.scan_coverage 行"""
+        return [
+            {
+                'scan_run_id': scan_run_id,
+                'h3_index': target,
+                'source_h3_index': source,
+                'source_resolution': h3.get_resolution(source)
+            }
+            for target, source in sorted(self.coverage().items())
+        ]
+
+    def stats(self) -> dict:
+        by_resolution = Counter(h3.get_resolution(c) for c in self.scanned)
+        return {
+            'target_cells': len(self.targets),
+            'scanned_cells': len(self.scanned),
+            'by_resolution': dict(sorted(by_resolution.items())),
+            'reduction': round(len(self.targets) / len(self.scanned), 1) if self.scanned else 0.0
+        }
@@ -0,0 +1,187 @@
+"""
+GoldEater 任务日志
+
+本地 SQLite (WAL) 记录每个扫描任务 (h3_index, platform, prompt_type, tap_number)
+的状态: pending / in_flight / done / failed 及尝试次数。进程中断后可用
+orchestrator.py --resume <scan_run_id> 跳过已完成的任务。
+
+状态更新先进入内存缓冲, 按条数或时间合并为一次 executemany 提交,
+不影响扫描吞吐。done 状态由 StreamingWriter 在数据成功落库后写入。
+"""
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+
+from .config import JOURNAL_PATH
+
+TaskKey = Tuple[str, str, str, int]
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    scan_run_id     TEXT PRIMARY KEY,
+    params          TEXT NOT NULL,
+    created_at      REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    scan_run_id     TEXT NOT NULL,
+    h3_index        TEXT NOT NULL,
+    platform        TEXT NOT NULL,
+    prompt_type     TEXT NOT NULL,
+    tap_number      INTEGER NOT NULL,
+    state           TEXT NOT NULL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    error           TEXT,
+    updated_at      REAL NOT NULL,
+    PRIMARY KEY (scan_run_id, h3_index, platform, prompt_type, tap_number)
+) WITHOUT ROWID;
+"""
+
+
+def task_key(task: dict) -> TaskKey:
+    return (task['h3_index'], task['platform'], task['prompt_type'], task['tap_number'])
+
+
+class TaskJournal:
+    """扫描任务状态日志"""
+
+    def __init__(self, path: Path = JOURNAL_PATH, flush_every: int = 500, flush_interval: float = 1.0):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._buffer: List[tuple] = []
+        self._flush_every = flush_every
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    # ------------------------------------------------------------
+    # 运行
+    # ------------------------------------------------------------
+
+    def start_run(self, scan_run_id: str, params: dict, tasks: Iterable[dict]):
+        """登记新的运行及其全部任务 (pending)"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN')
+            self._conn.execute(
+                'INSERT OR IGNORE INTO runs (scan_run_id, params, created_at) VALUES (?, ?, ?)',
+                (scan_run_id, json.dumps(params), now)
+            )
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO tasks '
+                '(scan_run_id, h3_index, platform, prompt_type, tap_number, state, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((scan_run_id, *task_key(t), PENDING, now) for t in tasks)
+            )
+
+    def add_tasks(self, scan_run_id: str, tasks: Iterable[dict]):
+        """向已有运行追加任务 (自适应采样新增的 tap)"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO tasks '
+                '(scan_run_id, h3_index, platform, prompt_type, tap_number, state, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((scan_run_id, *task_key(t), PENDING, now) for t in tasks)
+            )
+
+    def load_run(self, scan_run_id: str) -> dict:
+        """读取运行参数"""
+        row = self._conn.execute(
+            'SELECT params FROM runs WHERE scan_run_id = ?', (scan_run_id,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown scan run: {scan_run_id}")
+        return json.loads(row[0])
+
+    def completed(self, scan_run_id: str) -> Set[TaskKey]:
+        """已完成任务的 key 集合"""
+        self.flush()
+        rows = self._conn.execute(
+            'SELECT h3_index, platform, prompt_type, tap_number FROM tasks '
+            'WHERE scan_run_id = ? AND state = ?',
+            (scan_run_id, DONE)
+        )
+        return {tuple(r) for r in rows}
+
+    def unfinished(self, scan_run_id: str) -> List[TaskKey]:
+        """尚未完成的任务 key"""
+        self.flush()
+        rows = self._conn.execute(
+            'SELECT h3_index, platform, prompt_type, tap_number FROM tasks '
+            'WHERE scan_run_id = ? AND state != ?',
+            (scan_run_id, DONE)
+        )
+        return [tuple(r) for r in rows]
+
+    def cells(self, scan_run_id: str) -> Set[str]:
+        """运行中登记过的全部格子"""
+        rows = self._conn.execute(
+            'SELECT DISTINCT h3_index FROM tasks WHERE scan_run_id = ?', (scan_run_id,)
+        )
+        return {r[0] for r in rows}
+
+    def summary(self, scan_run_id: str) -> Dict[str, int]:
+        """按状态统计任务数"""
+        self.flush()
+        rows = self._conn.execute(
+            'SELECT state, COUNT(*) FROM tasks WHERE scan_run_id = ? GROUP BY state',
+            (scan_run_id,)
+        )
+        return dict(rows.fetchall())
+
+    # ------------------------------------------------------------
+    # 状态更新 (缓冲写入)
+    # ------------------------------------------------------------
+
+    def mark_in_flight(self, scan_run_id: str, task: dict):
+        self._record(scan_run_id, task_key(task), IN_FLIGHT, None)
+
+    def mark_failed(self, scan_run_id: str, task: dict, error: Exception):
+        self._record(scan_run_id, task_key(task), FAILED, f"{type(error).__name__}: {error}")
+
+    def mark_done(self, scan_run_id: str, keys: Iterable[TaskKey]):
+        for key in keys:
+            self._record(scan_run_id, key, DONE, None)
+
+    def _record(self, scan_run_id: str, key: TaskKey, state: str, error):
+        with self._lock:
+            self._buffer.append((state, error, time.time(), 1 if state == IN_FLIGHT else 0, scan_run_id, *key))
+            due = (
+                len(self._buffer) >= self._flush_every
+                or time.monotonic() - self._last_flush >= self._flush_interval
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            if not buffer:
+                return
+            with self._conn:
+                self._conn.execute('BEGIN')
+                # done 之后不再回退到其他状态
+                self._conn.executemany(
+                    'UPDATE tasks SET state = ?, error = ?, updated_at = ?, attempts = attempts + ? '
+                    'WHERE scan_run_id = ? AND h3_index = ? AND platform = ? '
+                    'AND prompt_type = ? AND tap_number = ? AND state != \'done\'',
+                    buffer
+                )
+
+    def close(self):
+        self.flush()
+        self._conn.close()
@@ -0,0 +1,178 @@
+"""
+GoldEater 商户中心网格 (--merchant)
+
+产品文档中的 Geo-Visibility: 以商户为中心建立采样网格, 在每个采样点模拟用户位置提问,
+按采样点到商户的距离加权:
+
+    V_local = Σ (Mentioned at Point_i × Distance Weight_i) / Total Grid Points
+
+- 采样点: 商户所在 MERCHANT_GRID_RESOLUTION 格子的 grid_disk (MERCHANT_GRID_RINGS 圈)
+- Mentioned at Point_i: 该格子的 job 中提及商户的比例 (所有 tap / 场景 / 平台的平均)
+- Distance Weight_i: 按格距线性衰减, 中心 1.0, 第 k 圈 1 - k / (圈数 + 1)
+- Total Grid Points: 有成功 job 的采样点数
+
+格距、直线距离、权重和 V_local 都在按采样点对齐的 NumPy 数组上计算。
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import h3
+import numpy as np
+
+from .names import normalize_name
+from .aggregate import _column
+from .config import MERCHANT_GRID_RESOLUTION, MERCHANT_GRID_RINGS
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat: np.ndarray, lng: np.ndarray, lat0: float, lng0: float) -> np.ndarray:
+    """各点到 (lat0, lng0) 的大圆距离 (米)"""
+    lat, lng = np.radians(lat), np.radians(lng)
+    lat0, lng0 = np.radians(lat0), np.radians(lng0)
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * np.cos(lat0) * np.sin((lng - lng0) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def merchant_cell(business: dict, resolution: int = MERCHANT_GRID_RESOLUTION) -> str:
+    """商户所在的格子: 优先取 stg.businesses.h3_index 的祖先, 否则由坐标计算"""
+    h3_index = business.get('h3_index')
+    if h3_index and h3.get_resolution(h3_index) >= resolution:
+        return h3.cell_to_parent(h3_index, resolution)
+    if business.get('lat') is None or business.get('lng') is None:
+        raise ValueError(f"Business {business.get('business_id')} has neither h3_index nor coordinates")
+    return h3.latlng_to_cell(float(business['lat']), float(business['lng']), resolution)
+
+
+def _round(value: Optional[float], digits: int = 4) -> Optional[float]:
+    return None if value is None else round(value, digits)
+
+
+@dataclass
+class MerchantGrid:
+    """商户周围的采样点, 各列按采样点对齐 (中心在前, 按格距排序)"""
+    business: dict
+    center: str
+    rings: int
+    cells: np.ndarray
+    lat: np.ndarray
+    lng: np.ndarray
+    grid_distance: np.ndarray
+    distance_m: np.ndarray
+    weight: np.ndarray
+
+    @classmethod
+    def around(
+        cls,
+        business: dict,
+        rings: int = MERCHANT_GRID_RINGS,
+        resolution: int = MERCHANT_GRID_RESOLUTION
+    ) -> 'MerchantGrid':
+        if rings < 0:
+            raise ValueError(f"rings must be >= 0, got {rings}")
+        center = merchant_cell(business, resolution)
+        disk = sorted((h3.grid_distance(center, cell), cell) for cell in h3.grid_disk(center, rings))
+        cells = [cell for _, cell in disk]
+        grid_distance = np.array([d for d, _ in disk], dtype=np.int64)
+        points = np.array([h3.cell_to_latlng(cell) for cell in cells], dtype=np.float64)
+
+        # 直线距离以商户坐标为准, 没有坐标时取中心格子的中心
+        if business.get('lat') is not None and business.get('lng') is not None:
+            origin = float(business['lat']), float(business['lng'])
+        else:
+            origin = h3.cell_to_latlng(center)
+
+        return cls(
+            business=business,
+            center=center,
+            rings=rings,
+            cells=np.array(cells, dtype=object),
+            lat=points[:, 0],
+            lng=points[:, 1],
+            grid_distance=grid_distance,
+            distance_m=haversine_m(points[:, 0], points[:, 1], *origin),
+            weight=1.0 - grid_distance / (rings + 1)
+        )
+
+    def points(self) -> List[Tuple[str, float, float]]:
+        """扫描任务使用的 (h3_index, lat, lng)"""
+        return list(zip(self.cells.tolist(), self.lat.tolist(), self.lng.tolist()))
+
+    def mentions(self, jobs: Sequence, results: Sequence) -> np.ndarray:
+        """
+        每个 job 是否提及该商户 (按 jobs 对齐)
+
+        结果按 google_place_id (位置补全后) 或规范化名称与商户匹配。
+        """
+        place_id = self.business.get('google_place_id')
+        target = normalize_name(self.business.get('official_name') or '')
+        job_index = {job_id: i for i, job_id in enumerate(_column(jobs, 'id'))}
+
+        normalized = {}
+        mentioned = np.zeros(len(jobs), dtype=bool)
+        for job_id, result_place, name, raw_name in zip(
+            _column(results, 'job_id'), _column(results, 'google_place_id'),
+            _column(results, 'normalized_name'), _column(results, 'raw_name')
+        ):
+            i = job_index.get(job_id)
+            if i is None or mentioned[i]:
+                continue
+            name = name or raw_name or ''
+            if name not in normalized:
+                normalized[name] = normalize_name(name)
+            if (place_id and result_place == place_id) or (target and normalized[name] == target):
+                mentioned[i] = True
+        return mentioned
+
+    def visibility(self, jobs: Sequence, results: Sequence) -> dict:
+        """
+        由本次扫描的 job / result 计算 V_local (总计、按平台、按场景) 和每个采样点的提及率
+
+        jobs 需要 id / h3_index / platform / prompt_type 列, results 需要
+        job_id / raw_name / normalized_name / google_place_id 列; 不在采样网格中的 job 被忽略。
+        """
+        n = len(self.cells)
+        index = {cell: i for i, cell in enumerate(self.cells.tolist())}
+        job_point = np.fromiter(
+            (index.get(cell, -1) for cell in _column(jobs, 'h3_index')), dtype=np.int64, count=len(jobs)
+        )
+        mentioned = self.mentions(jobs, results).astype(np.float64)
+        platforms = np.asarray(_column(jobs, 'platform'), dtype=object)
+        prompt_types = np.asarray(_column(jobs, 'prompt_type'), dtype=object)
+
+        def score(mask: np.ndarray) -> Tuple[Optional[float], np.ndarray, np.ndarray]:
+            keep = mask & (job_point >= 0)
+            taps = np.bincount(job_point[keep], minlength=n)
+            rate = np.divide(
+                np.bincount(job_point[keep], weights=mentioned[keep], minlength=n), taps,
+                out=np.zeros(n), where=taps > 0
+            )
+            scanned = int((taps > 0).sum())
+            v_local = float((rate * self.weight).sum() / scanned) if scanned else None
+            return v_local, taps, rate
+
+        def breakdown(column: np.ndarray) -> Dict[str, Optional[float]]:
+            return {value: _round(score(column == value)[0]) for value in sorted(set(column.tolist()))}
+
+        v_local, taps, rate = score(np.ones(len(jobs), dtype=bool))
+        return {
+            'business_id': self.business.get('business_id'),
+            'official_name': self.business.get('official_name'),
+            'v_local': _round(v_local),
+            'points': int((taps > 0).sum()),
+            'by_platform': breakdown(platforms),
+            'by_prompt_type': breakdown(prompt_types),
+            'cells': [
+                {
+                    'h3_index': cell,
+                    'grid_distance': int(d),
+                    'distance_m': round(float(m), 1),
+                    'weight': round(float(w), 4),
+                    'taps': int(t),
+                    'mention_rate': round(float(r), 4)
+                }
+                for cell, d, m, w, t, r in zip(
+                    self.cells.tolist(), self.grid_distance, self.distance_m, self.weight, taps, rate
+                )
+            ]
+        }
@@ -0,0 +1,419 @@
+"""
+GoldEater 运行指标
+
+进程内的指标注册表, 限流器 (每次 API 请求)、回复解析、Places 解析、流式落库和调度器都在这里记录:
+- counter: 单调递增的计数 (请求、重试、token、解析策略、Places 命中 / 未命中、任务错误按异常类型)
+- histogram: 固定桶的分布 (请求延迟、任务耗时、落库延迟), 分位数按桶内线性插值估计
+
+扫描期间 MetricsExporter 每 METRICS_EXPORT_INTERVAL 秒把 Prometheus 文本格式写入 METRICS_PATH
+(node_exporter 的 textfile collector 可直接读取), 设置 METRICS_PORT 时同时提供 /metrics 和 /metrics.json;
+扫描结束时 summary() 给出按平台汇总的 JSON。
+
+ProgressReporter 代替逐任务的 print: 每 PROGRESS_INTERVAL 秒最多输出一行进度,
+同一 (平台, 异常类型) 的错误只在首次出现时输出详情。
+"""
+import os
+import json
+import time
+import bisect
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .config import METRICS_PATH, METRICS_PORT, METRICS_EXPORT_INTERVAL, PROGRESS_INTERVAL
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# 名称 → (类型, 说明, 直方图的桶)
+METRICS = {
+    'goldeater_requests_total': ('counter', 'API requests by platform and outcome (ok / error / throttled)', None),
+    'goldeater_request_seconds': ('histogram', 'API request latency, excluding rate-limit waits', LATENCY_BUCKETS),
+    'goldeater_rate_limit_wait_seconds_total': ('counter', 'Time spent waiting for rate-limit tokens or slots', None),
+    'goldeater_retries_total': ('counter', 'Requests retried after throttling', None),
+    'goldeater_tokens_total': ('counter', 'Tokens reported by the provider', None),
+    'goldeater_tasks_total': ('counter', 'Scan tasks by platform and status (done / failed)', None),
+    'goldeater_task_seconds': ('histogram', 'Scan task duration from dispatch to result', LATENCY_BUCKETS),
+    'goldeater_task_errors_total': ('counter', 'Failed scan tasks by exception type', None),
+    'goldeater_parse_total': ('counter', 'Parsed responses by strategy (failed = nothing recovered)', None),
+    'goldeater_places_lookups_total': ('counter', 'Business name resolutions by source and result', None),
+    'goldeater_db_flush_seconds': ('histogram', 'Streaming writer flush latency (jobs + results)', LATENCY_BUCKETS),
+    'goldeater_db_rows_total': ('counter', 'Rows written by the streaming writer', None),
+    'goldeater_db_flush_failures_total': ('counter', 'Flushes that failed after all retries', None),
+    'goldeater_writer_blocked_seconds_total': ('counter', 'Time scan workers waited on a full write queue', None),
+    'goldeater_writer_callback_failures_total': ('counter', 'on_flushed callbacks that raised after a flush', None),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """桶内线性插值; 落在最后一个桶之外时返回最大的桶边界"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """线程安全的 counter / histogram 注册表, 指标名称必须在 METRICS 中声明"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清空全部指标 (每次扫描开始时), Prometheus 会把它当作计数器重置"""
+        with self._lock:
+            self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+            self._histograms: Dict[str, Dict[Labels, _Histogram]] = defaultdict(dict)
+            self.started = time.time()
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        if METRICS[name][0] != 'counter':
+            raise ValueError(f"{name} is not a counter")
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._counters[name][key] += amount
+
+    def observe(self, name: str, value: float, **labels):
+        kind, _, buckets = METRICS[name]
+        if kind != 'histogram':
+            raise ValueError(f"{name} is not a histogram")
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    # ------------------------------------------------------------
+    # 输出
+    # ------------------------------------------------------------
+
+    def prometheus(self) -> str:
+        """Prometheus 文本格式 (0.0.4)"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, _) in METRICS.items():
+                series = self._counters.get(name) if kind == 'counter' else self._histograms.get(name)
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(series.items()):
+                    if kind == 'counter':
+                        lines.append(f"{name}{_labels(key)} {_number(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, n in zip((*value.buckets, float('inf')), value.counts):
+                        cumulative += n
+                        le = '+Inf' if bound == float('inf') else _number(bound)
+                        lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(value.sum)}")
+                    lines.append(f"{name}_count{_labels(key)} {value.count}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        """全部指标的原始值: counter 按标签列出, histogram 给出次数 / 总和 / p50 / p95 / p99"""
+        with self._lock:
+            counters = {
+                name: [{**dict(key), 'value': _number(value)} for key, value in sorted(series.items())]
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: [
+                    {**dict(key), **_describe(histogram)}
+                    for key, histogram in sorted(series.items())
+                ]
+                for name, series in self._histograms.items()
+            }
+        return {'counters': counters, 'histograms': histograms}
+
+    def summary(self) -> dict:
+        """
+        扫描结束时的 JSON 摘要
+
+        platforms: 每个平台的请求数、错误率、重试、token 吞吐 (tokens/s, 按运行时长计)、
+        请求延迟分位数、任务数与按异常类型的错误、解析失败数
+        """
+        elapsed = max(time.time() - self.started, 1e-9)
+        snapshot = self.snapshot()
+        counters, histograms = snapshot['counters'], snapshot['histograms']
+
+        platforms = defaultdict(lambda: {
+            'requests': 0, 'request_errors': 0, 'throttled': 0, 'retries': 0, 'tokens': 0,
+            'tasks_done': 0, 'tasks_failed': 0, 'parse_failures': 0, 'errors': {}
+        })
+        for row in counters.get('goldeater_requests_total', []):
+            stats = platforms[row['platform']]
+            stats['requests'] += row['value']
+            if row['outcome'] == 'error':
+                stats['request_errors'] += row['value']
+            elif row['outcome'] == 'throttled':
+                stats['throttled'] += row['value']
+        for row in counters.get('goldeater_retries_total', []):
+            platforms[row['platform']]['retries'] += row['value']
+        for row in counters.get('goldeater_tokens_total', []):
+            platforms[row['platform']]['tokens'] += row['value']
+        for row in counters.get('goldeater_tasks_total', []):
+            platforms[row['platform']][f"tasks_{row['status']}"] += row['value']
+        for row in counters.get('goldeater_task_errors_total', []):
+            platforms[row['platform']]['errors'][row['error']] = row['value']
+        for row in counters.get('goldeater_parse_total', []):
+            if row['strategy'] == 'failed':
+                platforms[row['platform']]['parse_failures'] += row['value']
+        for row in histograms.get('goldeater_request_seconds', []):
+            platforms[row['platform']]['latency'] = {k: row[k] for k in ('p50', 'p95', 'p99', 'mean')}
+
+        for stats in platforms.values():
+            tasks = stats['tasks_done'] + stats['tasks_failed']
+            stats['task_error_rate'] = round(stats['tasks_failed'] / tasks, 4) if tasks else 0.0
+            stats['tokens_per_second'] = round(stats['tokens'] / elapsed, 1)
+
+        places = defaultdict(dict)
+        for row in counters.get('goldeater_places_lookups_total', []):
+            places[row['source']][row['result']] = row['value']
+
+        flush = next(iter(histograms.get('goldeater_db_flush_seconds', [])), None)
+        database = {
+            'flushes': flush['count'] if flush else 0,
+            'flush_seconds': {k: flush[k] for k in ('p50', 'p95', 'p99', 'mean')} if flush else None,
+            'rows': {row['table']: row['value'] for row in counters.get('goldeater_db_rows_total', [])},
+            'failed_flushes': sum(row['value'] for row in counters.get('goldeater_db_flush_failures_total', [])),
+            'writer_blocked_seconds': round(sum(
+                row['value'] for row in counters.get('goldeater_writer_blocked_seconds_total', [])
+            ), 2),
+            'failed_callbacks': sum(
+                row['value'] for row in counters.get('goldeater_writer_callback_failures_total', [])
+            )
+        }
+
+        return {
+            'elapsed_seconds': round(elapsed, 1),
+            'platforms': dict(platforms),
+            'places': dict(places),
+            'database': database,
+            'metrics': snapshot
+        }
+
+
+def _labels(key: Labels) -> str:
+    if not key:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in key) + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float):
+    return int(value) if float(value).is_integer() else round(value, 6)
+
+
+def _describe(histogram: _Histogram) -> dict:
+    def q(p):
+        value = histogram.quantile(p)
+        return None if value is None else round(value, 4)
+    return {
+        'count': histogram.count,
+        'sum': round(histogram.sum, 4),
+        'mean': round(histogram.sum / histogram.count, 4) if histogram.count else None,
+        'p50': q(0.5),
+        'p95': q(0.95),
+        'p99': q(0.99)
+    }
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """进程内共享的指标注册表"""
+    return _registry
+
+
+class MetricsExporter:
+    """扫描期间定期写出 Prometheus 文本文件, 可选提供 HTTP 端点"""
+
+    def __init__(
+        self,
+        registry: MetricsRegistry = None,
+        path: Optional[Path] = METRICS_PATH,
+        port: Optional[int] = METRICS_PORT,
+        interval: float = METRICS_EXPORT_INTERVAL
+    ):
+        self.registry = registry or get_metrics()
+        self.path = Path(path) if path else None
+        self.port = port
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-exporter', daemon=True)
+        self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        if self.port:
+            self._server = ThreadingHTTPServer(('', self.port), self._handler())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+            print(f"Metrics: http://localhost:{self.port}/metrics")
+        if self.path:
+            self._thread.start()
+
+    def close(self):
+        """停止导出并写出最终的指标文件"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def write(self):
+        """原子替换指标文件, 读取方不会看到写了一半的内容"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        tmp.write_text(self.registry.prometheus())
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write_safely()
+        self._write_safely()
+
+    def _write_safely(self):
+        try:
+            self.write()
+        except OSError as e:
+            print(f"✗ Could not write metrics to {self.path}: {e}")
+
+    def _handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, content_type = registry.prometheus(), 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body, content_type = json.dumps(registry.summary()), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode()
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class ProgressReporter:
+    """限速的进度输出, 同时记录任务数、任务耗时和按异常类型的错误"""
+
+    def __init__(self, total: Optional[int] = None, interval: float = PROGRESS_INTERVAL, registry: MetricsRegistry = None):
+        self.total = total
+        self.interval = interval
+        self.registry = registry or get_metrics()
+        self.done = 0
+        self.failed = 0
+        self._seen_errors = set()
+        self._started = time.monotonic()
+        self._last_print = self._started
+        self._lock = threading.Lock()
+
+    def expect(self, n: int):
+        """追加预期的任务数 (分层扫描的下一轮等)"""
+        with self._lock:
+            self.total = (self.total or 0) + n
+
+    def task_done(self, task: dict):
+        self._record(task, 'done')
+        with self._lock:
+            self.done += 1
+        self._maybe_print()
+
+    def task_failed(self, task: dict, e: Exception, count: int = 1):
+        """记录失败的任务; 同一 (平台, 异常类型) 只在首次出现时输出详情"""
+        self._record(task, 'failed', count)
+        error = type(e).__name__
+        self.registry.inc('goldeater_task_errors_total', count, platform=task['platform'], error=error)
+        key = (task['platform'], error)
+        with self._lock:
+            self.failed += count
+            first = key not in self._seen_errors
+            self._seen_errors.add(key)
+        if first:
+            elapsed = time.monotonic() - task['started'] if 'started' in task else None
+            took = f" after {elapsed:.1f}s" if elapsed is not None else ''
+            print(
+                f"✗ {task['platform']} | {task['h3_index'][:8]}... | {error}{took}: {e} "
+                f"(further {error} errors are only counted)"
+            )
+        self._maybe_print()
+
+    def close(self):
+        self._print()
+
+    def _record(self, task: dict, status: str, count: int = 1):
+        self.registry.inc('goldeater_tasks_total', count, platform=task['platform'], status=status)
+        if 'started' in task:
+            self.registry.observe('goldeater_task_seconds', time.monotonic() - task['started'], platform=task['platform'])
+
+    def _maybe_print(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_print < self.interval:
+                return
+            self._last_print = now
+        self._print()
+
+    def _print(self):
+        with self._lock:
+            done, failed, total = self.done, self.failed, self.total
+        finished = done + failed
+        elapsed = time.monotonic() - self._started
+        rate = finished / elapsed if elapsed > 0 else 0.0
+        if not total:
+            print(f"Progress: {done} done | {failed} failed | {rate:.1f} tasks/s")
+            return
+        eta = f"{max(total - finished, 0) / rate:.0f}s" if rate > 0 else '?'
+        print(
+            f"Progress: {finished}/{total} ({100 * finished / total:.1f}%) | {failed} failed | "
+            f"{rate:.1f} tasks/s | ETA {eta}"
+        )
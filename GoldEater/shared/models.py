@@ -1,12 +1,47 @@
 """
 GoldEater 数据模型
+
+ScanJob / ScanResult 是一次扫描中数量最多的对象, 用 __slots__ 存放并在构造时压缩:
+- 平台、场景、区域、格子等重复出现的短字符串 sys.intern
+- 提示词文本、标签与引用列表按内容去重 (以内容哈希为键的共享池), 相同内容的记录引用同一个对象
+- 标签与引用列表存为元组; raw_json_response 只保留与结果列不同的键
+转换为 raw 表的行 (列表、完整的 raw_json_response) 只在存储边界进行 (shared/storage.py)。
 """
+import sys
+import uuid
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime
-import uuid
 
-@dataclass
+# 共享池上限 (条目数); 满了整体清空, 已引用的对象不受影响, 只是之后的相同内容不再与之合并
+_SHARED_MAX = 65536
+_shared: dict = {}
+
+
+def _share(value):
+    """相同内容返回同一个对象 (提示词文本、标签 / 引用元组)"""
+    if len(_shared) >= _SHARED_MAX:
+        _shared.clear()
+    try:
+        return _shared.setdefault(value, value)
+    except TypeError:   # 元素不可哈希 (例如引用是 dict)
+        return value
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _strings(values) -> tuple:
+    """标签 / 引用列表 → 元组 (元素 intern); 不是列表的异常取值原样保留"""
+    if not values:
+        return ()
+    if not isinstance(values, (list, tuple)):
+        return values
+    return tuple(_intern(v) for v in values)
+
+
+@dataclass(slots=True)
 class ScanJob:
     """扫描任务"""
     h3_index: str
@@ -23,8 +58,48 @@ class ScanJob:
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
     user_prompt_template: Optional[str] = None
     tokens_used: Optional[int] = None
+    
+    # 自适应采样: 与上一次 tap 的 RBO, 序列最后一个 tap 的停止原因
+    tap_agreement: Optional[float] = None
+    stop_reason: Optional[str] = None
+    
+    # 是否来自一次回答多个场景的打包请求
+    packed: bool = False
+    
+    # 回复的解析策略: strict / fenced / embedded / repaired / failed (见 shared/parsing.py)
+    parse_strategy: Optional[str] = None
 
-@dataclass
+    def __post_init__(self):
+        self.h3_index = _intern(self.h3_index)
+        self.district = _intern(self.district)
+        self.prompt_type = _intern(self.prompt_type)
+        self.system_prompt_version = _intern(self.system_prompt_version)
+        self.platform = _intern(self.platform)
+        self.model_version = _intern(self.model_version)
+        self.scan_run_id = _intern(self.scan_run_id)
+        if self.user_prompt_template:
+            # 同一格子/场景的提示词在各平台、各 tap 间相同
+            self.user_prompt_template = _share(self.user_prompt_template)
+
+# raw_json_response 中与结果列重复的键 → 列名
+RESPONSE_COLUMNS = {
+    'name': 'raw_name',
+    'rank': 'rank_position',
+    'reasoning': 'reasoning',
+    'vibe_tags': 'vibe_tags',
+    'negative_flags': 'negative_flags'
+}
+
+
+def _same(value, column_value) -> bool:
+    if value is column_value:
+        return True
+    if isinstance(value, list) and type(column_value) is tuple:
+        return tuple(value) == column_value
+    return type(value) is type(column_value) and value == column_value
+
+
+@dataclass(slots=True)
 class ScanResult:
     """扫描结果"""
     job_id: str
@@ -44,16 +119,55 @@ class ScanResult:
     
     # 定性评价
     reasoning: Optional[str] = None
-    vibe_tags: List[str] = field(default_factory=list)
-    negative_flags: List[str] = field(default_factory=list)
+    vibe_tags: Tuple[str, ...] = ()
+    negative_flags: Tuple[str, ...] = ()
     sentiment_score: Optional[float] = None
     
-    # 引用数据 (Perplexity 专用)
-    citation_urls: List[str] = field(default_factory=list)
+    # 引用数据 (Perplexity 专用, 同一回复的结果共享一个元组)
+    citation_urls: Tuple[str, ...] = ()
     citation_count: Optional[int] = None
     
-    # 原始响应
+    # 原始响应: 构造后只保留与结果列不同的键, 完整内容由 response() 还原
     raw_json_response: Optional[dict] = None
+    response_keys: Tuple[str, ...] = field(default=(), init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.raw_name = _intern(self.raw_name)
+        # 标签组合高度重复, 与引用列表一样按内容共享
+        self.vibe_tags = _share(_strings(self.vibe_tags))
+        self.negative_flags = _share(_strings(self.negative_flags))
+        self.citation_urls = _share(_strings(self.citation_urls))
+
+        response = self.raw_json_response
+        if not isinstance(response, dict) or not response:
+            return
+        rest = {
+            key: value for key, value in response.items()
+            if key not in RESPONSE_COLUMNS or not _same(value, getattr(self, RESPONSE_COLUMNS[key]))
+        }
+        self.response_keys = _share(tuple(_intern(key) for key in response))
+        self.raw_json_response = rest or None
+
+    def response(self) -> Optional[dict]:
+        """完整的原始推荐 (键序与回复一致)"""
+        if not self.response_keys:
+            return self.raw_json_response
+        rest = self.raw_json_response or {}
+        response = {}
+        for key in self.response_keys:
+            if key in rest:
+                response[key] = rest[key]
+            else:
+                value = getattr(self, RESPONSE_COLUMNS[key])
+                response[key] = list(value) if type(value) is tuple else value
+        return response
+
+@dataclass
+class Completion:
+    """AI 平台的原始回复 (调用层与解析层之间的交接对象)"""
+    content: str
+    tokens_used: Optional[int] = None
+    citations: List[str] = field(default_factory=list)
 
 @dataclass
 class Business:
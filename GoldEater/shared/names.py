@@ -0,0 +1,63 @@
+"""
+GoldEater 商户名称规范化与模糊匹配
+"""
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Set
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_name(name: str) -> str:
+    """
+    规范化商户名称, 用于去重和匹配
+
+    "The Café Sydney & Co." → "cafe sydney and co"
+    """
+    if not name:
+        return ''
+    text = unicodedata.normalize('NFKD', name)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.lower().replace('&', ' and ').replace("'", '').replace('’', '')
+    text = _PUNCTUATION.sub(' ', text)
+    text = _WHITESPACE.sub(' ', text).strip()
+    if text.startswith('the '):
+        text = text[4:]
+    return text
+
+
+def name_trigrams(name: str) -> Set[str]:
+    """
+    规范化名称的字符三元组 (与 pg_trgm 相同: 每个词前补两个空格、后补一个空格)
+
+    "cafe sydney" → {"  c", " ca", "caf", "afe", "fe ", "  s", ...}
+    """
+    trigrams = set()
+    for word in name.split():
+        padded = f'  {word} '
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def name_similarity(a: str, b: str) -> float:
+    """
+    两个规范化名称的相似度 (0–1): 三元组 Jaccard 与 token-set 相似度取大
+
+    token-set 把共有的词排在前面再比较字符序列, 词序不同 ("thai pothong" / "pothong thai") 记为 1;
+    一方是另一方的子集时不直接记为 1, 避免 "cafe" 匹配到所有带 cafe 的店名。
+    """
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    trigrams_a, trigrams_b = name_trigrams(a), name_trigrams(b)
+    trigram = len(trigrams_a & trigrams_b) / len(trigrams_a | trigrams_b)
+
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    common = ' '.join(sorted(tokens_a & tokens_b))
+    joined_a = f"{common} {' '.join(sorted(tokens_a - tokens_b))}".strip()
+    joined_b = f"{common} {' '.join(sorted(tokens_b - tokens_a))}".strip()
+    token_set = SequenceMatcher(None, joined_a, joined_b).ratio()
+    return max(trigram, token_set)
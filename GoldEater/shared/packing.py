@@ -0,0 +1,48 @@
+"""
+GoldEater 打包请求拆分
+
+打包模式下一次请求回答多个场景, 回复形如 {"scenarios": {prompt_type: [推荐, ...]}}。
+这里把它拆成每个场景一份与单场景请求格式相同的 Completion, 之后沿用各 GoldEater
+原有的 _build_records 解析。外层回复用 parse_json_response 容错解析, 其策略记为各场景 job 的
+parse_strategy (拆出的场景本身总是合法 JSON)。
+"""
+import json
+from typing import Dict, List, Tuple
+
+from .models import Completion
+from .parsing import FAILED, parse_json_response
+
+
+def unpack_completion(completion: Completion, prompt_types: List[str]) -> Tuple[Dict[str, Completion], str]:
+    """
+    按 prompt_type 拆分打包回复
+
+    token 用量按场景平均分摊 (合计不变), 引用 URL 每个场景都保留。
+    缺失或无法解析的场景得到空推荐列表; scenarios 不是对象时整段回复记为 failed。
+
+    Returns:
+        ({prompt_type: Completion}, 外层回复的解析策略)
+    """
+    parsed, strategy = parse_json_response(completion.content, expect=('scenarios', *prompt_types))
+    scenarios = parsed.get('scenarios', parsed) if isinstance(parsed, dict) else None
+    if not isinstance(scenarios, dict):
+        scenarios, strategy = {}, FAILED
+
+    tokens = completion.tokens_used
+    share = None if tokens is None else tokens // len(prompt_types)
+    parts = {}
+    for i, prompt_type in enumerate(prompt_types):
+        recommendations = scenarios.get(prompt_type) or []
+        if isinstance(recommendations, dict):
+            recommendations = recommendations.get('recommendations', [])
+        if not isinstance(recommendations, list):
+            recommendations = []
+        part_tokens = share
+        if tokens is not None and i == 0:
+            part_tokens += tokens - share * len(prompt_types)
+        parts[prompt_type] = Completion(
+            content=json.dumps({'recommendations': recommendations}, ensure_ascii=False),
+            tokens_used=part_tokens,
+            citations=list(completion.citations)
+        )
+    return parts, strategy
@@ -0,0 +1,210 @@
+"""
+GoldEater 回复解析
+
+各平台的回复并不总是干净的 JSON: Perplexity 没有 JSON 模式, Claude 常在 JSON 外包一段说明
+或 ```json 代码块, 长回复可能在 max_tokens 处被截断。按代价从低到高依次尝试:
+
+- strict:   json.loads 整段回复且形状符合预期 (绝大多数回复在这里返回)
+- fenced:   ``` / ```json 代码块中的 JSON
+- embedded: 文字中嵌入的第一个 JSON 对象 (raw_decode)
+- repaired: 轻度修复后解析: 弯引号、尾随逗号、字符串中的控制字符、截断 (回退到最后一个完整元素并补全括号)
+- failed:   以上都失败
+
+使用的策略记录在 ScanJob.parse_strategy, parse_report() 按平台统计失败率。
+"""
+import re
+import json
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .metrics import get_metrics
+
+STRICT = 'strict'
+FENCED = 'fenced'
+EMBEDDED = 'embedded'
+REPAIRED = 'repaired'
+FAILED = 'failed'
+
+PARSE_STRATEGIES = [STRICT, FENCED, EMBEDDED, REPAIRED, FAILED]
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '„': '"', '″': '"'})
+
+# 截断修复最多回退的元素数, embedded 最多尝试的起点数
+_MAX_CUTS = 20
+_MAX_STARTS = 50
+
+_decoder = json.JSONDecoder()
+_lenient_decoder = json.JSONDecoder(strict=False)
+
+
+def _accept(value: Any, expect: Sequence[str]) -> bool:
+    """是否是预期的回复: 包含 expect 键之一的对象, 或至少含一个对象的列表 (非对象元素在提取时丢弃)"""
+    if isinstance(value, list):
+        return not expect or any(isinstance(item, dict) for item in value)
+    if isinstance(value, dict):
+        return not expect or any(key in value for key in expect)
+    return False
+
+
+def _embedded(text: str, expect: Sequence[str]) -> Optional[Any]:
+    """文字中第一个符合预期的 JSON 对象"""
+    start = text.find('{')
+    attempts = 0
+    while start != -1 and attempts < _MAX_STARTS:
+        attempts += 1
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            pass
+        else:
+            if _accept(value, expect):
+                return value
+        start = text.find('{', start + 1)
+    return None
+
+
+def _truncation_candidates(text: str) -> Iterator[str]:
+    """
+    补全括号后的候选文本
+
+    完整的顶层值直接返回; 被截断时依次回退到最近的几个逗号 (丢弃不完整的元素) 再补全括号。
+    """
+    stack = []
+    in_string = escaped = False
+    cuts = []
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in '{[':
+            stack.append('}' if ch == '{' else ']')
+        elif ch in '}]':
+            if not stack:
+                yield text[:i]
+                return
+            stack.pop()
+            if not stack:
+                yield text[:i + 1]
+                return
+        elif ch == ',':
+            cuts.append((i, ''.join(reversed(stack))))
+    if in_string:
+        yield text + '"' + ''.join(reversed(stack))
+    for i, closers in reversed(cuts[-_MAX_CUTS:]):
+        yield text[:i] + closers
+
+
+def _repaired(text: str, expect: Sequence[str]) -> Optional[Any]:
+    start = text.find('{')
+    if start == -1:
+        return None
+    text = _TRAILING_COMMA.sub(r'\1', text[start:].translate(_SMART_QUOTES))
+    for candidate in _truncation_candidates(text):
+        try:
+            value = _lenient_decoder.decode(_TRAILING_COMMA.sub(r'\1', candidate))
+        except json.JSONDecodeError:
+            continue
+        if _accept(value, expect):
+            return value
+    return None
+
+
+def parse_json_response(content: Optional[str], expect: Sequence[str] = ('recommendations',)) -> Tuple[Any, str]:
+    """
+    从回复中提取 JSON
+
+    Args:
+        content: 回复原文
+        expect: 顶层对象应包含的键之一 (用于挑选正确的对象); 为空则接受任意对象或列表
+
+    Returns:
+        (解析结果, 策略); 失败时为 (None, 'failed')
+    """
+    if not content:
+        return None, FAILED
+    try:
+        value = json.loads(content)
+    except json.JSONDecodeError:
+        pass
+    else:
+        # 合法但不符合预期的 JSON (裸字符串 / 数字、缺少预期键的对象) 继续尝试其他策略
+        if _accept(value, expect):
+            return value, STRICT
+
+    for block in _FENCE.findall(content):
+        try:
+            value = json.loads(block)
+        except json.JSONDecodeError:
+            continue
+        if _accept(value, expect):
+            return value, FENCED
+
+    value = _embedded(content, expect)
+    if value is not None:
+        return value, EMBEDDED
+
+    fenced = _FENCE.search(content)
+    value = _repaired(fenced.group(1) if fenced else content, expect)
+    if value is None and fenced:
+        value = _repaired(content, expect)
+    if value is not None:
+        return value, REPAIRED
+    return None, FAILED
+
+
+def extract_recommendations(content: Optional[str]) -> Tuple[List[dict], str]:
+    """
+    回复中的推荐列表
+
+    Returns:
+        (推荐列表, 策略); 顶层是列表时视为推荐列表本身, 非 dict 的元素被丢弃
+    """
+    parsed, strategy = parse_json_response(content)
+    if isinstance(parsed, dict):
+        recommendations = parsed.get('recommendations') or []
+    elif isinstance(parsed, list):
+        recommendations = parsed
+    else:
+        recommendations = []
+    if not isinstance(recommendations, list):
+        recommendations = []
+    return [rec for rec in recommendations if isinstance(rec, dict)], strategy
+
+
+# ------------------------------------------------------------
+# 统计
+# ------------------------------------------------------------
+
+_stats: Dict[str, Counter] = defaultdict(Counter)
+_stats_lock = threading.Lock()
+
+
+def record_parse(platform: str, strategy: Optional[str]):
+    """记录一次回复的解析策略 (打包回复拆出的多个 job 只记录一次)"""
+    with _stats_lock:
+        _stats[platform][strategy or FAILED] += 1
+    get_metrics().inc('goldeater_parse_total', platform=platform, strategy=strategy or FAILED)
+
+
+def parse_report() -> Dict[str, dict]:
+    """按平台统计: 各策略次数, 总数, 失败率 (%)"""
+    with _stats_lock:
+        report = {}
+        for platform, counts in _stats.items():
+            total = sum(counts.values())
+            report[platform] = {
+                **{strategy: counts[strategy] for strategy in PARSE_STRATEGIES},
+                'total': total,
+                'failure_rate': round(100 * counts[FAILED] / total, 1) if total else 0.0
+            }
+        return report
@@ -54,7 +54,42 @@ What are the top 5 best options nearby?
 Respond in JSON format with: name, rank, reasoning, vibe_tags, negative_flags"""
 }
 
+# 打包模式: 一次请求回答多个场景
+SCENARIO_DESCRIPTIONS = {
+    'generic_best': "the best restaurants overall",
+    'date_night': "a romantic restaurant for a date night",
+    'business_lunch': "a business lunch - professional atmosphere, good for conversation",
+    'avoid_tourist': "eating like a local - no tourist traps, authentic neighborhood hidden gems",
+    'coffee_spot': "a great coffee shop or cafe to work from"
+}
+
+PACKED_PROMPT = """I'm at ({lat}, {lng}) in {district}, Sydney.
+For each of the following situations, what are the top 5 best options nearby?
+{scenarios}
+
+Answer every situation independently. Respond in this JSON format, with one key per situation:
+{{
+  "scenarios": {{
+    "situation_key": [
+      {{
+        "name": "Restaurant Name",
+        "rank": 1,
+        "reasoning": "Why this restaurant is recommended",
+        "vibe_tags": ["Tag1", "Tag2"],
+        "negative_flags": ["Any downsides"]
+      }}
+    ]
+  }}
+}}"""
+
 def get_user_prompt(prompt_type: str, lat: float, lng: float, district: str) -> str:
     """生成用户 Prompt"""
     template = USER_PROMPTS.get(prompt_type, USER_PROMPTS['generic_best'])
     return template.format(lat=lat, lng=lng, district=district)
+
+def get_packed_prompt(prompt_types: list, lat: float, lng: float, district: str) -> str:
+    """生成一次回答多个场景的打包 Prompt (按 prompt_type 返回结果)"""
+    scenarios = '\n'.join(
+        f"- {prompt_type}: {SCENARIO_DESCRIPTIONS[prompt_type]}" for prompt_type in prompt_types
+    )
+    return PACKED_PROMPT.format(lat=lat, lng=lng, district=district, scenarios=scenarios)
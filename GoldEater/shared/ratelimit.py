@@ -0,0 +1,413 @@
+"""
+GoldEater 平台限流器
+
+每个 AI 平台一个 RateLimiter, 所有 GoldEater 的 API 调用都经过它:
+- RPM / TPM 两个令牌桶 (额度来自 PLATFORM_RATE_LIMITS)
+- 读取 Retry-After 和 x-ratelimit-* / anthropic-ratelimit-* 响应头
+- AIMD 并发控制: 成功时并发加性增长, 遇到 429 时乘性减半
+- 429 自动等待重试, 不再直接丢失样本
+- 每次请求的延迟、结果、重试和 token 用量记入运行指标 (shared/metrics.py)
+"""
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .config import PLATFORM_RATE_LIMITS, PLATFORM_CONCURRENCY
+from .metrics import get_metrics
+from .workqueue import SharedTokenBucket, WorkQueue
+
+# 等待并发槽位时的轮询间隔 (秒)
+_SLOT_POLL_INTERVAL = 0.05
+
+
+class TokenBucket:
+    """按分钟补充的令牌桶"""
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """取出 amount 个令牌还需等待的秒数 (0 表示可以立即取)"""
+        self._refill(now)
+        # 单次请求超过桶容量时按满桶放行, 避免永久等待
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= amount
+
+
+class RateLimitExceeded(Exception):
+    """重试次数耗尽后仍被限流"""
+
+
+class RateLimiter:
+    """单平台限流器"""
+
+    def __init__(
+        self,
+        platform: str,
+        rpm: float,
+        tpm: Optional[float] = None,
+        max_concurrency: int = 10,
+        min_concurrency: int = 1,
+        est_tokens: int = 1500,
+        max_retries: int = 6
+    ):
+        self.platform = platform
+        self.request_bucket = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(max_concurrency)
+        self.est_tokens = est_tokens
+        self.max_retries = max_retries
+
+        self.in_flight = 0
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        # 统计
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.wait_seconds = 0.0
+        self.min_concurrency_seen = float(max_concurrency)
+        self.metrics = get_metrics()
+
+    # ------------------------------------------------------------
+    # 令牌与并发槽位
+    # ------------------------------------------------------------
+
+    def _try_acquire(self, tokens: int) -> float:
+        """尝试占用一个请求槽位, 返回需要等待的秒数 (0 表示已占用)"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if self.in_flight >= int(self.concurrency):
+                return _SLOT_POLL_INTERVAL
+
+            wait = self.request_bucket.wait_time(1, now)
+            if self.token_bucket:
+                wait = max(wait, self.token_bucket.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+
+            self.request_bucket.consume(1)
+            if self.token_bucket:
+                self.token_bucket.consume(tokens)
+            self.in_flight += 1
+            self.requests += 1
+            return 0.0
+
+    def _release(self, estimated: int, used: Optional[int]):
+        with self._lock:
+            self.in_flight -= 1
+            # 用实际 token 用量修正预估值
+            if self.token_bucket and used is not None:
+                self.token_bucket.consume(used - estimated)
+
+    def acquire(self, tokens: int):
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait == 0:
+                return
+            self._waited(wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int):
+        while True:
+            if self._needs_refill(tokens):
+                # 共享令牌桶需要访问工作队列, 放到线程中执行, 不阻塞事件循环
+                wait = await asyncio.to_thread(self._try_acquire, tokens)
+            else:
+                wait = self._try_acquire(tokens)
+            if wait == 0:
+                return
+            self._waited(wait)
+            await asyncio.sleep(wait)
+
+    def _needs_refill(self, tokens: int) -> bool:
+        now = time.monotonic()
+        return any(
+            isinstance(bucket, SharedTokenBucket) and bucket.needs_refill(amount, now)
+            for bucket, amount in ((self.request_bucket, 1), (self.token_bucket, tokens))
+        )
+
+    def _waited(self, seconds: float):
+        self.wait_seconds += seconds
+        self.metrics.inc('goldeater_rate_limit_wait_seconds_total', seconds, platform=self.platform)
+
+    # ------------------------------------------------------------
+    # AIMD 与限流信号
+    # ------------------------------------------------------------
+
+    def on_success(self):
+        """加性增长: 约每个并发窗口 +1"""
+        with self._lock:
+            self.concurrency = min(
+                float(self.max_concurrency),
+                self.concurrency + 1.0 / max(self.concurrency, 1.0)
+            )
+
+    def on_throttle(self, retry_after: Optional[float], attempt: int):
+        """乘性减半, 并在 Retry-After (或指数退避) 期间暂停该平台"""
+        if retry_after is None:
+            retry_after = min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+        with self._lock:
+            self.throttled += 1
+            self.concurrency = max(float(self.min_concurrency), self.concurrency / 2)
+            self.min_concurrency_seen = min(self.min_concurrency_seen, self.concurrency)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+    def observe_headers(self, headers: Optional[Any]):
+        """读取限流响应头, 额度耗尽时暂停到重置时间"""
+        if not headers:
+            return
+        for kind in ('requests', 'tokens'):
+            remaining = _header(
+                headers,
+                f'x-ratelimit-remaining-{kind}',
+                f'anthropic-ratelimit-{kind}-remaining'
+            )
+            if remaining is None or _to_float(remaining) != 0:
+                continue
+            reset = _parse_reset(_header(
+                headers,
+                f'x-ratelimit-reset-{kind}',
+                f'anthropic-ratelimit-{kind}-reset'
+            ))
+            if reset:
+                with self._lock:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + reset)
+
+    # ------------------------------------------------------------
+    # 调用入口
+    # ------------------------------------------------------------
+
+    def call(self, fn: Callable[[], Any], tokens: Optional[int] = None) -> Any:
+        """经过限流器执行一次同步 API 调用, 被限流时自动等待重试"""
+        tokens = tokens or self.est_tokens
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens)
+            started = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                self._observe(started, e)
+                self._release(tokens, None)
+                if not self._handle_error(e, attempt):
+                    raise
+                continue
+            self._observe(started, result=result)
+            self._release(tokens, getattr(result, 'tokens_used', None))
+            self.on_success()
+            return result
+
+    async def call_async(self, fn: Callable[[], Awaitable[Any]], tokens: Optional[int] = None) -> Any:
+        """经过限流器执行一次异步 API 调用"""
+        tokens = tokens or self.est_tokens
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async(tokens)
+            started = time.perf_counter()
+            try:
+                result = await fn()
+            except Exception as e:
+                self._observe(started, e)
+                self._release(tokens, None)
+                if not self._handle_error(e, attempt):
+                    raise
+                continue
+            self._observe(started, result=result)
+            self._release(tokens, getattr(result, 'tokens_used', None))
+            self.on_success()
+            return result
+
+    def _observe(self, started: float, error: Optional[Exception] = None, result: Any = None):
+        """记录一次请求 (不含等待限流的时间)"""
+        outcome = 'ok' if error is None else 'throttled' if is_throttle_error(error) else 'error'
+        self.metrics.observe('goldeater_request_seconds', time.perf_counter() - started, platform=self.platform)
+        self.metrics.inc('goldeater_requests_total', platform=self.platform, outcome=outcome)
+        tokens_used = getattr(result, 'tokens_used', None)
+        if tokens_used:
+            self.metrics.inc('goldeater_tokens_total', tokens_used, platform=self.platform)
+
+    def _handle_error(self, e: Exception, attempt: int) -> bool:
+        """处理调用异常, 返回 True 表示应重试"""
+        if not is_throttle_error(e):
+            return False
+        self.on_throttle(retry_after_seconds(e), attempt)
+        if attempt >= self.max_retries:
+            self.gave_up += 1
+            raise RateLimitExceeded(
+                f"{self.platform}: still throttled after {attempt + 1} attempts"
+            ) from e
+        self.retries += 1
+        self.metrics.inc('goldeater_retries_total', platform=self.platform)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'throttled': self.throttled,
+            'retries': self.retries,
+            'gave_up': self.gave_up,
+            'wait_seconds': round(self.wait_seconds, 1),
+            'concurrency': round(self.concurrency, 1),
+            'min_concurrency': round(self.min_concurrency_seen, 1)
+        }
+
+
+# ------------------------------------------------------------
+# 异常与响应头解析 (兼容 openai / anthropic / google / requests / httpx)
+# ------------------------------------------------------------
+
+def _status_code(e: Exception) -> Optional[int]:
+    status = getattr(e, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(e, 'response', None), 'status_code', None)
+    if status is None and isinstance(getattr(e, 'code', None), int):
+        # google.api_core.exceptions.ResourceExhausted.code == 429
+        status = e.code
+    return status
+
+
+def is_throttle_error(e: Exception) -> bool:
+    """是否为限流错误 (HTTP 429)"""
+    return _status_code(e) == 429
+
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    """从异常携带的响应中读取 Retry-After"""
+    headers = getattr(getattr(e, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    retry_after_ms = _header(headers, 'retry-after-ms')
+    if retry_after_ms is not None:
+        return _to_float(retry_after_ms) / 1000.0
+    return _parse_reset(_header(headers, 'retry-after'))
+
+
+def _header(headers: Any, *names: str) -> Optional[str]:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+def _to_float(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    解析重置时间, 返回距现在的秒数
+
+    支持: 秒数 ("12"), Go 风格时长 ("6m0s", "20ms"),
+    RFC 3339 时间戳 (Anthropic) 和 HTTP 日期 (Retry-After)
+    """
+    if not value:
+        return None
+    seconds = _to_float(value)
+    if seconds is not None:
+        return max(0.0, seconds)
+
+    total, number = 0.0, ''
+    units = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch.isdigit() or ch == '.':
+            number += ch
+            i += 1
+            continue
+        unit = 'ms' if value[i:i + 2] == 'ms' else ch
+        if unit not in units or not number:
+            total = None
+            break
+        total += float(number) * units[unit]
+        number = ''
+        i += len(unit)
+    if total is not None and not number:
+        return total
+
+    for parse in (
+        lambda v: datetime.fromisoformat(v.replace('Z', '+00:00')),
+        parsedate_to_datetime
+    ):
+        try:
+            reset_at = parse(value)
+        except (TypeError, ValueError):
+            continue
+        return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+    return None
+
+
+# ------------------------------------------------------------
+# 全局注册表 (同一进程内所有 GoldEater 共享)
+# ------------------------------------------------------------
+
+_limiters: Dict[str, RateLimiter] = {}
+_registry_lock = threading.Lock()
+_shared_queue: Optional[WorkQueue] = None
+
+
+def _share(limiter: RateLimiter, queue: WorkQueue):
+    limiter.request_bucket = SharedTokenBucket(queue, f'{limiter.platform}:rpm', limiter.request_bucket.rate * 60)
+    if limiter.token_bucket:
+        limiter.token_bucket = SharedTokenBucket(queue, f'{limiter.platform}:tpm', limiter.token_bucket.rate * 60)
+
+
+def share_rate_limits(queue: WorkQueue):
+    """
+    各平台的 RPM / TPM 令牌桶改用工作队列中的共享令牌桶 (--worker)
+
+    所有 worker 合计遵守 PLATFORM_RATE_LIMITS; 并发上限与 AIMD 仍按进程计算。
+    """
+    global _shared_queue
+    with _registry_lock:
+        _shared_queue = queue
+        for limiter in _limiters.values():
+            _share(limiter, queue)
+
+
+def get_rate_limiter(platform: str) -> RateLimiter:
+    """获取平台的共享限流器"""
+    with _registry_lock:
+        if platform not in _limiters:
+            limits = PLATFORM_RATE_LIMITS.get(platform, {})
+            _limiters[platform] = RateLimiter(
+                platform=platform,
+                rpm=limits.get('rpm', 60),
+                tpm=limits.get('tpm'),
+                max_concurrency=PLATFORM_CONCURRENCY.get(platform, 10),
+                est_tokens=limits.get('est_tokens', 1500)
+            )
+            if _shared_queue is not None:
+                _share(_limiters[platform], _shared_queue)
+        return _limiters[platform]
+
+
+def throttle_report() -> Dict[str, Dict[str, Any]]:
+    """各平台限流统计"""
+    with _registry_lock:
+        return {platform: limiter.stats() for platform, limiter in _limiters.items()}
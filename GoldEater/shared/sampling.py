@@ -0,0 +1,142 @@
+"""
+GoldEater 自适应 tap 采样
+
+固定 TAP_COUNT 对每个 (格子, 平台, 场景) 都采同样次数。自适应模式下按序列采样:
+每个 tap 完成后用 rank-biased overlap (RBO) 比较最近两次的推荐排名 (规范化名称),
+一致即停止, 不一致则继续加 tap, 直到上限。
+每个序列最后一个 ScanJob 的 stop_reason 记录停止原因:
+- converged: 相邻两次 tap 的 RBO 达到阈值
+- max_taps: 达到 tap 上限仍不一致
+- resumed: 续跑时内存中不足两次 tap, 无法比较
+- failed:   最后一个 tap 执行失败, 序列中断 (没有 job 可记录, 只计入统计; 失败的 tap 留待 --resume)
+"""
+import threading
+from collections import Counter
+from typing import List, Optional, Sequence
+
+from .names import normalize_name
+from .config import ADAPTIVE_MIN_TAPS, ADAPTIVE_MAX_TAPS, ADAPTIVE_RBO_THRESHOLD, RBO_PERSISTENCE
+
+CONVERGED = 'converged'
+MAX_TAPS = 'max_taps'
+RESUMED = 'resumed'
+FAILED = 'failed'
+
+
+def _dedupe(names: Sequence[str]) -> List[str]:
+    seen = set()
+    ranked = []
+    for name in names:
+        key = normalize_name(name)
+        if key and key not in seen:
+            seen.add(key)
+            ranked.append(key)
+    return ranked
+
+
+def rank_biased_overlap(a: Sequence[str], b: Sequence[str], p: float = RBO_PERSISTENCE) -> float:
+    """
+    两个排名列表的外推 RBO (Webber et al. 2010), 取值 0~1
+
+    名称先规范化并去重; 列表长度可以不同。两个空列表视为完全一致。
+    """
+    a, b = _dedupe(a), _dedupe(b)
+    if not a and not b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+
+    short, long_ = (a, b) if len(a) <= len(b) else (b, a)
+    s, l = len(short), len(long_)
+
+    # overlap[d]: 深度 d 处两个前缀的交集大小
+    overlap = [0] * (l + 1)
+    seen_short, seen_long = set(), set()
+    x = 0
+    for d in range(1, l + 1):
+        if d <= s:
+            item = short[d - 1]
+            if item in seen_long:
+                x += 1
+            seen_short.add(item)
+        item = long_[d - 1]
+        if item in seen_short:
+            x += 1
+        seen_long.add(item)
+        overlap[d] = x
+
+    total = sum(overlap[d] / d * p ** d for d in range(1, l + 1))
+    total += sum(overlap[s] * (d - s) / (s * d) * p ** d for d in range(s + 1, l + 1))
+    return (1 - p) / p * total + ((overlap[l] - overlap[s]) / l + overlap[s] / s) * p ** l
+
+
+class AdaptiveSampler:
+    """决定每个采样序列是否继续加 tap, 并统计调用节省"""
+
+    def __init__(
+        self,
+        min_taps: int = ADAPTIVE_MIN_TAPS,
+        max_taps: int = ADAPTIVE_MAX_TAPS,
+        threshold: float = ADAPTIVE_RBO_THRESHOLD,
+        p: float = RBO_PERSISTENCE
+    ):
+        if not 2 <= min_taps <= max_taps:
+            raise ValueError("Adaptive sampling needs 2 <= min_taps <= max_taps")
+        self.min_taps = min_taps
+        self.max_taps = max_taps
+        self.threshold = threshold
+        self.p = p
+        self._lock = threading.Lock()
+        self.series = 0
+        self.calls = 0
+        self.reasons = Counter()
+
+    def agreement(self, previous: Sequence[str], current: Sequence[str]) -> float:
+        return rank_biased_overlap(previous, current, self.p)
+
+    def decide(self, rankings: List[List[str]], last_tap: int) -> Optional[str]:
+        """
+        序列已登记的 tap 全部完成后的决定
+
+        Args:
+            rankings: 本序列在当前进程中已完成 tap 的排名列表 (按 tap 顺序)
+            last_tap: 序列已登记的最大 tap 编号
+
+        Returns:
+            停止原因, None 表示继续下一个 tap
+        """
+        if last_tap < self.min_taps:
+            return None
+        if len(rankings) >= 2 and self.agreement(rankings[-2], rankings[-1]) >= self.threshold:
+            return CONVERGED
+        if last_tap >= self.max_taps:
+            return MAX_TAPS
+        if len(rankings) < 2:
+            return RESUMED
+        return None
+
+    def record(self, taps: int, reason: str):
+        """记录一个已结束的序列"""
+        with self._lock:
+            self.series += 1
+            self.calls += taps
+            self.reasons[reason] += 1
+
+    def record_failed(self, taps: int):
+        """记录一个因最后一个 tap 失败而中断的序列"""
+        self.record(taps, FAILED)
+
+    def report(self, fixed_taps: int) -> dict:
+        """与固定采样预算对比的调用节省"""
+        ceiling = self.series * self.max_taps
+        fixed = self.series * fixed_taps
+        return {
+            'series': self.series,
+            'calls': self.calls,
+            'stop_reasons': dict(self.reasons),
+            'fixed_ceiling_calls': ceiling,
+            'saved_vs_ceiling': ceiling - self.calls,
+            'saved_vs_ceiling_pct': round(100 * (ceiling - self.calls) / ceiling, 1) if ceiling else 0.0,
+            'fixed_tap_count_calls': fixed,
+            'extra_vs_tap_count': self.calls - fixed
+        }
@@ -0,0 +1,303 @@
+"""
+GoldEater 批量存储后端
+
+StorageSink 是 StreamingWriter 落库时使用的接口, 提供两种实现:
+- PostgRESTSink: 通过 Supabase PostgREST 分块并发插入
+- PostgresCopySink: 直连 Postgres, 用二进制 COPY 写入 raw schema
+
+按部署环境选择: 只有 Supabase API 时用 postgrest, 能直连数据库时用 postgres。
+"""
+import uuid
+import threading
+from dataclasses import fields
+from datetime import date, timezone
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from .models import ScanJob, ScanResult
+from .config import DatabaseConfig
+from .db import DatabaseClient
+
+
+class StorageSink:
+    """扫描数据批量写入接口"""
+
+    def write_jobs(self, jobs: List[ScanJob]):
+        raise NotImplementedError
+
+    def write_results(self, results: List[ScanResult]):
+        raise NotImplementedError
+
+    def write_coverage(self, rows: List[dict]):
+        """分层扫描的 res-10 格子 → 已扫描祖先映射 (raw.scan_coverage), 重复写入时覆盖"""
+        raise NotImplementedError
+
+    def write_visibility(self, rows: List[dict]):
+        """mart.visibility_snapshots 行, 同一商户/格子/场景/平台/日期重复写入时覆盖"""
+        raise NotImplementedError
+
+    def write_heatmap(self, rows: List[dict], resolution: Optional[int] = None):
+        """
+        mart.heatmap_cells 行, 同一格子/场景/平台/日期重复写入时覆盖
+
+        resolution 不为 None 时写入热力图金字塔的 mart.heatmap_cells_r{resolution}
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def heatmap_table(resolution: Optional[int] = None) -> str:
+    return 'mart.heatmap_cells' if resolution is None else f'mart.heatmap_cells_r{resolution}'
+
+
+VISIBILITY_CONFLICT = 'business_id,h3_index,prompt_type,platform,snapshot_date'
+HEATMAP_CONFLICT = 'h3_index,prompt_type,platform,snapshot_date'
+
+
+_JOB_FIELDS = [f.name for f in fields(ScanJob)]
+_RESULT_FIELDS = [f.name for f in fields(ScanResult) if f.init]
+
+
+def job_values(job: ScanJob) -> dict:
+    """ScanJob → raw.scan_jobs 列值 (Python 类型)"""
+    return {name: getattr(job, name) for name in _JOB_FIELDS}
+
+
+def result_values(result: ScanResult) -> dict:
+    """ScanResult → raw.scan_results 列值: 元组还原为列表, raw_json_response 还原为完整推荐"""
+    row = {}
+    for name in _RESULT_FIELDS:
+        value = getattr(result, name)
+        row[name] = list(value) if type(value) is tuple else value
+    row['raw_json_response'] = result.response()
+    return row
+
+
+def job_to_row(job: ScanJob) -> dict:
+    """ScanJob → raw.scan_jobs 行 (JSON)"""
+    row = job_values(job)
+    row['scanned_at'] = job.scanned_at.isoformat()
+    return row
+
+
+def result_to_row(result: ScanResult) -> dict:
+    """ScanResult → raw.scan_results 行 (JSON)"""
+    return result_values(result)
+
+
+class PostgRESTSink(StorageSink):
+    """Supabase PostgREST 后端: 分块 + 并发上传"""
+
+    def __init__(self, db=None, chunk_size: int = 500, max_workers: int = 4):
+        self.db = db or DatabaseClient()
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def write_jobs(self, jobs: List[ScanJob]):
+        self._upload('raw.scan_jobs', [job_to_row(j) for j in jobs])
+
+    def write_results(self, results: List[ScanResult]):
+        self._upload('raw.scan_results', [result_to_row(r) for r in results])
+
+    def write_coverage(self, rows: List[dict]):
+        chunks = [rows[i:i + self.chunk_size] for i in range(0, len(rows), self.chunk_size)]
+        for chunk in chunks:
+            self.db.upsert_rows('raw.scan_coverage', chunk, on_conflict='scan_run_id,h3_index')
+
+    def write_visibility(self, rows: List[dict]):
+        self._upsert('mart.visibility_snapshots', rows, VISIBILITY_CONFLICT)
+
+    def write_heatmap(self, rows: List[dict], resolution: Optional[int] = None):
+        self._upsert(heatmap_table(resolution), rows, HEATMAP_CONFLICT)
+
+    def _upsert(self, table: str, rows: List[dict], on_conflict: str):
+        chunks = [rows[i:i + self.chunk_size] for i in range(0, len(rows), self.chunk_size)]
+        list(self._executor.map(lambda chunk: self.db.upsert_rows(table, chunk, on_conflict), chunks))
+
+    def _upload(self, table: str, rows: List[dict]):
+        chunks = [rows[i:i + self.chunk_size] for i in range(0, len(rows), self.chunk_size)]
+        # list() 等待全部分块完成, 任一分块失败时抛出异常
+        list(self._executor.map(lambda chunk: self.db.insert_rows(table, chunk), chunks))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class PostgresCopySink(StorageSink):
+    """直连 Postgres 后端: 二进制 COPY 写入 (需要 psycopg 3)"""
+
+    JOB_COLUMNS = [
+        ('id', 'uuid'),
+        ('h3_index', 'varchar'),
+        ('grid_center_lat', 'numeric'),
+        ('grid_center_lng', 'numeric'),
+        ('district', 'varchar'),
+        ('prompt_type', 'varchar'),
+        ('system_prompt_version', 'varchar'),
+        ('user_prompt_template', 'text'),
+        ('platform', 'varchar'),
+        ('model_version', 'varchar'),
+        ('scan_run_id', 'varchar'),
+        ('tap_number', 'int4'),
+        ('tokens_used', 'int4'),
+        ('tap_agreement', 'numeric'),
+        ('stop_reason', 'varchar'),
+        ('packed', 'bool'),
+        ('parse_strategy', 'varchar'),
+        ('scanned_at', 'timestamptz'),
+    ]
+
+    RESULT_COLUMNS = [
+        ('id', 'uuid'),
+        ('job_id', 'uuid'),
+        ('raw_name', 'varchar'),
+        ('rank_position', 'int4'),
+        ('normalized_name', 'varchar'),
+        ('business_id', 'uuid'),
+        ('business_lat', 'numeric'),
+        ('business_lng', 'numeric'),
+        ('business_address', 'text'),
+        ('google_place_id', 'varchar'),
+        ('cuisine_type', 'varchar'),
+        ('price_level', 'int4'),
+        ('reasoning', 'text'),
+        ('vibe_tags', 'text[]'),
+        ('negative_flags', 'text[]'),
+        ('sentiment_score', 'numeric'),
+        ('citation_urls', 'text[]'),
+        ('citation_count', 'int4'),
+        ('raw_json_response', 'jsonb'),
+    ]
+
+    COVERAGE_COLUMNS = [
+        ('scan_run_id', 'varchar'),
+        ('h3_index', 'varchar'),
+        ('source_h3_index', 'varchar'),
+        ('source_resolution', 'int4'),
+    ]
+
+    VISIBILITY_COLUMNS = [
+        ('business_id', 'uuid'),
+        ('business_normalized_name', 'varchar'),
+        ('h3_index', 'varchar'),
+        ('district', 'varchar'),
+        ('prompt_type', 'varchar'),
+        ('platform', 'varchar'),
+        ('visibility_score', 'int4'),
+        ('avg_rank', 'numeric'),
+        ('mention_frequency', 'numeric'),
+        ('share_of_voice', 'numeric'),
+        ('snapshot_date', 'date'),
+    ]
+
+    HEATMAP_COLUMNS = [
+        ('h3_index', 'varchar'),
+        ('district', 'varchar'),
+        ('center_lat', 'numeric'),
+        ('center_lng', 'numeric'),
+        ('prompt_type', 'varchar'),
+        ('platform', 'varchar'),
+        ('heat_score', 'int4'),
+        ('avg_visibility', 'int4'),
+        ('max_visibility', 'int4'),
+        ('business_count', 'int4'),
+        ('competition_score', 'int4'),
+        ('top_businesses', 'jsonb'),
+        ('snapshot_date', 'date'),
+    ]
+
+    def __init__(self, dsn: Optional[str] = None):
+        self.dsn = dsn or DatabaseConfig().postgres_dsn
+        if not self.dsn:
+            raise ValueError("PostgresCopySink requires a DSN (DATABASE_URL)")
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            import psycopg
+            self._conn = psycopg.connect(self.dsn)
+        return self._conn
+
+    def write_jobs(self, jobs: List[ScanJob]):
+        self._copy('raw.scan_jobs', self.JOB_COLUMNS, (job_values(j) for j in jobs))
+
+    def write_results(self, results: List[ScanResult]):
+        self._copy('raw.scan_results', self.RESULT_COLUMNS, (result_values(r) for r in results))
+
+    def write_coverage(self, rows: List[dict]):
+        # 覆盖表很小, 续跑时会重复写入, 用 upsert 而不是 COPY
+        names = [name for name, _ in self.COVERAGE_COLUMNS]
+        with self._lock, self.conn.transaction(), self.conn.cursor() as cur:
+            cur.executemany(
+                f"INSERT INTO raw.scan_coverage ({', '.join(names)}) "
+                f"VALUES ({', '.join(['%s'] * len(names))}) "
+                "ON CONFLICT (scan_run_id, h3_index) DO UPDATE SET "
+                "source_h3_index = EXCLUDED.source_h3_index, "
+                "source_resolution = EXCLUDED.source_resolution",
+                [[row[name] for name in names] for row in rows]
+            )
+
+    def write_visibility(self, rows: List[dict]):
+        self._copy_upsert('mart.visibility_snapshots', self.VISIBILITY_COLUMNS, rows, VISIBILITY_CONFLICT)
+
+    def write_heatmap(self, rows: List[dict], resolution: Optional[int] = None):
+        self._copy_upsert(heatmap_table(resolution), self.HEATMAP_COLUMNS, rows, HEATMAP_CONFLICT)
+
+    def _copy_upsert(self, table: str, columns: list, rows: List[dict], conflict: str):
+        """COPY 到临时表, 再一条 INSERT ... ON CONFLICT 合并进目标表"""
+        names = ', '.join(name for name, _ in columns)
+        keys = set(conflict.split(','))
+        updates = ', '.join(f"{name} = EXCLUDED.{name}" for name, _ in columns if name not in keys)
+        with self._lock, self.conn.transaction(), self.conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE _stage (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP")
+            with cur.copy(f"COPY _stage ({names}) FROM STDIN (FORMAT BINARY)") as copy:
+                copy.set_types([pg_type for _, pg_type in columns])
+                for row in rows:
+                    copy.write_row([_adapt(row[name], pg_type) for name, pg_type in columns])
+            cur.execute(
+                f"INSERT INTO {table} ({names}) SELECT {names} FROM _stage "
+                f"ON CONFLICT ({conflict}) DO UPDATE SET {updates}"
+            )
+
+    def _copy(self, table: str, columns: list, rows):
+        names = ', '.join(name for name, _ in columns)
+        with self._lock, self.conn.transaction(), self.conn.cursor() as cur:
+            with cur.copy(f"COPY {table} ({names}) FROM STDIN (FORMAT BINARY)") as copy:
+                copy.set_types([pg_type for _, pg_type in columns])
+                for row in rows:
+                    copy.write_row([_adapt(row[name], pg_type) for name, pg_type in columns])
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _adapt(value, pg_type: str):
+    """把 Python 值转换为二进制 COPY 可接受的类型"""
+    if value is None:
+        return None
+    if pg_type == 'uuid':
+        return uuid.UUID(str(value))
+    if pg_type == 'numeric':
+        return Decimal(str(value))
+    if pg_type == 'timestamptz':
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if pg_type == 'date' and isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def create_sink(backend: Optional[str] = None, db=None) -> StorageSink:
+    """按配置创建存储后端 ('postgrest' 或 'postgres')"""
+    backend = backend or DatabaseConfig().storage_backend
+    if backend == 'postgrest':
+        return PostgRESTSink(db)
+    if backend == 'postgres':
+        return PostgresCopySink()
+    raise ValueError(f"Unknown storage backend: {backend}")
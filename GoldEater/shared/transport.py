@@ -0,0 +1,174 @@
+"""
+GoldEater 共享 HTTP 传输层
+
+所有 GoldEater 的 HTTP 调用共用这里的连接池配置:
+- 按主机复用 keep-alive 连接, 连接池大小与扫描并发一致
+- 显式的连接 / 读取超时, 卡住的 socket 不会让 worker 永远挂起
+- 只对可安全重试的失败做带抖动的重试 (连接失败、幂等请求的 502/503/504);
+  429 交给 RateLimiter 处理
+- 按主机统计请求数和新建连接数, 两者之差即连接复用次数
+
+requests 调用 (Places, Perplexity) 使用 get_session();
+SDK (OpenAI, Anthropic) 和异步调用使用 create_http_client() / create_async_http_client()。
+"""
+import threading
+from collections import defaultdict
+from typing import Dict
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .config import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_POOL_SIZE, HTTP_RETRIES
+
+
+class _HostStats:
+    __slots__ = ('requests', 'connections')
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+
+
+_stats: Dict[str, _HostStats] = defaultdict(_HostStats)
+_stats_lock = threading.Lock()
+
+
+def _host_stats(host: str) -> _HostStats:
+    with _stats_lock:
+        return _stats[host]
+
+
+def http_timeout() -> httpx.Timeout:
+    """SDK / httpx 客户端使用的超时配置"""
+    return httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_POOL_SIZE,
+        max_keepalive_connections=HTTP_POOL_SIZE
+    )
+
+
+# ------------------------------------------------------------
+# requests
+# ------------------------------------------------------------
+
+class _TimeoutSession(requests.Session):
+    """未显式传入 timeout 时使用默认连接 / 读取超时"""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+        return super().request(method, url, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """进程内共享的 requests.Session"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=HTTP_RETRIES,
+                connect=HTTP_RETRIES,
+                read=HTTP_RETRIES,
+                status=HTTP_RETRIES,
+                # 只有幂等方法会因读取错误或 5xx 重试; 连接失败时请求尚未发出, 任何方法都可重试
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                status_forcelist=(502, 503, 504),
+                backoff_factor=0.5,
+                backoff_jitter=0.5,
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(
+                pool_connections=16,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=retry
+            )
+            _session = _TimeoutSession()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def _session_stats() -> Dict[str, Dict[str, int]]:
+    """从 urllib3 连接池读取请求数和新建连接数"""
+    stats = {}
+    if _session is None:
+        return stats
+    seen = set()
+    for adapter in _session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            host = stats.setdefault(pool.host, {'requests': 0, 'connections': 0})
+            host['requests'] += pool.num_requests
+            host['connections'] += pool.num_connections
+    return stats
+
+
+# ------------------------------------------------------------
+# httpx (SDK 与异步调用)
+# ------------------------------------------------------------
+
+class _CountingTransport(httpx.HTTPTransport):
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        stats = _host_stats(request.url.host)
+        stats.requests += 1
+
+        def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.complete':
+                stats.connections += 1
+
+        request.extensions['trace'] = trace
+        return super().handle_request(request)
+
+
+class _AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = _host_stats(request.url.host)
+        stats.requests += 1
+
+        async def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.complete':
+                stats.connections += 1
+
+        request.extensions['trace'] = trace
+        return await super().handle_async_request(request)
+
+
+def create_http_client() -> httpx.Client:
+    """同步 httpx 客户端 (传给 OpenAI / Anthropic SDK 的 http_client)"""
+    return httpx.Client(
+        timeout=http_timeout(),
+        transport=_CountingTransport(limits=http_limits(), retries=HTTP_RETRIES)
+    )
+
+
+def create_async_http_client() -> httpx.AsyncClient:
+    """异步 httpx 客户端; 需在使用它的事件循环内创建和使用"""
+    return httpx.AsyncClient(
+        timeout=http_timeout(),
+        transport=_AsyncCountingTransport(limits=http_limits(), retries=HTTP_RETRIES)
+    )
+
+
+def transport_stats() -> Dict[str, Dict[str, int]]:
+    """按主机统计: 请求数, 新建连接数, 复用次数"""
+    merged = _session_stats()
+    with _stats_lock:
+        for host, stats in _stats.items():
+            entry = merged.setdefault(host, {'requests': 0, 'connections': 0})
+            entry['requests'] += stats.requests
+            entry['connections'] += stats.connections
+    for entry in merged.values():
+        entry['reused'] = max(0, entry['requests'] - entry['connections'])
+    return merged
@@ -0,0 +1,474 @@
+"""
+GoldEater 分布式工作队列
+
+调度器把扫描任务放入队列 (orchestrator.py --full-scan --distributed), 任意数量的
+orchestrator.py --worker 进程租用任务执行:
+- lease: 取出一批任务, 租约 WORK_LEASE_SECONDS 秒; 过期未确认的任务回到队列
+- heartbeat: 执行中定期续租
+- ack: 数据落库后确认, 任务完成
+- release: 执行失败时归还, 尝试 WORK_MAX_ATTEMPTS 次后记为 dead
+
+语义是至少一次: worker 卡住超过租约时任务可能被另一个 worker 重复执行。
+
+队列同时保存各平台共享的令牌桶 (SharedTokenBucket), 所有 worker 合计遵守 PLATFORM_RATE_LIMITS。
+
+两种后端, 由 WORK_QUEUE_URL 选择:
+- sqlite:///path/to/queue.db — 单机多进程 (默认 .state/queue.db)
+- redis://host:6379/0 — 多机, 兼容 Redis 协议与 Lua 脚本的服务均可 (需要 redis 包)
+"""
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import WORK_QUEUE_URL, WORK_LEASE_SECONDS, WORK_MAX_ATTEMPTS
+
+Lease = Tuple[str, dict]
+
+
+def task_id(task: dict) -> str:
+    """队列中的任务 id (扫描运行 id 在最前, 按 | 分隔)"""
+    return '|'.join([
+        task['scan_run_id'], task['h3_index'], task['platform'], task['prompt_type'], str(task['tap_number'])
+    ])
+
+
+def run_of(task_id: str) -> str:
+    return task_id.split('|', 1)[0]
+
+
+class WorkQueue:
+    """扫描任务队列接口"""
+
+    def put(self, tasks: Iterable[dict]) -> int:
+        """加入任务 (按 task_id 去重), 返回新加入的任务数"""
+        raise NotImplementedError
+
+    def lease(self, worker: str, n: int, lease_seconds: float = WORK_LEASE_SECONDS) -> List[Lease]:
+        """租用最多 n 个任务, 返回 [(task_id, task), ...]"""
+        raise NotImplementedError
+
+    def heartbeat(self, worker: str, task_ids: Iterable[str], lease_seconds: float = WORK_LEASE_SECONDS):
+        """为仍由该 worker 持有的任务续租"""
+        raise NotImplementedError
+
+    def ack(self, task_ids: Iterable[str]):
+        """确认任务完成"""
+        raise NotImplementedError
+
+    def release(self, worker: str, task_id: str, error: str):
+        """归还执行失败的任务; 尝试次数用尽时记为 dead"""
+        raise NotImplementedError
+
+    def stats(self, scan_run_id: str) -> Dict[str, int]:
+        """一次扫描的任务统计: total / done / dead / remaining"""
+        raise NotImplementedError
+
+    def bucket_take(self, name: str, rate: float, capacity: float, amount: float) -> float:
+        """共享令牌桶: 取出最多 amount 个令牌, 返回实际取出的数量"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SharedTokenBucket:
+    """
+    保存在工作队列中的令牌桶, 与 TokenBucket 接口相同
+
+    每次从队列取出约 batch_seconds 秒的额度放在本地, 本地额度够用时不访问队列;
+    实际用量的修正也只记在本地, 欠下的部分由下一次取额度补上。
+    每个 worker 最多多占 batch_seconds 秒的额度。
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        name: str,
+        per_minute: float,
+        burst_seconds: float = 10.0,
+        batch_seconds: float = 1.0
+    ):
+        self.queue = queue
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.batch = max(1.0, self.rate * batch_seconds)
+        self.tokens = 0.0
+        self._empty_until = 0.0
+
+    def needs_refill(self, amount: float, now: float) -> bool:
+        """wait_time 是否会访问队列 (异步调用方据此把它放到线程中执行)"""
+        return self.tokens < min(amount, self.capacity) and now >= self._empty_until
+
+    def wait_time(self, amount: float, now: float) -> float:
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        if now < self._empty_until:
+            return self._empty_until - now
+        self.tokens += self.queue.bucket_take(
+            self.name, self.rate, self.capacity, max(self.batch, amount - self.tokens)
+        )
+        if self.tokens >= amount:
+            return 0.0
+        # 队列中的桶已取空, 等到能取够一批再访问队列
+        wait = (max(amount, self.batch) - self.tokens) / self.rate
+        self._empty_until = now + wait
+        return wait
+
+    def consume(self, amount: float):
+        self.tokens -= amount
+
+
+def _refill(tokens: Optional[float], updated: Optional[float], rate: float, capacity: float, now: float) -> float:
+    if tokens is None:
+        return capacity
+    return min(capacity, tokens + max(0.0, now - updated) * rate)
+
+
+# ------------------------------------------------------------
+# SQLite (单机)
+# ------------------------------------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    seq             INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id         TEXT NOT NULL UNIQUE,
+    scan_run_id     TEXT NOT NULL,
+    payload         TEXT NOT NULL,
+    state           TEXT NOT NULL,
+    worker          TEXT,
+    lease_until     REAL,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    error           TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_queue_state ON queue (state, seq);
+CREATE INDEX IF NOT EXISTS idx_queue_run ON queue (scan_run_id, state);
+
+CREATE TABLE IF NOT EXISTS buckets (
+    name            TEXT PRIMARY KEY,
+    tokens          REAL NOT NULL,
+    updated         REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+READY = 'ready'
+LEASED = 'leased'
+DONE = 'done'
+DEAD = 'dead'
+
+
+class SQLiteQueue(WorkQueue):
+    """SQLite (WAL) 队列, 同一台机器上的多个 worker 进程共享一个文件"""
+
+    def __init__(self, path: Path, max_attempts: int = WORK_MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _write(self):
+        """写事务: BEGIN IMMEDIATE 避免多个进程同时升级写锁"""
+        self._conn.execute('BEGIN IMMEDIATE')
+        return self._conn
+
+    def put(self, tasks: Iterable[dict]) -> int:
+        rows = [(task_id(t), t['scan_run_id'], json.dumps(t), READY) for t in tasks]
+        with self._lock, self._conn:
+            before = self._write().total_changes
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO queue (task_id, scan_run_id, payload, state) VALUES (?, ?, ?, ?)', rows
+            )
+            return self._conn.total_changes - before
+
+    def _reap(self, now: float):
+        """过期的租约回到队列, 尝试次数用尽的记为 dead (需在写事务中调用)"""
+        self._conn.execute(
+            "UPDATE queue SET state = CASE WHEN attempts >= ? THEN 'dead' ELSE 'ready' END, "
+            "error = CASE WHEN attempts >= ? THEN 'lease expired' ELSE error END, worker = NULL "
+            "WHERE state = 'leased' AND lease_until < ?",
+            (self.max_attempts, self.max_attempts, now)
+        )
+
+    def lease(self, worker: str, n: int, lease_seconds: float = WORK_LEASE_SECONDS) -> List[Lease]:
+        now = time.time()
+        with self._lock, self._conn:
+            self._write()
+            self._reap(now)
+            rows = self._conn.execute(
+                "SELECT seq, task_id, payload FROM queue WHERE state = 'ready' ORDER BY seq LIMIT ?", (n,)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE queue SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE seq = ?",
+                [(worker, now + lease_seconds, seq) for seq, _, _ in rows]
+            )
+        return [(tid, json.loads(payload)) for _, tid, payload in rows]
+
+    def heartbeat(self, worker: str, task_ids: Iterable[str], lease_seconds: float = WORK_LEASE_SECONDS):
+        until = time.time() + lease_seconds
+        with self._lock, self._conn:
+            self._write()
+            self._conn.executemany(
+                "UPDATE queue SET lease_until = ? WHERE task_id = ? AND worker = ? AND state = 'leased'",
+                [(until, tid, worker) for tid in task_ids]
+            )
+
+    def ack(self, task_ids: Iterable[str]):
+        with self._lock, self._conn:
+            self._write()
+            self._conn.executemany(
+                "UPDATE queue SET state = 'done', worker = NULL, error = NULL WHERE task_id = ? AND state != 'done'",
+                [(tid,) for tid in task_ids]
+            )
+
+    def release(self, worker: str, task_id: str, error: str):
+        with self._lock, self._conn:
+            self._write()
+            self._conn.execute(
+                "UPDATE queue SET state = CASE WHEN attempts >= ? THEN 'dead' ELSE 'ready' END, "
+                "worker = NULL, error = ? WHERE task_id = ? AND worker = ? AND state = 'leased'",
+                (self.max_attempts, error, task_id, worker)
+            )
+
+    def stats(self, scan_run_id: str) -> Dict[str, int]:
+        # 没有 worker 在租用时, 过期租约也要回收, 否则用尽尝试次数的任务永远不会计入 dead
+        with self._lock, self._conn:
+            self._write()
+            self._reap(time.time())
+            counts = dict(self._conn.execute(
+                'SELECT state, COUNT(*) FROM queue WHERE scan_run_id = ? GROUP BY state', (scan_run_id,)
+            ).fetchall())
+        total = sum(counts.values())
+        done, dead = counts.get(DONE, 0), counts.get(DEAD, 0)
+        return {'total': total, 'done': done, 'dead': dead, 'remaining': total - done - dead}
+
+    def bucket_take(self, name: str, rate: float, capacity: float, amount: float) -> float:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._write().execute('SELECT tokens, updated FROM buckets WHERE name = ?', (name,)).fetchone()
+            tokens = _refill(*(row or (None, None)), rate, capacity, now)
+            taken = min(amount, max(0.0, tokens))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)', (name, tokens - taken, now)
+            )
+        return taken
+
+    def close(self):
+        self._conn.close()
+
+
+# ------------------------------------------------------------
+# Redis (多机)
+# ------------------------------------------------------------
+
+# KEYS: ready, done, dead, tasks, run prefix; ARGV: id, payload, id, payload, ...
+_PUT = """
+local added = {}
+for i = 1, #ARGV, 2 do
+    local id = ARGV[i]
+    if redis.call('SISMEMBER', KEYS[2], id) == 0 and redis.call('HEXISTS', KEYS[3], id) == 0
+        and redis.call('HSETNX', KEYS[4], id, ARGV[i + 1]) == 1 then
+        redis.call('RPUSH', KEYS[1], id)
+        redis.call('HINCRBY', KEYS[5] .. string.match(id, '^[^|]+'), 'total', 1)
+        table.insert(added, id)
+    end
+end
+return #added
+"""
+
+# 过期的租约回到队列, 尝试次数用尽的记为 dead
+# KEYS: ready, leased, tasks, attempts, owners, dead, run prefix; ARGV: now, max_attempts, ...
+_REAP_EXPIRED = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], id)
+    redis.call('HDEL', KEYS[5], id)
+    if tonumber(redis.call('HGET', KEYS[4], id) or '0') >= tonumber(ARGV[2]) then
+        redis.call('HSET', KEYS[6], id, 'lease expired')
+        redis.call('HDEL', KEYS[3], id)
+        redis.call('HINCRBY', KEYS[7] .. string.match(id, '^[^|]+'), 'dead', 1)
+    else
+        redis.call('RPUSH', KEYS[1], id)
+    end
+end
+"""
+
+_REAP = _REAP_EXPIRED + """
+return #expired
+"""
+
+# KEYS: 同 _REAP_EXPIRED; ARGV: now, max_attempts, lease_until, n, worker
+_LEASE = _REAP_EXPIRED + """
+local out = {}
+while #out < 2 * tonumber(ARGV[4]) do
+    local id = redis.call('LPOP', KEYS[1])
+    if not id then break end
+    local payload = redis.call('HGET', KEYS[3], id)
+    if payload then
+        redis.call('HINCRBY', KEYS[4], id, 1)
+        redis.call('ZADD', KEYS[2], ARGV[3], id)
+        redis.call('HSET', KEYS[5], id, ARGV[5])
+        table.insert(out, id)
+        table.insert(out, payload)
+    end
+end
+return out
+"""
+
+# KEYS: leased, owners; ARGV: worker, lease_until, ids...
+_HEARTBEAT = """
+for i = 3, #ARGV do
+    if redis.call('HGET', KEYS[2], ARGV[i]) == ARGV[1] then
+        redis.call('ZADD', KEYS[1], 'XX', ARGV[2], ARGV[i])
+    end
+end
+return 0
+"""
+
+# KEYS: leased, tasks, attempts, owners, run prefix, done; ARGV: ids...
+_ACK = """
+for _, id in ipairs(ARGV) do
+    if redis.call('HDEL', KEYS[2], id) == 1 then
+        redis.call('HINCRBY', KEYS[5] .. string.match(id, '^[^|]+'), 'done', 1)
+        redis.call('SADD', KEYS[6], id)
+    end
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('HDEL', KEYS[3], id)
+    redis.call('HDEL', KEYS[4], id)
+end
+return 0
+"""
+
+# KEYS: ready, leased, tasks, attempts, owners, dead, run prefix; ARGV: worker, id, error, max_attempts
+_RELEASE = """
+if redis.call('HGET', KEYS[5], ARGV[2]) ~= ARGV[1] then return 0 end
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('HDEL', KEYS[5], ARGV[2])
+if tonumber(redis.call('HGET', KEYS[4], ARGV[2]) or '0') >= tonumber(ARGV[4]) then
+    redis.call('HSET', KEYS[6], ARGV[2], ARGV[3])
+    redis.call('HDEL', KEYS[3], ARGV[2])
+    redis.call('HINCRBY', KEYS[7] .. string.match(ARGV[2], '^[^|]+'), 'dead', 1)
+else
+    redis.call('RPUSH', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+# KEYS: bucket; ARGV: rate, capacity, now, amount
+_BUCKET = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate, capacity, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = capacity
+if state[1] then
+    tokens = math.min(capacity, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+end
+local taken = math.min(tonumber(ARGV[4]), math.max(0, tokens))
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - taken), 'updated', ARGV[3])
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(taken)
+"""
+
+
+class RedisQueue(WorkQueue):
+    """
+    Redis 队列 (Lua 脚本保证租用 / 确认 / 归还的原子性)
+
+    键: {prefix}:ready (list), :leased (zset, 到期时间), :tasks / :attempts / :owners / :dead (hash),
+    :done (set, 已确认的任务, put 不会重新加入), :run:<scan_run_id> (hash: total / done / dead), :bucket:<name> (hash)。
+    令牌桶使用客户端时间, 各 worker 主机需要同步时钟 (NTP)。
+    """
+
+    def __init__(self, url: str, prefix: str = 'goldeater:queue', max_attempts: int = WORK_MAX_ATTEMPTS):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self._put = self.client.register_script(_PUT)
+        self._reap = self.client.register_script(_REAP)
+        self._lease = self.client.register_script(_LEASE)
+        self._heartbeat = self.client.register_script(_HEARTBEAT)
+        self._ack = self.client.register_script(_ACK)
+        self._release = self.client.register_script(_RELEASE)
+        self._bucket = self.client.register_script(_BUCKET)
+
+    def _key(self, name: str) -> str:
+        return f'{self.prefix}:{name}'
+
+    def put(self, tasks: Iterable[dict], chunk_size: int = 500) -> int:
+        # 已确认或 dead 的任务不重新加入 (tasks 中的 payload 在确认时已删除, 只靠 hsetnx 会重新创建)
+        added = 0
+        keys = [self._key(k) for k in ('ready', 'done', 'dead', 'tasks', 'run:')]
+        args = []
+        for task in tasks:
+            args += [task_id(task), json.dumps(task)]
+            if len(args) >= 2 * chunk_size:
+                added += self._put(keys=keys, args=args)
+                args = []
+        if args:
+            added += self._put(keys=keys, args=args)
+        return added
+
+    def _lease_keys(self) -> List[str]:
+        return [self._key(k) for k in ('ready', 'leased', 'tasks', 'attempts', 'owners', 'dead', 'run:')]
+
+    def lease(self, worker: str, n: int, lease_seconds: float = WORK_LEASE_SECONDS) -> List[Lease]:
+        now = time.time()
+        out = self._lease(
+            keys=self._lease_keys(),
+            args=[now, self.max_attempts, now + lease_seconds, n, worker]
+        )
+        return [(out[i], json.loads(out[i + 1])) for i in range(0, len(out), 2)]
+
+    def heartbeat(self, worker: str, task_ids: Iterable[str], lease_seconds: float = WORK_LEASE_SECONDS):
+        task_ids = list(task_ids)
+        if task_ids:
+            self._heartbeat(
+                keys=[self._key('leased'), self._key('owners')],
+                args=[worker, time.time() + lease_seconds, *task_ids]
+            )
+
+    def ack(self, task_ids: Iterable[str]):
+        task_ids = list(task_ids)
+        if task_ids:
+            self._ack(
+                keys=[self._key(k) for k in ('leased', 'tasks', 'attempts', 'owners', 'run:', 'done')],
+                args=task_ids
+            )
+
+    def release(self, worker: str, task_id: str, error: str):
+        self._release(
+            keys=[self._key(k) for k in ('ready', 'leased', 'tasks', 'attempts', 'owners', 'dead', 'run:')],
+            args=[worker, task_id, error, self.max_attempts]
+        )
+
+    def stats(self, scan_run_id: str) -> Dict[str, int]:
+        # 没有 worker 在租用时, 过期租约也要回收, 否则用尽尝试次数的任务永远不会计入 dead
+        self._reap(keys=self._lease_keys(), args=[time.time(), self.max_attempts])
+        counts = {k: int(v) for k, v in self.client.hgetall(self._key(f'run:{scan_run_id}')).items()}
+        total, done, dead = counts.get('total', 0), counts.get('done', 0), counts.get('dead', 0)
+        return {'total': total, 'done': done, 'dead': dead, 'remaining': total - done - dead}
+
+    def bucket_take(self, name: str, rate: float, capacity: float, amount: float) -> float:
+        return float(self._bucket(keys=[self._key(f'bucket:{name}')], args=[rate, capacity, time.time(), amount]))
+
+    def close(self):
+        self.client.close()
+
+
+def create_queue(url: Optional[str] = None) -> WorkQueue:
+    """按 WORK_QUEUE_URL 创建队列 ('sqlite:///path' 或 'redis://...')"""
+    url = url or WORK_QUEUE_URL
+    if url.startswith('sqlite:///'):
+        return SQLiteQueue(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisQueue(url)
+    raise ValueError(f"Unknown work queue URL: {url}")
@@ -0,0 +1,158 @@
+"""
+GoldEater 流式落库
+
+扫描完成的 (ScanJob, List[ScanResult]) 进入有界队列, 后台线程按条数或时间
+微批写入存储后端 (StorageSink)。队列满时 put 会阻塞扫描方 (背压), 内存占用与区域大小无关。
+"""
+import time
+import queue
+import asyncio
+import threading
+from typing import Callable, List, Optional
+
+from .models import ScanJob, ScanResult
+from .metrics import get_metrics
+from .storage import StorageSink
+from .config import STREAM_BATCH_SIZE, STREAM_FLUSH_INTERVAL, STREAM_MAX_PENDING
+
+_CLOSE = object()
+
+
+class StreamingWriter:
+    """后台微批写入器"""
+
+    def __init__(
+        self,
+        sink: StorageSink,
+        batch_size: int = STREAM_BATCH_SIZE,
+        flush_interval: float = STREAM_FLUSH_INTERVAL,
+        max_pending: int = STREAM_MAX_PENDING,
+        max_flush_retries: int = 3,
+        on_flushed: Optional[Callable[[List[ScanJob]], None]] = None
+    ):
+        """
+        Args:
+            sink: 存储后端 (PostgRESTSink / PostgresCopySink)
+            batch_size: 每批最多写入的行数 (jobs + results)
+            flush_interval: 距上次写入超过该秒数即写入
+            max_pending: 队列中最多等待写入的 job 数, 超过则阻塞扫描方
+            on_flushed: 每批成功落库后回调 (例如在任务日志中标记完成)
+        """
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_flush_retries = max_flush_retries
+        self.on_flushed = on_flushed
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name='streaming-writer', daemon=True)
+
+        # 统计 (同时记入运行指标)
+        self.metrics = get_metrics()
+        self.jobs_written = 0
+        self.results_written = 0
+        self.flushes = 0
+        self.failed_jobs = 0
+        self.callback_failures = 0
+        self.blocked_seconds = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, job: ScanJob, results: List[ScanResult]):
+        """提交一个扫描结果, 队列满时阻塞"""
+        try:
+            self._queue.put_nowait((job, results))
+        except queue.Full:
+            started = time.monotonic()
+            self._queue.put((job, results))
+            self._blocked(time.monotonic() - started)
+
+    async def put_async(self, job: ScanJob, results: List[ScanResult]):
+        """提交一个扫描结果 (异步), 队列满时挂起当前协程而不阻塞事件循环"""
+        try:
+            self._queue.put_nowait((job, results))
+        except queue.Full:
+            started = time.monotonic()
+            await asyncio.to_thread(self._queue.put, (job, results))
+            self._blocked(time.monotonic() - started)
+
+    def _blocked(self, seconds: float):
+        self.blocked_seconds += seconds
+        self.metrics.inc('goldeater_writer_blocked_seconds_total', seconds)
+
+    def close(self):
+        """写完队列中剩余数据, 停止后台线程并关闭存储后端"""
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+        self.sink.close()
+
+    def _run(self):
+        jobs: List[ScanJob] = []
+        results: List[ScanResult] = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _CLOSE:
+                self._flush(jobs, results)
+                return
+
+            if item is not None:
+                job, job_results = item
+                jobs.append(job)
+                results.extend(job_results)
+
+            if len(jobs) + len(results) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(jobs, results)
+                jobs, results = [], []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, jobs: List[ScanJob], results: List[ScanResult]):
+        if not jobs:
+            return
+        jobs_saved = False
+        started = time.perf_counter()
+        for attempt in range(self.max_flush_retries + 1):
+            try:
+                # 先写 job 再写 result (外键 job_id), 重试时不重复写入已成功的 job
+                if not jobs_saved:
+                    self.sink.write_jobs(jobs)
+                    jobs_saved = True
+                if results:
+                    self.sink.write_results(results)
+            except Exception as e:
+                if attempt < self.max_flush_retries:
+                    time.sleep(2 ** attempt)
+                    continue
+                self.failed_jobs += 0 if jobs_saved else len(jobs)
+                self.metrics.inc('goldeater_db_flush_failures_total')
+                print(f"✗ Flush failed ({len(jobs)} jobs, {len(results)} results): {e}")
+                return
+            break
+        self.metrics.observe('goldeater_db_flush_seconds', time.perf_counter() - started)
+        self.metrics.inc('goldeater_db_rows_total', len(jobs), table='scan_jobs')
+        self.metrics.inc('goldeater_db_rows_total', len(results), table='scan_results')
+        self.jobs_written += len(jobs)
+        self.results_written += len(results)
+        self.flushes += 1
+        if self.on_flushed:
+            # 回调异常 (任务日志 / 队列确认失败) 不能终止写入线程, 否则之后的 put 永久阻塞
+            try:
+                self.on_flushed(jobs)
+            except Exception as e:
+                self.callback_failures += 1
+                self.metrics.inc('goldeater_writer_callback_failures_total')
+                print(f"✗ on_flushed callback failed ({len(jobs)} jobs): {e}")
@@ -0,0 +1,51 @@
+"""
+测试共用的 fixture
+
+测试从 GoldEater 目录导入 shared (与 orchestrator.py 相同的导入方式), 不访问数据库和外部 API。
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from shared.storage import StorageSink, VISIBILITY_CONFLICT, HEATMAP_CONFLICT  # noqa: E402
+
+
+class MemorySink(StorageSink):
+    """按冲突键 upsert 到内存的存储后端 (与 mart 表的 on_conflict 语义相同)"""
+
+    def __init__(self):
+        self.jobs = []
+        self.results = []
+        self.coverage = []
+        self.visibility = {}
+        self.heatmap = {}
+        self.closed = False
+
+    def write_jobs(self, jobs):
+        self.jobs.extend(jobs)
+
+    def write_results(self, results):
+        self.results.extend(results)
+
+    def write_coverage(self, rows):
+        self.coverage.extend(rows)
+
+    def write_visibility(self, rows):
+        for row in rows:
+            self.visibility[tuple(row[k] for k in VISIBILITY_CONFLICT.split(','))] = row
+
+    def write_heatmap(self, rows, resolution=None):
+        table = self.heatmap.setdefault(resolution, {})
+        for row in rows:
+            table[tuple(row[k] for k in HEATMAP_CONFLICT.split(','))] = row
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_sink():
+    return MemorySink
@@ -0,0 +1,214 @@
+"""增量聚合与批量聚合 (--aggregate) 的一致性"""
+import random
+from datetime import date
+
+import pytest
+
+from shared.aggregate import CellStats, IncrementalAggregator, write_aggregates
+from shared.models import ScanJob, ScanResult
+from shared.storage import job_values, result_values
+
+SNAPSHOT = date(2026, 1, 28)
+CELLS = ['8a2a1072b59ffff', '8a2a1072b587fff', '8a2a1072b5b7fff']
+NAMES = ['Bills Surry Hills', "Bill's Surry Hills", 'Nomad', 'Firedoor', 'Porteño', 'Ester', 'Cafe Sydney']
+
+# 位置补全: raw_name → (business_id, 官方名称); Bills 的两种写法解析到同一个商户
+RESOLVED = {
+    'Bills Surry Hills': ('b-bills', 'bills Surry Hills'),
+    "Bill's Surry Hills": ('b-bills', 'bills Surry Hills'),
+    'Nomad': ('b-nomad', 'NOMAD'),
+    'Firedoor': ('b-firedoor', 'Firedoor'),
+    'Porteño': ('b-porteno', 'Porteño'),
+}
+
+
+def scan(seed: int = 7):
+    """合成一次扫描: 3 个格子 × 2 个场景 × 2 个平台 × 3 tap"""
+    rng = random.Random(seed)
+    records = []
+    for cell in CELLS:
+        for prompt_type in ('generic_best', 'date_night'):
+            for platform in ('chatgpt', 'claude'):
+                for tap in range(1, 4):
+                    job = ScanJob(
+                        h3_index=cell, grid_center_lat=-33.88, grid_center_lng=151.21, district='surry_hills',
+                        prompt_type=prompt_type, system_prompt_version='v1', platform=platform,
+                        model_version='m', scan_run_id='run-test', tap_number=tap
+                    )
+                    names = rng.sample(NAMES, rng.randint(0, 5))
+                    results = [
+                        ScanResult(job_id=job.id, raw_name=name, rank_position=rank)
+                        for rank, name in enumerate(names, 1)
+                    ]
+                    records.append((job, results))
+    return records
+
+
+def rows(records):
+    jobs = [job_values(job) for job, _ in records]
+    results = [result_values(r) for _, rs in records for r in rs]
+    return jobs, results
+
+
+def resolve(results):
+    """模拟 _resolve_locations 对结果行的回写"""
+    for row in results:
+        if row['raw_name'] in RESOLVED:
+            row['business_id'], row['normalized_name'] = RESOLVED[row['raw_name']]
+    return results
+
+
+def batch(jobs, results, make_sink):
+    sink = make_sink()
+    write_aggregates(CellStats.from_records(jobs, results), sink, SNAPSHOT)
+    return sink
+
+
+def test_live_final_snapshot_matches_batch(make_sink):
+    records = scan()
+    live = make_sink()
+    with IncrementalAggregator(live, snapshot_interval=3600, snapshot_date=SNAPSHOT) as aggregator:
+        for job, results in records:
+            aggregator.add(job, results)
+
+    expected = batch(*rows(records), make_sink)
+    assert live.closed
+    assert live.heatmap == expected.heatmap
+    assert live.visibility == expected.visibility
+
+
+def test_republish_after_resolution_matches_batch(make_sink):
+    records = scan()
+    live = make_sink()
+    with IncrementalAggregator(live, snapshot_interval=3600, snapshot_date=SNAPSHOT) as aggregator:
+        for job, results in records:
+            aggregator.add(job, results)
+    # 补全前没有 business_id, 增量快照不产生 visibility 行
+    assert live.visibility == {}
+
+    # 补全后按落库的行重新发布 (run_full_scan 调用 aggregate_run), 覆盖增量快照
+    jobs, results = rows(records)
+    write_aggregates(CellStats.from_records(jobs, resolve(results)), live, SNAPSHOT)
+
+    expected = batch(jobs, results, make_sink)
+    assert live.heatmap == expected.heatmap
+    assert live.visibility == expected.visibility
+    assert {key[0] for key in live.visibility} == {'b-bills', 'b-nomad', 'b-firedoor', 'b-porteno'}
+
+
+def test_duplicate_mentions_in_one_job_count_once():
+    job = ScanJob(
+        h3_index=CELLS[0], grid_center_lat=-33.88, grid_center_lng=151.21, district='surry_hills',
+        prompt_type='generic_best', system_prompt_version='v1', platform='chatgpt',
+        model_version='m', scan_run_id='run-test', tap_number=1
+    )
+    results = [
+        ScanResult(job_id=job.id, raw_name='Nomad', rank_position=3, business_id='b-nomad'),
+        ScanResult(job_id=job.id, raw_name='NOMAD Sydney', rank_position=1, business_id='b-nomad'),
+    ]
+    stats = CellStats.from_records([job], results)
+    (row,) = stats.visibility_rows(SNAPSHOT)
+    assert row['mention_frequency'] == pytest.approx(1.0)
+    assert row['avg_rank'] == pytest.approx(1.0)
+    assert row['visibility_score'] == pytest.approx(100.0)
+
+
+def test_expand_copies_source_cells_to_targets():
+    import h3
+
+    coarse = h3.cell_to_parent(CELLS[0], 8)
+    fine = CELLS[0]
+    targets = sorted(h3.cell_to_children(coarse, 10))[:4]
+    intermediate = h3.cell_to_parent(fine, 9)
+    jobs, results = [], []
+    for cell, names in ((coarse, ['Nomad', 'Ester']), (intermediate, ['Firedoor']), (fine, ['Porteño'])):
+        job = ScanJob(
+            h3_index=cell, grid_center_lat=-33.88, grid_center_lng=151.21, district='surry_hills',
+            prompt_type='generic_best', system_prompt_version='v1', platform='chatgpt',
+            model_version='m', scan_run_id='run-test', tap_number=1
+        )
+        jobs.append(job)
+        results += [ScanResult(job_id=job.id, raw_name=n, rank_position=r) for r, n in enumerate(names, 1)]
+
+    coverage = {target: coarse for target in targets if target != fine}
+    coverage[fine] = fine
+    stats = CellStats.from_records(jobs, results).expand(coverage)
+
+    heatmap = {row['h3_index']: row for row in stats.heatmap_rows(SNAPSHOT)}
+    assert set(heatmap) == set(coverage)
+    assert intermediate not in heatmap and coarse not in heatmap
+    for target, source in coverage.items():
+        row = heatmap[target]
+        assert (row['center_lat'], row['center_lng']) == pytest.approx(h3.cell_to_latlng(target))
+        assert row['business_count'] == (1 if source == fine else 2)
+    assert all(h3.get_resolution(cell) == 10 for cell in heatmap)
+
+
+def fine_scan(seed: int = 11):
+    """res-10 格子分布在多个 res-9 / res-8 父格子下, 每个格子的 tap 数不同 (1-4)"""
+    import h3
+
+    rng = random.Random(seed)
+    base = h3.latlng_to_cell(-33.8850, 151.2150, 7)
+    cells = rng.sample(sorted(h3.cell_to_children(base, 10)), 40)
+    records = []
+    for cell in cells:
+        lat, lng = h3.cell_to_latlng(cell)
+        for platform in ('chatgpt', 'claude'):
+            for tap in range(1, rng.randint(1, 4) + 1):
+                job = ScanJob(
+                    h3_index=cell, grid_center_lat=lat, grid_center_lng=lng, district='surry_hills',
+                    prompt_type='generic_best', system_prompt_version='v1', platform=platform,
+                    model_version='m', scan_run_id='run-test', tap_number=tap
+                )
+                names = rng.sample(NAMES, rng.randint(0, 4))
+                records.append((job, [
+                    ScanResult(job_id=job.id, raw_name=name, rank_position=rank)
+                    for rank, name in enumerate(names, 1)
+                ]))
+    return records
+
+
+def test_rollups_match_aggregating_at_the_parent_resolution(make_sink):
+    import h3
+    from shared.config import ROLLUP_RESOLUTIONS
+
+    jobs, results = rows(fine_scan())
+    sink = make_sink()
+    write_aggregates(CellStats.from_records(jobs, results), sink, SNAPSHOT)
+
+    for resolution in ROLLUP_RESOLUTIONS:
+        # 从头计算: 每个 job 直接记在父格子上, 统计量按 tap 加权, 不是子格子指标的平均
+        parents = []
+        for job in jobs:
+            parent = h3.cell_to_parent(job['h3_index'], resolution)
+            lat, lng = h3.cell_to_latlng(parent)
+            parents.append(dict(job, h3_index=parent, grid_center_lat=lat, grid_center_lng=lng))
+        expected = make_sink()
+        stats = CellStats.from_records(parents, results)
+        expected.write_heatmap(stats.heatmap_rows(SNAPSHOT) + stats.all_platforms().heatmap_rows(SNAPSHOT))
+        assert sink.heatmap[resolution] == expected.heatmap[None]
+        assert len({key[0] for key in sink.heatmap[resolution]}) < len({key[0] for key in sink.heatmap[None]})
+
+
+def test_rollup_weights_children_by_taps():
+    import h3
+
+    parent = h3.latlng_to_cell(-33.8850, 151.2150, 9)
+    once, thrice = sorted(h3.cell_to_children(parent, 10))[:2]
+    jobs, results = [], []
+    # once: 1 tap 提及 Nomad (频率 1.0); thrice: 3 tap 提及 Ester → 父格子中 Nomad 为 1/4, 不是 (1 + 0) / 2
+    for cell, taps, mentioned in ((once, 1, True), (thrice, 3, False)):
+        for tap in range(1, taps + 1):
+            job = ScanJob(
+                h3_index=cell, grid_center_lat=-33.88, grid_center_lng=151.21, district='surry_hills',
+                prompt_type='generic_best', system_prompt_version='v1', platform='chatgpt',
+                model_version='m', scan_run_id='run-test', tap_number=tap
+            )
+            jobs.append(job)
+            results.append(ScanResult(job_id=job.id, raw_name='Nomad' if mentioned else 'Ester', rank_position=1))
+
+    (row,) = CellStats.from_records(jobs, results).rollup(9).heatmap_rows(SNAPSHOT)
+    frequency = {b['name']: b['mention_frequency'] for b in row['top_businesses']}
+    assert row['h3_index'] == parent
+    assert frequency == {'Nomad': pytest.approx(0.25), 'Ester': pytest.approx(0.75)}
@@ -0,0 +1,167 @@
+"""批处理执行器: 对本地批处理服务替身提交、轮询、收取, 以及重启后重新挂接"""
+import json
+
+import pytest
+
+from shared import batch
+from shared.batch import BatchFailed, BatchRunner, batch_custom_id
+from shared.models import Completion
+
+
+class FakeBatchServer:
+    """内存中的批处理接口: 每个批次被轮询 polls 次后结束"""
+
+    def __init__(self, polls=1):
+        self.polls = polls
+        self.batches = {}
+        self.drop = set()       # 输出中缺失的 custom_id
+        self.errors = set()     # 输出为单条错误的 custom_id
+        self.failed = set()     # 整体失败的批次
+
+    def submit(self, path):
+        requests = [json.loads(line) for line in open(path, encoding='utf-8')]
+        batch_id = f'batch-{len(self.batches)}'
+        self.batches[batch_id] = {'requests': requests, 'polls': 0}
+        return batch_id
+
+    def status(self, batch_id):
+        entry = self.batches[batch_id]
+        entry['polls'] += 1
+        if batch_id in self.failed:
+            return 'failed'
+        return 'ended' if entry['polls'] >= self.polls else 'running'
+
+    def outputs(self, batch_id):
+        for request in self.batches[batch_id]['requests']:
+            custom_id = request['custom_id']
+            if custom_id in self.drop:
+                continue
+            if custom_id in self.errors:
+                yield custom_id, RuntimeError(f'request {custom_id} errored')
+            else:
+                yield custom_id, Completion(json.dumps({'recommendations': [{'name': request['prompt']}]}))
+
+
+class FakeCache(dict):
+    def put(self, key, value):
+        self[key] = value
+
+
+class FakeEater:
+    PLATFORM = 'chatgpt'
+    MAX_BATCH_REQUESTS = 2
+
+    def __init__(self, server):
+        self.server = server
+        self.cache = FakeCache()
+
+    def task_cache_key(self, task):
+        return batch_custom_id(task)
+
+    def batch_request(self, custom_id, task):
+        return {'custom_id': custom_id, 'prompt': f"{task['h3_index']}/{task['prompt_type']}"}
+
+    def submit_batch(self, path):
+        return self.server.submit(path)
+
+    def batch_status(self, batch_id):
+        return self.server.status(batch_id)
+
+    def batch_outputs(self, batch_id):
+        return self.server.outputs(batch_id)
+
+    def build_task_records(self, task, completion):
+        recommendations = json.loads(completion.content)['recommendations']
+        return task, [rec['name'] for rec in recommendations]
+
+
+@pytest.fixture(autouse=True)
+def batch_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, 'BATCH_DIR', tmp_path)
+    return tmp_path
+
+
+def tasks(n=5):
+    return [
+        {'h3_index': f'89be0e35a{i}bffff', 'prompt_type': 'generic_best', 'tap_number': 1, 'platform': 'chatgpt'}
+        for i in range(n)
+    ]
+
+
+def run(runner, tasks):
+    done, failed = {}, {}
+    runner.run(
+        tasks,
+        on_done=lambda task, job, results: done.__setitem__(batch_custom_id(task), results),
+        on_error=lambda task, e: failed.__setitem__(batch_custom_id(task), e)
+    )
+    return done, failed
+
+
+def test_submits_in_chunks_polls_and_collects():
+    server = FakeBatchServer(polls=3)
+    eater = FakeEater(server)
+    runner = BatchRunner(eater, 'run-1', poll_interval=0)
+    done, failed = run(runner, tasks(5))
+
+    assert failed == {}
+    assert done == {batch_custom_id(t): [f"{t['h3_index']}/generic_best"] for t in tasks(5)}
+    assert [len(b['requests']) for b in server.batches.values()] == [2, 2, 1]
+    assert all(b['polls'] == 3 for b in server.batches.values())
+    # 收取完毕后清空 manifest, 输出写入响应缓存
+    assert json.loads(runner.manifest_path.read_text()) == {}
+    assert set(eater.cache) == set(done)
+
+
+def test_cached_tasks_skip_the_batch_and_a_bad_entry_only_fails_its_task():
+    server = FakeBatchServer()
+    eater = FakeEater(server)
+    first, second, third = tasks(3)
+    eater.cache[batch_custom_id(first)] = Completion(json.dumps({'recommendations': [{'name': 'Nomad'}]}))
+    eater.cache[batch_custom_id(second)] = Completion('{"recommendations": [{"rank": 1}]}')
+    done, failed = run(BatchRunner(eater, 'run-1', poll_interval=0), [first, second, third])
+
+    assert done[batch_custom_id(first)] == ['Nomad']
+    assert isinstance(failed[batch_custom_id(second)], KeyError)
+    assert batch_custom_id(third) in done
+    assert [len(b['requests']) for b in server.batches.values()] == [1]
+
+
+def test_reattaches_submitted_batches_after_a_restart(monkeypatch, batch_dir):
+    server = FakeBatchServer(polls=10 ** 6)
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(seconds):
+        raise Interrupted
+
+    monkeypatch.setattr(batch.time, 'sleep', interrupt)
+    with pytest.raises(Interrupted):
+        run(BatchRunner(FakeEater(server), 'run-1', poll_interval=0), tasks(3))
+    assert len(server.batches) == 2
+    manifest = json.loads((batch_dir / 'run-1' / 'chatgpt' / 'manifest.json').read_text())
+    assert sorted(manifest) == ['batch-0', 'batch-1']
+
+    # 重启: 批次已结束, 不重复提交
+    server.polls = 1
+    monkeypatch.setattr(batch.time, 'sleep', lambda seconds: None)
+    done, failed = run(BatchRunner(FakeEater(server), 'run-1', poll_interval=0), tasks(3))
+    assert len(server.batches) == 2
+    assert sorted(done) == sorted(batch_custom_id(t) for t in tasks(3))
+    assert failed == {}
+
+
+def test_missing_and_errored_outputs_and_failed_batches():
+    server = FakeBatchServer()
+    first, second, third, fourth, fifth = tasks(5)
+    server.drop.add(batch_custom_id(first))
+    server.errors.add(batch_custom_id(second))
+    server.failed.add('batch-2')
+    done, failed = run(BatchRunner(FakeEater(server), 'run-1', poll_interval=0), tasks(5))
+
+    assert isinstance(failed.pop(batch_custom_id(first)), BatchFailed)
+    assert isinstance(failed.pop(batch_custom_id(second)), RuntimeError)
+    assert isinstance(failed.pop(batch_custom_id(fifth)), BatchFailed)
+    assert failed == {}
+    assert sorted(done) == sorted(batch_custom_id(t) for t in (third, fourth))
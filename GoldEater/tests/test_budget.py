@@ -0,0 +1,101 @@
+"""预算记账、合计预算的 water-filling 分配与按优先级派发"""
+from types import SimpleNamespace
+
+import h3
+import pytest
+
+from shared.budget import BudgetScheduler, CellPriority, ScanBudget, parse_budget, TOTAL
+
+PRICING = {'chatgpt': {'per_million_tokens': 10.0}, 'claude': {'per_million_tokens': 20.0}}
+CENTER = h3.latlng_to_cell(-33.885, 151.215, 10)
+
+
+def task(platform, cell=CENTER, prompt_type='generic_best', tap=1):
+    return {'platform': platform, 'h3_index': cell, 'prompt_type': prompt_type, 'tap_number': tap}
+
+
+def job(tokens, packed=False):
+    return SimpleNamespace(tokens_used=tokens, packed=packed)
+
+
+def test_parse_budget():
+    assert parse_budget(['25', 'claude=5']) == {TOTAL: 25.0, 'claude': 5.0}
+
+
+def test_reserve_settle_and_release():
+    budget = ScanBudget({'chatgpt': 1000}, unit='tokens')
+    budget.seed('chatgpt', 400)
+    a, b, c = task('chatgpt'), task('chatgpt'), task('chatgpt')
+    assert budget.reserve(a) and budget.reserve(b)
+    assert budget.reserved['chatgpt'] == pytest.approx(800)
+    # 第三个任务的预估会超出上限
+    assert not budget.reserve(c)
+    assert budget.refused['chatgpt'] == 1
+
+    budget.settle(a, job(100))
+    budget.release(b)
+    assert budget.spent['chatgpt'] == pytest.approx(100)
+    assert budget.reserved['chatgpt'] == pytest.approx(0)
+    # 实际用量进入均值, 预估随之下降, 腾出的预算可以接纳新任务
+    assert budget.tokens_per_job('chatgpt') == pytest.approx(250)
+    assert budget.reserve(c)
+
+
+def test_packed_reservation_is_settled_per_scenario():
+    budget = ScanBudget({'claude': 1.0}, pricing=PRICING)
+    packed = dict(task('claude'), prompt_types=['generic_best', 'date_night'])
+    packed.pop('prompt_type')
+    budget.seed('claude', 1000)
+    assert budget.reserve(packed)
+    assert budget.reserved['claude'] == pytest.approx(2 * 1000 * 20.0 / 1e6)
+    budget.settle(packed, job(800, packed=True))
+    budget.settle(packed, job(800, packed=True))
+    assert budget.reserved['claude'] == pytest.approx(0)
+    assert budget.spent['claude'] == pytest.approx(1600 * 20.0 / 1e6)
+    assert budget.calls['claude'] == pytest.approx(1.0)
+
+
+def test_allocate_water_fills_capped_platforms():
+    budget = ScanBudget({TOTAL: 10.0, 'claude': 2.0}, unit='tokens')
+    budget.allocate({'chatgpt': 20.0, 'claude': 20.0, 'gemini': 10.0})
+    # claude 受单平台上限约束, 剩下的 8 按待扫花费 2:1 分给 chatgpt / gemini
+    assert budget._shares['claude'] == pytest.approx(2.0)
+    assert budget._shares['chatgpt'] == pytest.approx(8.0 * 2 / 3)
+    assert budget._shares['gemini'] == pytest.approx(8.0 / 3)
+    assert sum(budget._shares.values()) == pytest.approx(10.0)
+
+
+def test_allocate_gives_everything_when_demand_fits():
+    budget = ScanBudget({TOTAL: 100.0}, unit='tokens')
+    budget.allocate({'chatgpt': 20.0, 'claude': 30.0})
+    assert budget._shares['chatgpt'] == pytest.approx(40.0)
+    assert budget._shares['claude'] == pytest.approx(60.0)
+
+
+def test_scheduler_dispatches_by_value_then_tap():
+    dense = CENTER
+    sparse = sorted(h3.grid_ring(CENTER, 5))[0]
+    priority = CellPriority(business_weight=1.0, volatility_weight=0.0)
+    priority.set_businesses([h3.cell_to_latlng(dense)] * 20, [10])
+    tasks = [task('chatgpt', cell, tap=tap) for cell in (sparse, dense) for tap in (1, 2)]
+
+    budget = ScanBudget({'chatgpt': 10_000}, unit='tokens')
+    budget.seed('chatgpt', 1000)
+    order = [(t['h3_index'], t['tap_number']) for t in BudgetScheduler(tasks, budget, priority)]
+    assert order[0] == (dense, 1)
+    assert order.index((dense, 2)) < order.index((sparse, 2))
+    assert len(order) == 4
+
+
+def test_scheduler_skips_exhausted_platform_only():
+    budget = ScanBudget({'chatgpt': 1500, 'claude': 10_000}, unit='tokens')
+    budget.seed('chatgpt', 1000)
+    budget.seed('claude', 1000)
+    tasks = [task(p, prompt_type=s) for p in ('chatgpt', 'claude') for s in ('generic_best', 'date_night', 'coffee_spot')]
+    scheduler = BudgetScheduler(tasks, budget, CellPriority())
+    dispatched = list(scheduler)
+    assert sum(t['platform'] == 'chatgpt' for t in dispatched) == 1
+    assert sum(t['platform'] == 'claude' for t in dispatched) == 3
+    assert scheduler.pending('chatgpt') == 2
+    # 同等优先级下各场景轮流派发
+    assert len({t['prompt_type'] for t in dispatched if t['platform'] == 'claude'}) == 3
@@ -0,0 +1,108 @@
+"""DatabaseClient 的查询构造 (内存中的 PostgREST 替身)"""
+from types import SimpleNamespace
+
+from shared.db import DatabaseClient
+
+
+class FakeQuery:
+    """
+    与 postgrest 的构建器一样就地修改并返回自身: 重复调用 range() 会累积参数,
+    同一个构建器被复用时请求中出现多组 offset / limit
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.filters = []
+        self.ranges = []
+        self.patch = None
+
+    def __getattr__(self, op):
+        def add(*args, **kwargs):
+            self.filters.append((op, args))
+            return self
+        return add
+
+    def update(self, patch):
+        self.patch = patch
+        return self
+
+    def range(self, start, end):
+        self.ranges.append((start, end))
+        return self
+
+    def execute(self):
+        self.table.requests.append(self)
+        if self.patch is not None:
+            return SimpleNamespace(data=[])
+        if not self.ranges:
+            return SimpleNamespace(data=self.table.rows)
+        if len(self.ranges) > 1:
+            raise AssertionError(f"accumulated ranges {self.ranges}")
+        start, end = self.ranges[0]
+        return SimpleNamespace(data=self.table.rows[start:end + 1])
+
+
+class FakeTable:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.requests = []
+
+
+class FakeClient:
+    def __init__(self, **tables):
+        self.tables = tables
+
+    def table(self, name):
+        return FakeQuery(self.tables[name])
+
+
+def client(**tables):
+    db = DatabaseClient(config=SimpleNamespace())
+    db._client = FakeClient(**tables)
+    return db
+
+
+def test_paged_builds_a_fresh_query_per_page():
+    jobs = FakeTable({'id': f'job-{i:04d}'} for i in range(2500))
+    db = client(**{'raw.scan_jobs': jobs})
+    rows = db.get_run_jobs('run-a', page_size=1000)
+    assert [row['id'] for row in rows] == [f'job-{i:04d}' for i in range(2500)]
+    assert [q.ranges for q in jobs.requests] == [[(0, 999)], [(1000, 1999)], [(2000, 2999)]]
+    assert all(('eq', ('scan_run_id', 'run-a')) in q.filters for q in jobs.requests)
+
+
+def test_get_business_filters_on_primary_key_or_place_id():
+    businesses = FakeTable([{'business_id': 'x'}])
+    db = client(**{'stg.businesses': businesses})
+    db.get_business('3f2b8c1e-0000-4000-8000-000000000001')
+    db.get_business('ChIJN1t_tDeuEmsRUsoyG83frY4')
+    columns = [next(args[0] for op, args in q.filters if op == 'eq') for q in businesses.requests]
+    assert columns == ['business_id', 'google_place_id']
+
+
+def test_location_update_is_scoped_to_run_jobs():
+    results = FakeTable()
+    db = client(**{'raw.scan_results': results})
+    job_ids = [f'job-{i}' for i in range(250)]
+    db.update_result_locations_by_name('Nomad', {'google_place_id': 'ChIJnomad'}, job_ids, chunk_size=100)
+    assert len(results.requests) == 3
+    scoped = [args[1] for q in results.requests for op, args in q.filters if op == 'in_']
+    assert [len(chunk) for chunk in scoped] == [100, 100, 50]
+    assert sum(scoped, []) == job_ids
+    assert all(('eq', ('raw_name', 'Nomad')) in q.filters for q in results.requests)
+
+
+def test_run_names_are_paged_back_from_the_run():
+    jobs = FakeTable([{'id': 'job-1', 'h3_index': 'cell-a'}, {'id': 'job-2', 'h3_index': 'cell-b'}])
+    results = FakeTable([
+        {'job_id': 'job-1', 'raw_name': 'Nomad'},
+        {'job_id': 'job-2', 'raw_name': 'Nomad'},
+        {'job_id': 'job-2', 'raw_name': 'Ester'},
+        {'job_id': 'job-2', 'raw_name': ''},
+        {'job_id': 'job-9', 'raw_name': 'Elsewhere'},
+    ])
+    db = client(**{'raw.scan_jobs': jobs, 'raw.scan_results': results})
+    raw_names, name_jobs = db.get_run_names('run-a')
+    assert raw_names == {'Nomad': {'cell-a', 'cell-b'}, 'Ester': {'cell-b'}}
+    assert name_jobs == {'Nomad': {'job-1', 'job-2'}, 'Ester': {'job-2'}}
+    assert ('eq', ('scan_jobs.scan_run_id', 'run-a')) in results.requests[0].filters
@@ -0,0 +1,61 @@
+"""分层网格: 排名记录与按邻居一致度细分"""
+from types import SimpleNamespace
+
+import h3
+import pytest
+
+from shared.hierarchy import HierarchicalGrid
+
+CENTER = h3.latlng_to_cell(-33.8850, 151.2150, 8)
+SAME = ['Nomad', 'Firedoor', 'Ester', 'Porteño']
+OTHER = ['Bar Totti', 'Ragazzi', 'Cho Cho San', 'Fratelli Paradiso']
+
+
+def targets():
+    return [child for cell in h3.grid_disk(CENTER, 1) for child in h3.cell_to_children(cell, 10)]
+
+
+def record(grid, cell, ranking, tap_number=1, platform='chatgpt', prompt_type='generic_best'):
+    job = SimpleNamespace(h3_index=cell, platform=platform, prompt_type=prompt_type, tap_number=tap_number)
+    results = [SimpleNamespace(raw_name=name, rank_position=i) for i, name in enumerate(ranking, 1)]
+    grid.record(job, results)
+
+
+def test_record_keeps_the_first_tap_per_cell_and_scenario():
+    grid = HierarchicalGrid(targets(), start_resolution=8)
+    record(grid, CENTER, OTHER, tap_number=2)
+    record(grid, CENTER, SAME, tap_number=1)
+    record(grid, CENTER, OTHER, tap_number=3)
+    record(grid, CENTER, OTHER, prompt_type='date_night')
+    assert grid._cell_rankings(CENTER) == {('chatgpt', 'generic_best'): SAME, ('chatgpt', 'date_night'): OTHER}
+    assert grid._cell_rankings(h3.grid_disk(CENTER, 1)[-1]) == {}
+
+
+def test_refines_only_cells_that_disagree_with_a_neighbour():
+    grid = HierarchicalGrid(targets(), start_resolution=8, density_threshold=10 ** 6, cell_budget=None)
+    level = [cell for cell, _, _ in grid.initial_cells()]
+    assert len(level) == 7
+
+    # 环上的一个格子与其余格子不一致: 它自己、中心和与它相邻的两个环上格子需要细分
+    odd = next(cell for cell in level if cell != CENTER)
+    for cell in level:
+        record(grid, cell, OTHER if cell == odd else SAME)
+    assert grid.neighbour_agreement(odd) < 0.5
+    expected = {odd, *(set(h3.grid_disk(odd, 1)) & set(level))}
+    assert len(expected) == 4
+
+    children = grid.refine(level)
+    assert {h3.cell_to_parent(cell, 8) for cell, _, _ in children} == expected
+    assert all(h3.get_resolution(cell) == 9 for cell, _, _ in children)
+    assert len(children) == 4 * 7
+
+
+def test_unscanned_neighbours_fall_back_to_the_nearest_scanned_ancestor():
+    grid = HierarchicalGrid(targets(), start_resolution=8, cell_budget=None)
+    grid.initial_cells()
+    child = h3.cell_to_center_child(CENTER, 9)
+    record(grid, CENTER, SAME)
+    record(grid, child, SAME)
+    grid.scanned.add(child)
+    # 子格子的邻居 (未扫描) 由中心格子代表, 排名一致
+    assert grid.neighbour_agreement(child) == pytest.approx(1.0)
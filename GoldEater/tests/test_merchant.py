@@ -0,0 +1,95 @@
+"""商户中心网格与 V_local"""
+import h3
+import numpy as np
+import pytest
+
+from shared.merchant import MerchantGrid, haversine_m, merchant_cell
+
+BUSINESS = {
+    'business_id': '3f2b8c1e-0000-4000-8000-000000000001',
+    'google_place_id': 'ChIJjoe',
+    'official_name': "Joe's Pizza",
+    'lat': -33.8850,
+    'lng': 151.2150,
+    'district': 'surry_hills',
+}
+
+
+def jobs_and_results(grid, mentioned, platform='chatgpt', prompt_type='generic_best'):
+    """每个采样点一个 job; mentioned 中的格子提及商户 (另一个结果是其他商户)"""
+    jobs, results = [], []
+    for cell in grid.cells.tolist():
+        job_id = f'{platform}-{prompt_type}-{cell}'
+        jobs.append({'id': job_id, 'h3_index': cell, 'platform': platform, 'prompt_type': prompt_type})
+        results.append({'job_id': job_id, 'raw_name': 'Elsewhere', 'normalized_name': None, 'google_place_id': None})
+        if cell in mentioned:
+            results.append({'job_id': job_id, 'raw_name': "JOE'S PIZZA", 'normalized_name': None, 'google_place_id': None})
+    return jobs, results
+
+
+def test_haversine_one_degree_of_latitude():
+    assert haversine_m(np.array([1.0]), np.array([0.0]), 0.0, 0.0)[0] == pytest.approx(111_195, rel=1e-3)
+
+
+def test_merchant_cell_prefers_h3_index():
+    fine = h3.latlng_to_cell(-33.9, 151.2, 10)
+    assert merchant_cell({'h3_index': fine, 'lat': 0.0, 'lng': 0.0}, 9) == h3.cell_to_parent(fine, 9)
+    with pytest.raises(ValueError, match=BUSINESS['business_id']):
+        merchant_cell({'business_id': BUSINESS['business_id']}, 9)
+
+
+def test_grid_layout_and_weights():
+    grid = MerchantGrid.around(BUSINESS, rings=2)
+    assert len(grid.cells) == 19
+    assert grid.center == h3.latlng_to_cell(BUSINESS['lat'], BUSINESS['lng'], 9)
+    assert grid.cells[0] == grid.center
+    assert grid.grid_distance.tolist() == sorted(grid.grid_distance.tolist())
+    assert np.bincount(grid.grid_distance).tolist() == [1, 6, 12]
+    assert grid.weight[grid.grid_distance == 0] == pytest.approx(1.0)
+    assert grid.weight[grid.grid_distance == 1] == pytest.approx(2 / 3)
+    assert grid.weight[grid.grid_distance == 2] == pytest.approx(1 / 3)
+    assert grid.distance_m[0] < grid.distance_m[1:].min()
+
+
+def test_v_local_matches_hand_calculation():
+    grid = MerchantGrid.around(BUSINESS, rings=1)
+    ring = [cell for cell, d in zip(grid.cells.tolist(), grid.grid_distance) if d == 1]
+    jobs, results = jobs_and_results(grid, {grid.center, ring[0]})
+
+    report = grid.visibility(jobs, results)
+    # 中心 1 × 1.0 + 一个相邻点 1 × 0.5, 共 7 个采样点
+    assert report['v_local'] == pytest.approx(round(1.5 / 7, 4))
+    assert report['points'] == 7
+    assert report['business_id'] == BUSINESS['business_id']
+    rates = {cell['h3_index']: cell['mention_rate'] for cell in report['cells']}
+    assert rates[grid.center] == 1.0 and rates[ring[0]] == 1.0 and rates[ring[1]] == 0.0
+
+
+def test_v_local_breakdowns_and_unscanned_points():
+    grid = MerchantGrid.around(BUSINESS, rings=1)
+    chatgpt = jobs_and_results(grid, set(grid.cells.tolist()), platform='chatgpt')
+    claude = jobs_and_results(grid, set(), platform='claude')
+    # 只扫描了中心的场景: 其余采样点不计入该场景的分母
+    center_only = jobs_and_results(grid, {grid.center}, prompt_type='date_night')
+    center_only = (center_only[0][:1], center_only[1][:2])
+    jobs = chatgpt[0] + claude[0] + center_only[0]
+    results = chatgpt[1] + claude[1] + center_only[1]
+
+    report = grid.visibility(jobs, results)
+    weights = 1.0 + 6 * 0.5
+    assert report['by_platform']['chatgpt'] == pytest.approx(round(weights / 7, 4))
+    assert report['by_platform']['claude'] == 0.0
+    assert report['by_prompt_type']['date_night'] == pytest.approx(1.0)
+
+
+def test_mentions_match_place_id_or_normalized_name():
+    grid = MerchantGrid.around(BUSINESS, rings=0)
+    jobs = [{'id': f'j{i}', 'h3_index': grid.center, 'platform': 'chatgpt', 'prompt_type': 'generic_best'}
+            for i in range(3)]
+    results = [
+        {'job_id': 'j0', 'raw_name': 'Pizza place', 'normalized_name': None, 'google_place_id': 'ChIJjoe'},
+        {'job_id': 'j1', 'raw_name': 'joes pizza', 'normalized_name': "Joe's Pizza", 'google_place_id': None},
+        {'job_id': 'j2', 'raw_name': 'Other', 'normalized_name': None, 'google_place_id': 'ChIJother'},
+        {'job_id': 'unknown', 'raw_name': "Joe's Pizza", 'normalized_name': None, 'google_place_id': None},
+    ]
+    assert grid.mentions(jobs, results).tolist() == [True, True, False]
@@ -0,0 +1,131 @@
+"""运行指标: 直方图分位数、Prometheus 文本格式、导出器与限流器的记录"""
+import json
+import socket
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+
+from shared.metrics import MetricsExporter, MetricsRegistry, ProgressReporter, _Histogram
+from shared.ratelimit import RateLimiter
+from shared import ratelimit
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    histogram = _Histogram((1.0, 2.0, 4.0))
+    for value in (0.5, 1.5, 1.5, 3.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.25) == pytest.approx(1.0)
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(1.0) == pytest.approx(4.0)
+    histogram.observe(100.0)
+    assert histogram.quantile(0.99) == 4.0
+    assert _Histogram((1.0,)).quantile(0.5) is None
+
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry()
+    registry.inc('goldeater_requests_total', platform='chatgpt', outcome='ok')
+    registry.inc('goldeater_requests_total', 2, platform='chatgpt', outcome='throttled')
+    registry.inc('goldeater_task_errors_total', platform='claude', error='Bad "quote"\n')
+    registry.observe('goldeater_request_seconds', 0.2, platform='chatgpt')
+    registry.observe('goldeater_request_seconds', 3.0, platform='chatgpt')
+    text = registry.prometheus()
+
+    assert '# TYPE goldeater_requests_total counter' in text
+    assert 'goldeater_requests_total{outcome="throttled",platform="chatgpt"} 2' in text
+    assert r'goldeater_task_errors_total{error="Bad \"quote\"\n",platform="claude"} 1' in text
+    assert '# TYPE goldeater_request_seconds histogram' in text
+    assert 'goldeater_request_seconds_bucket{platform="chatgpt",le="0.25"} 1' in text
+    assert 'goldeater_request_seconds_bucket{platform="chatgpt",le="5"} 2' in text
+    assert 'goldeater_request_seconds_bucket{platform="chatgpt",le="+Inf"} 2' in text
+    assert 'goldeater_request_seconds_count{platform="chatgpt"} 2' in text
+    # 未记录的指标不输出
+    assert 'goldeater_retries_total' not in text
+
+
+def test_registry_rejects_wrong_kind_and_unknown_names():
+    registry = MetricsRegistry()
+    with pytest.raises(ValueError):
+        registry.inc('goldeater_request_seconds')
+    with pytest.raises(ValueError):
+        registry.observe('goldeater_requests_total', 1.0)
+    with pytest.raises(KeyError):
+        registry.inc('goldeater_unknown_total')
+
+
+def test_summary_by_platform():
+    registry = MetricsRegistry()
+    registry.inc('goldeater_requests_total', 3, platform='claude', outcome='ok')
+    registry.inc('goldeater_requests_total', platform='claude', outcome='error')
+    registry.inc('goldeater_tokens_total', 4000, platform='claude')
+    progress = ProgressReporter(total=4, interval=3600, registry=registry)
+    for _ in range(3):
+        progress.task_done({'platform': 'claude'})
+    progress.task_failed({'platform': 'claude', 'h3_index': '8a2a1072b59ffff'}, TimeoutError('slow'))
+
+    claude = registry.summary()['platforms']['claude']
+    assert claude['requests'] == 4 and claude['request_errors'] == 1
+    assert claude['tokens'] == 4000
+    assert claude['tasks_done'] == 3 and claude['tasks_failed'] == 1
+    assert claude['task_error_rate'] == pytest.approx(0.25)
+    assert claude['errors'] == {'TimeoutError': 1}
+
+
+def test_exporter_writes_textfile_on_close(tmp_path):
+    registry = MetricsRegistry()
+    registry.inc('goldeater_retries_total', platform='gemini')
+    path = tmp_path / 'metrics.prom'
+    with MetricsExporter(registry, path=path, port=None, interval=3600):
+        pass
+    assert 'goldeater_retries_total{platform="gemini"} 1' in path.read_text()
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_exporter_http_endpoints():
+    registry = MetricsRegistry()
+    registry.inc('goldeater_tokens_total', 42, platform='perplexity')
+    port = _free_port()
+    with MetricsExporter(registry, path=None, port=port):
+        base = f'http://127.0.0.1:{port}'
+        with urllib.request.urlopen(f'{base}/metrics', timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert 'goldeater_tokens_total{platform="perplexity"} 42' in response.read().decode()
+        with urllib.request.urlopen(f'{base}/metrics.json', timeout=5) as response:
+            assert json.loads(response.read())['platforms']['perplexity']['tokens'] == 42
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f'{base}/other', timeout=5)
+        assert error.value.code == 404
+
+
+class Throttled(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={'retry-after-ms': '10'})
+
+
+def test_rate_limiter_records_outcomes_retries_and_tokens(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(ratelimit, 'get_metrics', lambda: registry)
+    limiter = RateLimiter('chatgpt', rpm=6000, max_retries=2)
+    replies = iter([Throttled(), SimpleNamespace(tokens_used=321)])
+
+    def call():
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    assert limiter.call(call).tokens_used == 321
+    counters = registry.snapshot()['counters']
+    outcomes = {row['outcome']: row['value'] for row in counters['goldeater_requests_total']}
+    assert outcomes == {'ok': 1, 'throttled': 1}
+    assert counters['goldeater_retries_total'] == [{'platform': 'chatgpt', 'value': 1}]
+    assert counters['goldeater_tokens_total'] == [{'platform': 'chatgpt', 'value': 321}]
+    assert limiter.stats()['throttled'] == 1
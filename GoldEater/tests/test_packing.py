@@ -0,0 +1,61 @@
+"""打包回复按场景拆分: 残缺或格式错误的回复不能让任务失败"""
+import json
+
+import pytest
+
+from shared.models import Completion
+from shared.packing import unpack_completion
+from shared.parsing import extract_recommendations, STRICT, FAILED
+
+PROMPT_TYPES = ['generic_best', 'date_night', 'cheap_eats']
+NOMAD = {'name': 'Nomad', 'rank': 1}
+ESTER = {'name': 'Ester', 'rank': 1}
+
+
+def unpack(body, tokens=100):
+    content = body if isinstance(body, str) else json.dumps(body)
+    parts, strategy = unpack_completion(Completion(content, tokens, ['https://example.com']), PROMPT_TYPES)
+    names = {
+        prompt_type: [rec['name'] for rec in extract_recommendations(part.content)[0]]
+        for prompt_type, part in parts.items()
+    }
+    return parts, strategy, names
+
+
+def test_splits_scenarios_and_shares_tokens():
+    parts, strategy, names = unpack({'scenarios': {
+        'generic_best': [NOMAD], 'date_night': [ESTER], 'cheap_eats': [NOMAD, ESTER]
+    }})
+    assert strategy == STRICT
+    assert names == {'generic_best': ['Nomad'], 'date_night': ['Ester'], 'cheap_eats': ['Nomad', 'Ester']}
+    # 余数归第一个场景, 合计不变
+    assert [p.tokens_used for p in parts.values()] == [34, 33, 33]
+    assert all(p.citations == ['https://example.com'] for p in parts.values())
+
+
+def test_top_level_scenarios_without_wrapper():
+    _, strategy, names = unpack({'generic_best': [NOMAD]})
+    assert strategy == STRICT
+    assert names == {'generic_best': ['Nomad'], 'date_night': [], 'cheap_eats': []}
+
+
+def test_partial_reply_leaves_missing_scenarios_empty():
+    _, strategy, names = unpack({'scenarios': {
+        'generic_best': {'recommendations': [NOMAD]}, 'date_night': 'none found'
+    }})
+    assert strategy == STRICT
+    assert names == {'generic_best': ['Nomad'], 'date_night': [], 'cheap_eats': []}
+
+
+@pytest.mark.parametrize('body', [
+    {'scenarios': [{'name': 'x'}]},
+    {'scenarios': 'sorry, I cannot help with that'},
+    [{'name': 'x'}],
+    'not json at all',
+])
+def test_malformed_reply_is_failed_not_an_error(body):
+    parts, strategy, names = unpack(body)
+    assert strategy == FAILED
+    assert list(parts) == PROMPT_TYPES
+    assert names == {prompt_type: [] for prompt_type in PROMPT_TYPES}
+    assert sum(p.tokens_used for p in parts.values()) == 100
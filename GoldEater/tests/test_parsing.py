@@ -0,0 +1,110 @@
+"""容错回复解析: strict → fenced → embedded → repaired"""
+import json
+
+import pytest
+
+from shared.parsing import (
+    extract_recommendations, parse_json_response, STRICT, FENCED, EMBEDDED, REPAIRED, FAILED
+)
+
+RECS = [
+    {'name': 'Nomad', 'rank': 1, 'reasoning': 'Wood-fired, "share" plates'},
+    {'name': 'Firedoor', 'rank': 2, 'reasoning': 'No gas, all fire'},
+    {'name': 'Ester', 'rank': 3, 'reasoning': 'Chippendale favourite'},
+]
+BODY = json.dumps({'recommendations': RECS}, indent=2)
+
+
+def names(content):
+    recs, strategy = extract_recommendations(content)
+    return [r['name'] for r in recs], strategy
+
+
+@pytest.mark.parametrize('content, strategy', [
+    (BODY, STRICT),
+    (f"Here you go:\n```json\n{BODY}\n```\nEnjoy!", FENCED),
+    (f"```\n{BODY}\n```", FENCED),
+    (f"Sure! Based on the area, {BODY} Let me know if you need more.", EMBEDDED),
+])
+def test_clean_and_wrapped_json(content, strategy):
+    assert names(content) == (['Nomad', 'Firedoor', 'Ester'], strategy)
+
+
+def test_trailing_commas_and_smart_quotes_are_repaired():
+    content = '{“recommendations”: [{"name": "Nomad", "rank": 1,}, {"name": "Ester", "rank": 2},],}'
+    assert names(content) == (['Nomad', 'Ester'], REPAIRED)
+
+
+def test_truncated_reply_drops_the_incomplete_element():
+    # 在第三个元素的键中截断: 回退到上一个完整元素
+    content = BODY[:BODY.index('"name": "Ester"') + 3]
+    assert names(content) == (['Nomad', 'Firedoor'], REPAIRED)
+
+
+def test_truncated_inside_last_string_keeps_the_element():
+    content = BODY[:BODY.index('Chippendale') + 6]
+    recs, strategy = extract_recommendations(content)
+    assert strategy == REPAIRED
+    assert [r['name'] for r in recs] == ['Nomad', 'Firedoor', 'Ester']
+    assert recs[-1]['reasoning'] == 'Chippe'
+
+
+def test_truncated_inside_fence():
+    content = "```json\n" + BODY[:BODY.rindex('"reasoning"')]
+    found, strategy = names(content)
+    assert strategy == REPAIRED
+    assert found[:2] == ['Nomad', 'Firedoor']
+
+
+def test_raw_control_characters_in_strings():
+    content = '{"recommendations": [{"name": "Nomad", "rank": 1, "reasoning": "line one\nline two"}]} trailing'
+    recs, strategy = extract_recommendations(content)
+    assert strategy == REPAIRED
+    assert recs[0]['reasoning'] == 'line one\nline two'
+
+
+def test_embedded_skips_objects_without_expected_keys():
+    content = 'Config {"model": "x"} then {"recommendations": [{"name": "Nomad", "rank": 1}]}'
+    assert names(content) == (['Nomad'], EMBEDDED)
+
+
+def test_top_level_list_and_non_dict_items():
+    assert names('[{"name": "Nomad", "rank": 1}, "junk", 3]') == (['Nomad'], STRICT)
+
+
+@pytest.mark.parametrize('content, strategy', [
+    (None, FAILED),
+    ('', FAILED),
+    ('I could not find any restaurants.', FAILED),
+    ('{"recommendations": [', FAILED),
+])
+def test_no_recommendations(content, strategy):
+    assert extract_recommendations(content) == ([], strategy)
+
+
+@pytest.mark.parametrize('content', [
+    '"Sorry, I cannot help with that."',
+    '42',
+    'null',
+    '[]',
+    '["Nomad", "Ester"]',
+    '{"restaurants": [{"name": "Nomad", "rank": 1}]}',
+])
+def test_valid_json_of_the_wrong_shape_is_not_strict(content):
+    assert extract_recommendations(content) == ([], FAILED)
+
+
+def test_valid_json_of_the_wrong_shape_falls_through_to_a_nested_object():
+    content = '{"data": {"recommendations": [{"name": "Nomad", "rank": 1}]}}'
+    assert names(content) == (['Nomad'], EMBEDDED)
+
+
+def test_empty_recommendations_are_a_clean_parse():
+    assert extract_recommendations('{"recommendations": []}') == ([], STRICT)
+
+
+def test_expect_keys_select_the_packed_object():
+    content = 'Answers: {"generic_best": [{"name": "Nomad", "rank": 1}]}'
+    value, strategy = parse_json_response(content, expect=('generic_best', 'date_night'))
+    assert strategy == EMBEDDED
+    assert value['generic_best'][0]['name'] == 'Nomad'
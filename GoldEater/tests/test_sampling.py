@@ -0,0 +1,71 @@
+"""rank-biased overlap 与自适应 tap 采样"""
+import pytest
+
+from shared.sampling import AdaptiveSampler, rank_biased_overlap, CONVERGED, FAILED, MAX_TAPS, RESUMED
+
+
+def test_rbo_identical_and_disjoint():
+    ranking = ['Nomad', 'Firedoor', 'Ester']
+    assert rank_biased_overlap(ranking, ranking) == pytest.approx(1.0)
+    assert rank_biased_overlap(ranking, ['Bills', 'Porteño', 'Ester Restaurant']) == pytest.approx(0.0)
+    assert rank_biased_overlap([], []) == 1.0
+    assert rank_biased_overlap(ranking, []) == 0.0
+
+
+def test_rbo_uses_normalized_names_and_drops_duplicates():
+    a = ['Nomad', 'Firedoor', 'Ester']
+    b = ['NOMAD', 'firedoor', 'Firedoor', 'Ester']
+    assert rank_biased_overlap(a, b) == pytest.approx(1.0)
+
+
+def test_rbo_is_symmetric_and_top_weighted():
+    base = ['a', 'b', 'c', 'd', 'e']
+    swap_top = ['b', 'a', 'c', 'd', 'e']
+    swap_tail = ['a', 'b', 'c', 'e', 'd']
+    assert rank_biased_overlap(base, swap_top) == pytest.approx(rank_biased_overlap(swap_top, base))
+    assert rank_biased_overlap(base, swap_top) < rank_biased_overlap(base, swap_tail) < 1.0
+
+
+def test_rbo_uneven_lengths_match_reference_value():
+    # 外推 RBO (Webber et al. 2010, 式 32), p = 0.9: s = 2, l = 3, X_1 = 1, X_2 = 2, X_3 = 2
+    p = 0.9
+    expected = (1 - p) / p * (1 / 1 * p + 2 / 2 * p ** 2 + 2 / 3 * p ** 3 + 2 * (3 - 2) / (2 * 3) * p ** 3) \
+        + ((2 - 2) / 3 + 2 / 2) * p ** 3
+    assert rank_biased_overlap(['a', 'b'], ['a', 'b', 'c'], p) == pytest.approx(expected)
+
+
+def test_sampler_decisions():
+    sampler = AdaptiveSampler(min_taps=2, max_taps=4, threshold=0.8)
+    same, other = ['a', 'b', 'c'], ['x', 'y', 'z']
+    assert sampler.decide([same], last_tap=1) is None
+    assert sampler.decide([same, same], last_tap=2) == CONVERGED
+    assert sampler.decide([same, other], last_tap=2) is None
+    assert sampler.decide([same, other, same, other], last_tap=4) == MAX_TAPS
+    # 续跑: 前面的 tap 不在内存中, 无法比较
+    assert sampler.decide([other], last_tap=3) == RESUMED
+
+
+def test_sampler_report_counts_savings():
+    sampler = AdaptiveSampler(min_taps=2, max_taps=5)
+    sampler.record(2, CONVERGED)
+    sampler.record(5, MAX_TAPS)
+    report = sampler.report(fixed_taps=3)
+    assert report['calls'] == 7
+    assert report['saved_vs_ceiling'] == 3
+    assert report['extra_vs_tap_count'] == 1
+    assert report['stop_reasons'] == {CONVERGED: 1, MAX_TAPS: 1}
+
+
+def test_failed_series_still_count_their_calls():
+    sampler = AdaptiveSampler(min_taps=2, max_taps=5)
+    sampler.record(2, CONVERGED)
+    sampler.record_failed(3)
+    report = sampler.report(fixed_taps=3)
+    assert report['series'] == 2
+    assert report['calls'] == 5
+    assert report['stop_reasons'] == {CONVERGED: 1, FAILED: 1}
+
+
+def test_sampler_rejects_bad_bounds():
+    with pytest.raises(ValueError):
+        AdaptiveSampler(min_taps=1, max_taps=3)
@@ -0,0 +1,136 @@
+"""租约工作队列 (SQLite / Redis) 与共享令牌桶"""
+import time
+
+import pytest
+
+from shared import workqueue
+from shared.workqueue import SQLiteQueue, RedisQueue, SharedTokenBucket, create_queue, task_id
+
+
+def tasks(run='run-a', n=3):
+    return [
+        {'scan_run_id': run, 'h3_index': f'cell{i}', 'platform': 'chatgpt', 'prompt_type': 'generic_best', 'tap_number': 1}
+        for i in range(n)
+    ]
+
+
+def fake_redis_queue(max_attempts):
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    queue = RedisQueue.__new__(RedisQueue)
+    queue.client = fakeredis.FakeRedis(decode_responses=True)
+    queue.prefix = 'test:queue'
+    queue.max_attempts = max_attempts
+    for attr, script in (
+        ('_put', workqueue._PUT), ('_reap', workqueue._REAP), ('_lease', workqueue._LEASE),
+        ('_heartbeat', workqueue._HEARTBEAT), ('_ack', workqueue._ACK), ('_release', workqueue._RELEASE),
+        ('_bucket', workqueue._BUCKET)
+    ):
+        setattr(queue, attr, queue.client.register_script(script))
+    return queue
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def make_queue(request, tmp_path):
+    def make(max_attempts=2):
+        if request.param == 'sqlite':
+            return SQLiteQueue(tmp_path / 'queue.db', max_attempts=max_attempts)
+        return fake_redis_queue(max_attempts)
+    return make
+
+
+def test_put_deduplicates_and_lease_is_exclusive(make_queue):
+    queue = make_queue()
+    assert queue.put(tasks()) == 3
+    assert queue.put(tasks()) == 0
+    first = queue.lease('w1', 2)
+    second = queue.lease('w2', 5)
+    assert len(first) == 2 and len(second) == 1
+    assert {tid for tid, _ in first}.isdisjoint(tid for tid, _ in second)
+    tid, task = first[0]
+    assert tid == task_id(task)
+    assert queue.stats('run-a') == {'total': 3, 'done': 0, 'dead': 0, 'remaining': 3}
+
+
+def test_ack_is_final_and_not_requeued(make_queue):
+    queue = make_queue()
+    queue.put(tasks())
+    leased = queue.lease('w1', 3)
+    queue.ack([tid for tid, _ in leased])
+    queue.ack([leased[0][0]])
+    assert queue.stats('run-a') == {'total': 3, 'done': 3, 'dead': 0, 'remaining': 0}
+    # 重新提交同一次扫描不会复活已完成的任务
+    assert queue.put(tasks()) == 0
+    assert queue.lease('w1', 3) == []
+
+
+def test_expired_lease_returns_to_queue(make_queue):
+    queue = make_queue(max_attempts=3)
+    queue.put(tasks(n=1))
+    (tid, _), = queue.lease('w1', 1, lease_seconds=0.01)
+    time.sleep(0.05)
+    (again, _), = queue.lease('w2', 1)
+    assert again == tid
+    # 原 worker 的租约已转移, 它的 release 不生效
+    queue.release('w1', tid, 'stale')
+    assert queue.lease('w3', 1) == []
+
+
+def test_heartbeat_keeps_lease(make_queue):
+    queue = make_queue()
+    queue.put(tasks(n=1))
+    (tid, _), = queue.lease('w1', 1, lease_seconds=0.2)
+    time.sleep(0.1)
+    queue.heartbeat('w1', [tid], lease_seconds=5)
+    time.sleep(0.15)
+    assert queue.lease('w2', 1) == []
+
+
+def test_release_retries_then_dead(make_queue):
+    queue = make_queue(max_attempts=2)
+    queue.put(tasks(n=1))
+    for _ in range(2):
+        (tid, _), = queue.lease('w1', 1)
+        queue.release('w1', tid, 'RuntimeError: boom')
+    assert queue.lease('w1', 1) == []
+    assert queue.stats('run-a') == {'total': 1, 'done': 0, 'dead': 1, 'remaining': 0}
+
+
+def test_stats_reaps_expired_leases_without_workers(make_queue):
+    queue = make_queue(max_attempts=1)
+    queue.put(tasks(n=2))
+    queue.lease('w1', 2, lease_seconds=0.01)
+    time.sleep(0.05)
+    # 没有 worker 再来租用, stats 自己回收过期租约, 等待队列清空的调度方不会一直挂起
+    assert queue.stats('run-a') == {'total': 2, 'done': 0, 'dead': 2, 'remaining': 0}
+
+
+def test_bucket_take_grants_at_most_available(make_queue):
+    queue = make_queue()
+    assert queue.bucket_take('chatgpt:rpm', 1.0, 10.0, 4) == pytest.approx(4)
+    assert queue.bucket_take('chatgpt:rpm', 1.0, 10.0, 20) == pytest.approx(6, abs=0.1)
+    assert queue.bucket_take('chatgpt:rpm', 1.0, 10.0, 5) < 0.5
+
+
+def test_shared_bucket_batches_queue_round_trips(tmp_path):
+    queue = SQLiteQueue(tmp_path / 'queue.db')
+    calls = []
+    take = queue.bucket_take
+    queue.bucket_take = lambda *args: calls.append(args) or take(*args)
+
+    bucket = SharedTokenBucket(queue, 'chatgpt:rpm', per_minute=600)
+    now = time.monotonic()
+    for _ in range(int(bucket.batch)):
+        assert bucket.wait_time(1, now) == 0.0
+        bucket.consume(1)
+    # 一批额度取一次队列
+    assert len(calls) == 1
+    # 实际用量的修正只记在本地
+    bucket.consume(-2)
+    assert bucket.wait_time(1, now) == 0.0 and len(calls) == 1
+
+
+def test_create_queue_urls(tmp_path):
+    assert isinstance(create_queue(f'sqlite:///{tmp_path}/q.db'), SQLiteQueue)
+    with pytest.raises(ValueError):
+        create_queue('amqp://localhost')
@@ -0,0 +1,30 @@
+"""流式写入器: 回调失败不终止写入线程"""
+from shared import ScanJob, StreamingWriter
+
+
+def job(h3_index, tap_number):
+    return ScanJob(
+        h3_index=h3_index, grid_center_lat=-33.885, grid_center_lng=151.215, district='surry_hills',
+        prompt_type='generic_best', system_prompt_version='v1.0.0', platform='chatgpt',
+        model_version='gpt-4o', scan_run_id='run-1', tap_number=tap_number
+    )
+
+
+def test_failing_callback_does_not_stop_the_writer(make_sink):
+    sink = make_sink()
+    calls = []
+
+    def on_flushed(jobs):
+        calls.append(len(jobs))
+        raise RuntimeError('journal is locked')
+
+    # batch_size=1: 每个 job 单独落库, 第一次回调失败后仍要写入之后的批次
+    with StreamingWriter(sink, batch_size=1, max_pending=1, on_flushed=on_flushed) as writer:
+        for tap in range(5):
+            writer.put(job('89be0e35a2bffff', tap), [])
+
+    assert len(sink.jobs) == 5
+    assert sum(calls) == 5
+    assert writer.callback_failures == len(calls)
+    assert sink.closed
+
@@ -39,9 +39,15 @@ CREATE TABLE raw.scan_jobs (
     -- 扫描环境 (Scan Environment)
     platform                VARCHAR(50) NOT NULL,
     model_version           VARCHAR(100) NOT NULL,
-    scan_run_id             UUID NOT NULL,
+    scan_run_id             VARCHAR(64) NOT NULL,  -- run-YYYYMMDD-HHMMSS-xxxxxxxx
     tap_number              INTEGER NOT NULL DEFAULT 1,
     
+    -- 自适应采样 (Adaptive Sampling)
+    tap_agreement           DECIMAL(5, 4),          -- 与上一次 tap 的 RBO
+    stop_reason             VARCHAR(20),            -- 序列最后一个 tap: converged / max_taps / resumed
+    packed                  BOOLEAN NOT NULL DEFAULT FALSE,  -- 来自多场景打包请求
+    parse_strategy          VARCHAR(20),            -- 回复解析策略: strict / fenced / embedded / repaired / failed
+    
     -- 成本追踪
     tokens_used             INTEGER,
     
@@ -51,7 +57,9 @@ CREATE TABLE raw.scan_jobs (
     
     CONSTRAINT chk_platform CHECK (platform IN ('chatgpt', 'perplexity', 'gemini', 'claude')),
     CONSTRAINT chk_prompt_type CHECK (prompt_type IN ('generic_best', 'date_night', 'business_lunch', 'avoid_tourist', 'coffee_spot')),
-    CONSTRAINT chk_tap_number CHECK (tap_number IN (1, 2)),
+    CONSTRAINT chk_tap_number CHECK (tap_number BETWEEN 1 AND 10),
+    CONSTRAINT chk_stop_reason CHECK (stop_reason IS NULL OR stop_reason IN ('converged', 'max_taps', 'resumed')),
+    CONSTRAINT chk_parse_strategy CHECK (parse_strategy IS NULL OR parse_strategy IN ('strict', 'fenced', 'embedded', 'repaired', 'failed')),
     CONSTRAINT chk_lat CHECK (grid_center_lat BETWEEN -90 AND 90),
     CONSTRAINT chk_lng CHECK (grid_center_lng BETWEEN -180 AND 180)
 );
@@ -106,6 +114,20 @@ CREATE INDEX idx_scan_results_business ON raw.scan_results(business_id);
 CREATE INDEX idx_scan_results_name ON raw.scan_results(raw_name);
 CREATE INDEX idx_scan_results_place_id ON raw.scan_results(google_place_id);
 
+-- 表 3: scan_coverage (分层扫描覆盖表)
+-- 分层扫描时每个 res-10 格子的结果来自哪个已扫描的祖先格子
+CREATE TABLE raw.scan_coverage (
+    scan_run_id             VARCHAR(64) NOT NULL,
+    h3_index                VARCHAR(20) NOT NULL,   -- 目标分辨率格子
+    source_h3_index         VARCHAR(20) NOT NULL,   -- 实际扫描的格子 (自身或祖先)
+    source_resolution       INTEGER NOT NULL,
+    created_at              TIMESTAMPTZ DEFAULT NOW(),
+    
+    PRIMARY KEY (scan_run_id, h3_index)
+);
+
+CREATE INDEX idx_scan_coverage_source ON raw.scan_coverage(scan_run_id, source_h3_index);
+
 -- ============================================================
 -- LAYER 2: STG (Staging 清洗层)
 -- dbt 转换生成
@@ -203,13 +225,15 @@ CREATE TABLE mart.visibility_snapshots (
     visibility_score        INTEGER NOT NULL,
     avg_rank                DECIMAL(4, 2),
     mention_frequency       DECIMAL(3, 2),
+    share_of_voice          DECIMAL(5, 4),            -- 组内提及份额
     
     -- 时间
     snapshot_date           DATE NOT NULL,
     
     UNIQUE(business_id, h3_index, prompt_type, platform, snapshot_date),
     CONSTRAINT chk_visibility CHECK (visibility_score BETWEEN 0 AND 100),
-    CONSTRAINT chk_frequency CHECK (mention_frequency BETWEEN 0 AND 1)
+    CONSTRAINT chk_frequency CHECK (mention_frequency BETWEEN 0 AND 1),
+    CONSTRAINT chk_share_of_voice CHECK (share_of_voice BETWEEN 0 AND 1)
 );
 
 CREATE INDEX idx_visibility_h3_date ON mart.visibility_snapshots(h3_index, snapshot_date DESC);
@@ -228,6 +252,7 @@ CREATE TABLE mart.heatmap_cells (
     
     -- 场景
     prompt_type             VARCHAR(50) NOT NULL,
+    platform                VARCHAR(50) NOT NULL DEFAULT 'all',  -- 单个平台或跨平台汇总 'all'
     
     -- 聚合分数
     heat_score              INTEGER NOT NULL,
@@ -243,7 +268,7 @@ CREATE TABLE mart.heatmap_cells (
     snapshot_date           DATE NOT NULL,
     updated_at              TIMESTAMPTZ DEFAULT NOW(),
     
-    UNIQUE(h3_index, prompt_type, snapshot_date),
+    UNIQUE(h3_index, prompt_type, platform, snapshot_date),
     CONSTRAINT chk_heat_score CHECK (heat_score BETWEEN 0 AND 100)
 );
 
@@ -251,6 +276,12 @@ CREATE INDEX idx_heatmap_h3 ON mart.heatmap_cells(h3_index);
 CREATE INDEX idx_heatmap_district ON mart.heatmap_cells(district, prompt_type, snapshot_date DESC);
 CREATE INDEX idx_heatmap_geo ON mart.heatmap_cells USING GIST (ST_SetSRID(ST_MakePoint(center_lng, center_lat), 4326));
 
+-- 热力图金字塔: res-10 统计量按 cell_to_parent 汇总后重新计算 (不是平均值的平均)
+-- 缩放越小读取越粗的一层: zoom 12-14 → r8, zoom 0-11 → r7
+CREATE TABLE mart.heatmap_cells_r9 (LIKE mart.heatmap_cells INCLUDING ALL);
+CREATE TABLE mart.heatmap_cells_r8 (LIKE mart.heatmap_cells INCLUDING ALL);
+CREATE TABLE mart.heatmap_cells_r7 (LIKE mart.heatmap_cells INCLUDING ALL);
+
 -- 区域排行榜
 CREATE TABLE mart.district_leaderboard (
     id                      UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -388,6 +419,9 @@ CREATE TABLE monitoring.data_quality_metrics (
 
 ALTER TABLE mart.user_monitors ENABLE ROW LEVEL SECURITY;
 ALTER TABLE mart.heatmap_cells ENABLE ROW LEVEL SECURITY;
+ALTER TABLE mart.heatmap_cells_r9 ENABLE ROW LEVEL SECURITY;
+ALTER TABLE mart.heatmap_cells_r8 ENABLE ROW LEVEL SECURITY;
+ALTER TABLE mart.heatmap_cells_r7 ENABLE ROW LEVEL SECURITY;
 ALTER TABLE mart.district_leaderboard ENABLE ROW LEVEL SECURITY;
 ALTER TABLE mart.ai_index_status ENABLE ROW LEVEL SECURITY;
 ALTER TABLE mart.competitor_analysis ENABLE ROW LEVEL SECURITY;
@@ -399,6 +433,15 @@ CREATE POLICY "Users can manage own monitors" ON mart.user_monitors
 CREATE POLICY "Authenticated can view heatmap" ON mart.heatmap_cells
     FOR SELECT USING (auth.role() = 'authenticated');
 
+CREATE POLICY "Authenticated can view heatmap r9" ON mart.heatmap_cells_r9
+    FOR SELECT USING (auth.role() = 'authenticated');
+
+CREATE POLICY "Authenticated can view heatmap r8" ON mart.heatmap_cells_r8
+    FOR SELECT USING (auth.role() = 'authenticated');
+
+CREATE POLICY "Authenticated can view heatmap r7" ON mart.heatmap_cells_r7
+    FOR SELECT USING (auth.role() = 'authenticated');
+
 CREATE POLICY "Public can view leaderboard" ON mart.district_leaderboard
     FOR SELECT USING (true);
 